@@ -13,14 +13,24 @@ Usage:
     OR
     python auto_tag.py --text "Full case text here"
 
-Returns JSON with keys: categories, tags
+To tag a whole corpus (JSON file, directory or the legal_resources table) use bulk_tag.py.
+
+Results are cached by content hash in result_cache.sqlite3 (see result_cache.py),
+keyed by KEYWORDS_VERSION, so re-uploads of the same case are answered from the
+cache; pass --no-cache to always classify.
+
+Returns JSON with keys: categories, tags, matches (count and positions per tag),
+category_counts
 """
 
 import argparse
+import hashlib
 import json
 import sys
 import re
 
+from result_cache import ResultCache, DEFAULT_CACHE_PATH, cache_key, config_digest
+
 # Example legal categories and associated keywords
 CATEGORY_KEYWORDS = {
     'Contract Law': [r'contract', r'agreement', r'breach', r'consideration', r'offer', r'acceptance'],
@@ -37,30 +47,134 @@ CATEGORY_KEYWORDS = {
 # Flatten all keywords for tag extraction
 ALL_KEYWORDS = set(kw for kws in CATEGORY_KEYWORDS.values() for kw in kws)
 
-def classify(text):
+# Changes whenever CATEGORY_KEYWORDS does, so cached results of older keywords are not reused
+KEYWORDS_VERSION = config_digest(CATEGORY_KEYWORDS)
+
+def _trie_pattern(words):
+    """Regex source matching any of words, factored into a character trie."""
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        # A word can end here: the longer continuation is tried first
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+class KeywordTagger:
+    """
+    All keywords compiled into one regular expression, so a document is
+    scanned once however many keywords there are. Build it once and reuse it
+    for every document.
+
+    Keywords are literal words or phrases, matched case-insensitively on word
+    boundaries. They are factored into a character trie, so the regex engine
+    follows one branch per position instead of trying every keyword, and the
+    match sits in a lookahead so one keyword does not hide another starting
+    inside it ('process' in 'due process'). A shorter keyword that is a word
+    prefix of a longer match ('child' in 'child support') is credited from it.
+    """
+
+    def __init__(self, category_keywords=CATEGORY_KEYWORDS):
+        """
+        Args:
+            category_keywords (dict): Category -> list of keywords
+        """
+        self.category_keywords = category_keywords
+        self.categories_of = {}
+        for category, keywords in category_keywords.items():
+            for kw in keywords:
+                self.categories_of.setdefault(kw.lower(), []).append(category)
+        self.keywords = sorted(self.categories_of)
+        self.pattern = re.compile(rf'\b(?=({_trie_pattern(self.keywords)})\b)', re.IGNORECASE)
+        self.prefixes = {
+            kw: [other for other in self.keywords
+                 if len(other) < len(kw) and kw.startswith(other) and not kw[len(other)].isalnum()]
+            for kw in self.keywords
+        }
+
+    def scan(self, text):
+        """
+        Find every keyword occurrence in one pass.
+        Returns:
+            dict: Keyword -> list of (start, end) character offsets into text
+        """
+        found = {}
+        for match in self.pattern.finditer(text):
+            start, end = match.span(1)
+            kw = match.group(1).lower()
+            found.setdefault(kw, []).append((start, end))
+            for other in self.prefixes.get(kw, ()):
+                found.setdefault(other, []).append((start, start + len(other)))
+        return found
+
+    def tag(self, text, positions=True):
+        """
+        Classify text into categories and extract tags.
+        Args:
+            text (str): Case text
+            positions (bool): Include the offsets of every match
+        Returns:
+            dict: categories (in CATEGORY_KEYWORDS order), sorted tags, and per tag
+                  its match count (and positions); per category its total matches
+        """
+        found = self.scan(text)
+        category_counts = {}
+        for kw, spans in found.items():
+            for category in self.categories_of.get(kw, ()):
+                category_counts[category] = category_counts.get(category, 0) + len(spans)
+        categories = [c for c in self.category_keywords if c in category_counts] or ['Uncategorized']
+        matches = {}
+        for kw in sorted(found):
+            matches[kw] = {'count': len(found[kw])}
+            if positions:
+                matches[kw]['positions'] = [list(span) for span in found[kw]]
+        return {
+            'categories': categories,
+            'tags': sorted(found),
+            'matches': matches,
+            'category_counts': {c: category_counts[c] for c in categories if c in category_counts},
+        }
+
+# Compiled once per process and shared by every classify() call
+TAGGER = KeywordTagger(CATEGORY_KEYWORDS)
+
+def classify(text, positions=True):
     """Classify text into legal categories and extract tags."""
-    text_lower = text.lower()
-    categories = []
-    tags = set()
-    for category, keywords in CATEGORY_KEYWORDS.items():
-        for kw in keywords:
-            if re.search(rf'\\b{kw}\\b', text_lower):
-                categories.append(category)
-                tags.add(kw)
-                break  # Only need one keyword to match category
-    # Extract all tags
-    for kw in ALL_KEYWORDS:
-        if re.search(rf'\\b{kw}\\b', text_lower):
-            tags.add(kw)
-    if not categories:
-        categories = ['Uncategorized']
-    return {'categories': categories, 'tags': sorted(tags)}
+    return TAGGER.tag(text, positions)
+
+def cached_classify(text, cache):
+    """
+    classify() through the result cache.
+    Returns:
+        tuple: (result, True if it came from the cache)
+    """
+    key = cache_key(f"tags:{KEYWORDS_VERSION}", text)
+    # Match positions are offsets into the exact text, so a hit only counts
+    # for the same text, not merely the same normalised text
+    text_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    entry = cache.get(key)
+    if entry is not None and entry.get('text_hash') == text_hash:
+        return entry['result'], True
+    result = classify(text)
+    cache.put(key, {'text_hash': text_hash, 'result': result}, namespace=f"tags:{KEYWORDS_VERSION}")
+    return result, False
 
 def main():
     parser = argparse.ArgumentParser(description='Classify legal text and generate tags.')
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument('--input_file', type=str, help='Path to file containing legal case text')
     group.add_argument('--text', type=str, help='Raw legal case text as input')
+    parser.add_argument('--cache', type=str, default=str(DEFAULT_CACHE_PATH), help='Result cache file')
+    parser.add_argument('--no-cache', action='store_true', help='Classify without reading or writing the cache')
     args = parser.parse_args()
 
     if args.input_file:
@@ -73,8 +187,11 @@ def main():
         print(json.dumps({'status': 'error', 'message': 'Input text too short or missing.'}))
         sys.exit(1)
 
-    result = classify(text)
-    print(json.dumps({'status': 'ok', **result}, ensure_ascii=False, indent=2))
+    if args.no_cache:
+        result, cached = classify(text), False
+    else:
+        result, cached = cached_classify(text, ResultCache(args.cache))
+    print(json.dumps({'status': 'ok', **result, 'cached': cached}, ensure_ascii=False, indent=2))
 
 if __name__ == '__main__':
     main()
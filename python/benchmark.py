@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+LexiAid Benchmark
+Reproducible timings for search, tagging and briefing on synthetic corpora.
+
+Corpora of any size (1k to 1M documents) are generated from the
+get_sample_documents templates: each document takes a template's sentences,
+mixes in sentences from other templates and gets its own title, year and
+tags. The same --seed always produces the same corpus and the same queries,
+so two runs on one machine measure the same work.
+
+- search: cold start of LegalSearchEngine (empty embedding cache and indexes;
+  only the first size pays for importing the model), warm start (reusing
+  them), then steady-state QPS and p50/p95/p99 latency of search() per method
+  over distinct queries, with the result cache disabled
+- tag: auto_tag.classify documents and MB per second
+- brief: generate_brief generated tokens per second (loads the summarizer)
+
+Results are written as JSON. Given --baseline (the output of an earlier run),
+every metric present in both is compared and the run fails when any is worse
+than the baseline by more than --tolerance.
+
+Usage:
+    python benchmark.py --sizes 1k,10k --output baseline.json
+    python benchmark.py --sizes 1k,10k --baseline baseline.json
+    python benchmark.py --benchmarks tag --tag_docs 50000
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from importlib import metadata
+from pathlib import Path
+
+from semantic_search import LegalSearchEngine, ENCODER_BACKENDS, INDEX_BACKENDS
+
+BENCHMARKS = ('search', 'tag', 'brief')
+SEARCH_MODES = ('semantic', 'keyword')
+# Result keys compared against a baseline, by which direction is better
+LOWER_IS_BETTER = ('_ms', '_seconds')
+HIGHER_IS_BETTER = ('qps', '_per_sec')
+DEFAULT_TOLERANCE = 0.15
+PACKAGES = ('numpy', 'sentence-transformers', 'torch', 'transformers', 'onnxruntime')
+
+# Party names for synthetic case titles
+PARTIES = (
+    'Adams', 'Baker', 'Carter', 'Delgado', 'Evans', 'Fischer', 'Garcia', 'Hughes', 'Ibarra', 'Jackson',
+    'Kim', 'Lopez', 'Morgan', 'Nguyen', 'Ortiz', 'Patel', 'Quinn', 'Rivera', 'Schmidt', 'Thompson',
+    'United States', 'California', 'New York', 'Texas', 'Ohio', 'Florida', 'Illinois', 'Board of Education',
+    'City of Chicago', 'Department of Labor',
+)
+SENTENCE_END = re.compile(r'(?<=\.)\s+')
+QUERY_WORD = re.compile(r'[a-z]{4,}')
+STOPWORDS = {'that', 'they', 'them', 'their', 'this', 'with', 'from', 'which', 'have', 'there', 'what',
+             'when', 'about', 'whether', 'such', 'under', 'without', 'before', 'known', 'well', 'many',
+             'made', 'make', 'into', 'also', 'only', 'must', 'those', 'said', 'gives'}
+SIZE_SUFFIXES = {'k': 1000, 'm': 1000000}
+
+
+def parse_size(text):
+    """Document count from '5000', '10k' or '1m'."""
+    text = text.strip().lower()
+    if text[-1:] in SIZE_SUFFIXES:
+        return int(float(text[:-1]) * SIZE_SUFFIXES[text[-1]])
+    return int(text)
+
+
+def synthetic_documents(count, seed=0):
+    """
+    Yield count legal documents built from the sample document templates.
+    Args:
+        count (int): Documents to generate
+        seed (int): Random seed; the same seed yields the same documents
+    """
+    templates = LegalSearchEngine.get_sample_documents()
+    sentences = [SENTENCE_END.split(template['content']) for template in templates]
+    pool = [sentence for group in sentences for sentence in group]
+    rng = random.Random(seed)
+    for i in range(count):
+        t = i % len(templates)
+        template, other = templates[t], templates[rng.randrange(len(templates))]
+        # The template's opening sentence, then its other sentences and two borrowed ones in random order
+        rest = sentences[t][1:] + rng.sample(pool, 2)
+        rng.shuffle(rest)
+        body = sentences[t][:1] + rest
+        first, second = rng.sample(PARTIES, 2)
+        yield {
+            'id': i + 1,
+            'title': f"{first} v. {second}",
+            'content': ' '.join(body),
+            'summary': template['summary'],
+            'tags': sorted(set(template['tags']) | {rng.choice(other['tags'])}),
+            'year': rng.randint(1790, 2024),
+        }
+
+
+def synthetic_queries(count, seed=0):
+    """count distinct 2-4 word queries drawn from the template vocabulary."""
+    words = sorted({
+        word for template in LegalSearchEngine.get_sample_documents()
+        for word in QUERY_WORD.findall(f"{template['content']} {template['summary']}".lower())
+        if word not in STOPWORDS
+    })
+    rng = random.Random(seed)
+    queries = {}
+    while len(queries) < count:
+        query = ' '.join(rng.sample(words, rng.randint(2, 4)))
+        queries[query] = None
+    return list(queries)
+
+
+def write_corpus(path, documents):
+    """Stream documents to a {"documents": [...]} JSON file, as the search engine reads it."""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"documents": [\n')
+        for i, doc in enumerate(documents):
+            f.write((',\n' if i else '') + json.dumps(doc, ensure_ascii=False))
+        f.write('\n]}\n')
+
+
+def _percentile(ordered, q):
+    """Nearest-rank percentile of an ascending list."""
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+
+def measure(fn, items, warmup=()):
+    """
+    Call fn on each item in turn, after the warm-up items.
+    Returns:
+        dict: calls, seconds, per-call mean/p50/p95/p99/max in ms
+    """
+    for item in warmup:
+        fn(item)
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        call_start = time.perf_counter()
+        fn(item)
+        latencies.append((time.perf_counter() - call_start) * 1000)
+    seconds = time.perf_counter() - start
+    ordered = sorted(latencies)
+    return {
+        'calls': len(latencies),
+        'seconds': round(seconds, 3),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'p50_ms': round(_percentile(ordered, 0.50), 3),
+        'p95_ms': round(_percentile(ordered, 0.95), 3),
+        'p99_ms': round(_percentile(ordered, 0.99), 3),
+        'max_ms': round(ordered[-1], 3),
+    }
+
+
+def _rounded(timings):
+    return {phase: round(ms, 2) for phase, ms in timings.items()}
+
+
+def bench_search(size, workdir, queries, warmup, seed=0, methods=SEARCH_MODES, top_k=5, engine_options=None):
+    """
+    Cold start, warm start and steady-state latency of LegalSearchEngine on a synthetic corpus.
+    Args:
+        size (int): Documents in the corpus
+        workdir (Path): Directory for the corpus, its indexes and embedding cache (emptied first)
+        queries (list): Measured queries, each searched once per method
+        warmup (list): Queries searched before measuring
+        methods (tuple): Search methods to measure
+        engine_options (dict): Extra LegalSearchEngine arguments (encoder, index_backend, index_params)
+    Returns:
+        dict: Start-up times and per-method results
+    """
+    if workdir.exists():
+        shutil.rmtree(workdir)
+    workdir.mkdir(parents=True)
+    corpus_path = workdir / 'legal_documents.json'
+    write_corpus(corpus_path, synthetic_documents(size, seed))
+    result = {'documents': size, 'corpus_bytes': corpus_path.stat().st_size}
+
+    options = {**(engine_options or {}), 'corpus_path': corpus_path,
+               'embedding_cache_dir': workdir / 'embedding_cache', 'result_cache_size': 0}
+    for phase in ('cold_start', 'warm_start'):
+        start = time.perf_counter()
+        engine = LegalSearchEngine(**options)
+        result[f'{phase}_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        result[f'{phase}_phases'] = _rounded(engine.startup_timings)
+        if phase == 'cold_start':
+            del engine
+
+    result['methods'] = {}
+    for method in methods:
+        if engine.resolve_method(method) != method:
+            result['methods'][method] = {'skipped': f'{method} search is unavailable (no model or vector index)'}
+            continue
+        stats = measure(lambda query: engine.search(query, top_k, 0.0, method), queries, warmup)
+        stats['qps'] = round(stats['calls'] / stats['seconds'], 1)
+        result['methods'][method] = stats
+    return result
+
+
+def bench_tag(count, seed=0):
+    """auto_tag.classify throughput over count synthetic documents."""
+    import auto_tag
+
+    texts = [doc['content'] for doc in synthetic_documents(count, seed)]
+    stats = measure(auto_tag.classify, texts, texts[:min(100, len(texts))])
+    stats['docs_per_sec'] = round(count / stats['seconds'], 1)
+    stats['mb_per_sec'] = round(sum(len(text.encode('utf-8')) for text in texts) / 2**20 / stats['seconds'], 2)
+    return stats
+
+
+def bench_brief(count, seed=0, docs_per_case=4, shared_encoder=False):
+    """
+    generate_brief throughput on count synthetic cases of docs_per_case documents each.
+    Model loading is timed separately and excluded from tokens_per_sec.
+    """
+    import brief_generator
+
+    start = time.perf_counter()
+    summarizer = brief_generator.load_model()
+    load_seconds = round(time.perf_counter() - start, 2)
+    documents = list(synthetic_documents((count + 1) * docs_per_case, seed))
+    cases = [' '.join(doc['content'] for doc in documents[i:i + docs_per_case])
+             for i in range(0, len(documents), docs_per_case)]
+    generation = {}
+    # The first case is the warm-up, so its tokens are not counted
+    brief_generator.generate_brief(cases[0], summarizer, shared_encoder=shared_encoder)
+    stats = measure(lambda text: brief_generator.generate_brief(text, summarizer, shared_encoder=shared_encoder,
+                                                                stats=generation), cases[1:])
+    stats.update({
+        'load_seconds': load_seconds,
+        'model': brief_generator.MODEL_NAME,
+        'input_tokens': generation['input_tokens'],
+        'generated_tokens': generation['generated_tokens'],
+        'tokens_per_sec': round(generation['generated_tokens'] / stats['seconds'], 1),
+    })
+    return stats
+
+
+def environment():
+    """Interpreter, machine and package versions the results were measured with."""
+    versions = {}
+    for package in PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'packages': versions,
+    }
+
+
+def _metrics(results, prefix=''):
+    """Flatten results to {'search.1000.methods.keyword.p95_ms': value} for comparable metrics."""
+    flat = {}
+    for key, value in results.items():
+        path = f'{prefix}{key}'
+        if isinstance(value, dict):
+            # Start-up phases are reported for diagnosis; their totals are compared
+            if not key.endswith('_phases'):
+                flat.update(_metrics(value, f'{path}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and key.endswith(
+                LOWER_IS_BETTER + HIGHER_IS_BETTER):
+            flat[path] = value
+    return flat
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare every metric present in both results and baseline.
+    Returns:
+        dict: tolerance, compared metrics with their change, and the regressions among them
+    """
+    current, previous = _metrics(results), _metrics(baseline)
+    compared = {}
+    regressions = []
+    for path in sorted(current.keys() & previous.keys()):
+        old, new = previous[path], current[path]
+        if not old:
+            continue
+        change = (new - old) / old
+        worse = change > tolerance if path.endswith(LOWER_IS_BETTER) else change < -tolerance
+        compared[path] = {'baseline': old, 'current': new, 'change': round(change, 3)}
+        if worse:
+            regressions.append(path)
+    return {'tolerance': tolerance, 'metrics': compared, 'regressions': regressions}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark search, tagging and briefing on synthetic corpora')
+    parser.add_argument('--benchmarks', default=','.join(BENCHMARKS),
+                        help=f"Comma-separated benchmarks to run ({', '.join(BENCHMARKS)})")
+    parser.add_argument('--sizes', default='1k',
+                        help='Search: comma-separated corpus sizes, e.g. 1k,10k,100k,1m')
+    parser.add_argument('--methods', default=','.join(SEARCH_MODES), help='Search: methods to measure')
+    parser.add_argument('--queries', type=int, default=500, help='Search: measured queries per method')
+    parser.add_argument('--warmup', type=int, default=50, help='Search: warm-up queries per method')
+    parser.add_argument('--top_k', type=int, default=5, help='Search: results per query')
+    parser.add_argument('--encoder', choices=ENCODER_BACKENDS, default='torch', help='Search: sentence encoder')
+    parser.add_argument('--index', choices=sorted(INDEX_BACKENDS), default='flat', help='Search: vector index backend')
+    parser.add_argument('--tag_docs', type=int, default=10000, help='Tag: documents classified')
+    parser.add_argument('--brief_cases', type=int, default=8, help='Brief: cases briefed')
+    parser.add_argument('--shared_encoder', action='store_true', help='Brief: encode each case once for all sections')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic corpora and queries')
+    parser.add_argument('--workdir', help='Directory for the synthetic corpora (a temporary one by default)')
+    parser.add_argument('--output', help='Write the results JSON here')
+    parser.add_argument('--baseline', help='Results JSON of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Relative change beyond which a metric counts as a regression')
+    args = parser.parse_args()
+
+    benchmarks = [name.strip() for name in args.benchmarks.split(',') if name.strip()]
+    methods = [name.strip() for name in args.methods.split(',') if name.strip()]
+    unknown = sorted(set(benchmarks) - set(BENCHMARKS)) + sorted(set(methods) - set(SEARCH_MODES))
+    if unknown:
+        parser.error(f"Unknown benchmark or method: {', '.join(unknown)}")
+    sizes = [parse_size(size) for size in args.sizes.split(',') if size.strip()]
+    # Per-query info lines would fill search.log and be timed with every search
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = {
+        'status': 'success',
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'environment': environment(),
+        'config': {'sizes': sizes, 'methods': methods, 'queries': args.queries, 'warmup': args.warmup,
+                   'top_k': args.top_k, 'encoder': args.encoder, 'index': args.index, 'tag_docs': args.tag_docs,
+                   'brief_cases': args.brief_cases, 'shared_encoder': args.shared_encoder, 'seed': args.seed},
+    }
+    workdir = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix='lexiaid-bench-'))
+    try:
+        if 'search' in benchmarks:
+            queries = synthetic_queries(args.queries + args.warmup, args.seed)
+            engine_options = {'encoder': args.encoder, 'index_backend': args.index}
+            results['search'] = {}
+            for size in sizes:
+                print(f"search: {size} documents", file=sys.stderr)
+                results['search'][str(size)] = bench_search(
+                    size, workdir / f'search_{size}', queries[args.warmup:], queries[:args.warmup],
+                    args.seed, methods, args.top_k, engine_options)
+        if 'tag' in benchmarks:
+            print(f"tag: {args.tag_docs} documents", file=sys.stderr)
+            results['tag'] = bench_tag(args.tag_docs, args.seed)
+        if 'brief' in benchmarks:
+            print(f"brief: {args.brief_cases} cases", file=sys.stderr)
+            try:
+                results['brief'] = bench_brief(args.brief_cases, args.seed, shared_encoder=args.shared_encoder)
+            except Exception as e:
+                # The summarizer is optional here; the other results still count
+                results['brief'] = {'error': str(e)}
+        if args.baseline:
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                comparison = compare(results, json.load(f), args.tolerance)
+            results['comparison'] = {'baseline': args.baseline, **comparison}
+            if comparison['regressions']:
+                results['status'] = 'error'
+                results['message'] = f"{len(comparison['regressions'])} metric(s) regressed beyond the tolerance"
+    except Exception as e:
+        results['status'] = 'error'
+        results['message'] = str(e)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    stream = sys.stdout if results['status'] == 'success' else sys.stderr
+    print(json.dumps(results, ensure_ascii=False, indent=2), file=stream)
+    return 0 if results['status'] == 'success' else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
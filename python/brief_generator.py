@@ -3,6 +3,24 @@ brief_generator.py
 
 This script takes the full text of a legal case and generates a structured case brief using a transformer-based summarization model (T5 or BART).
 
+All sections of a brief are generated together: the section prompts of a case
+(and, in bulk mode, of several cases) go to the model as padded batches, one
+generate call per batch instead of one pipeline call per section. With
+--shared_encoder the case text is encoded once and each section prompt is fed
+to the decoder instead, so the long input is not re-encoded for every section.
+
+Cases longer than the encoder accepts are summarized map-reduce style: the text
+is split into token-aware chunks on sentence boundaries, the chunks (of all
+cases in the batch) are summarized in padded batches, and the brief sections
+are generated from the joined chunk summaries. Chunk summaries are cached in
+memory by content hash, so text shared between cases is only summarized once,
+and (through cached_briefs) in the result cache next to the briefs, so a
+restarted worker or a new CLI run does not summarize the same chunks again.
+
+Finished briefs are cached by content hash in result_cache.sqlite3 (see
+result_cache.py). The cache is checked before the model is loaded, so a case
+that was briefed before is answered without loading transformers at all.
+
 Requirements:
 - transformers
 - torch
@@ -13,14 +31,22 @@ Usage:
     python brief_generator.py --input_file path/to/case.txt
     OR
     python brief_generator.py --text "Full case text here"
+    OR (bulk: one {"id": ..., "text": ...} object per line, one brief per output line)
+    python brief_generator.py --jsonl cases.jsonl --cases_per_batch 4
 
 Returns JSON with keys: facts, issues, holding, reasoning, principles
 """
 
 import argparse
+import functools
 import json
+import re
 import sys
-from transformers import pipeline, AutoTokenizer, AutoModelForSeq2SeqLM
+import threading
+import time
+from collections import OrderedDict
+
+from result_cache import ResultCache, DEFAULT_CACHE_PATH, cache_key, config_digest
 
 # You can swap model_name for 'facebook/bart-large-cnn' or another summarization model
 MODEL_NAME = 't5-base'
@@ -34,32 +60,404 @@ BRIEF_SECTIONS = {
     'principles': 'Identify the key legal principles in the following case:'
 }
 
+# Generation settings for every section, on top of the model's own summarization
+# defaults (beams, length penalty, ...) as the summarization pipeline applies them
+GENERATION_SETTINGS = {'max_length': 120, 'min_length': 20, 'do_sample': False}
+
+# Per-section overrides of GENERATION_SETTINGS, e.g. {'holding': {'max_length': 60, 'num_beams': 2}}.
+# Sections with different settings are generated in separate batches.
+SECTION_SETTINGS = {}
+
+# Prompts (case x section) per generate call
+GENERATION_BATCH = 16
+
+# Cases briefed together in bulk (--jsonl) mode
+CASES_PER_BATCH = 4
+
+# Map step for long cases: chunks of at most CHUNK_TOKENS tokens, each summarized
+# with CHUNK_SETTINGS. The joined summaries are split and summarized again while
+# they are still too long, at most MAX_REDUCE_LEVELS times.
+CHUNK_TOKENS = 448
+CHUNK_SETTINGS = {'max_length': 128, 'min_length': 32, 'do_sample': False}
+MAX_REDUCE_LEVELS = 3
+
+# Encoder limit for tokenizers that do not declare one
+DEFAULT_MAX_INPUT_TOKENS = 512
+
+# Chunk summaries kept in memory
+CHUNK_CACHE_SIZE = 4096
+
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?;])\s+|\n\s*\n')
+
 def load_model():
     """Load the summarization pipeline."""
+    # Imported here so cache hits never pay for importing transformers and torch
+    from transformers import pipeline, AutoTokenizer, AutoModelForSeq2SeqLM
+
     tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
     model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_NAME)
     summarizer = pipeline('summarization', model=model, tokenizer=tokenizer)
     return summarizer
 
-def generate_brief(text, summarizer):
-    """Generate a structured case brief from text."""
-    brief = {}
-    for section, prompt in BRIEF_SECTIONS.items():
-        input_text = f"{prompt}\n{text}"
-        # T5 expects a prefix for summarization
-        if MODEL_NAME.startswith('t5'):
-            input_text = f"summarize: {input_text}"
-        summary = summarizer(input_text, max_length=120, min_length=20, do_sample=False)[0]['summary_text']
-        brief[section] = summary.strip()
-    return brief
+def _input_prefix():
+    # T5 expects a prefix for summarization
+    return 'summarize: ' if MODEL_NAME.startswith('t5') else ''
+
+def _task_settings(model):
+    """The model's own summarization defaults, as the summarization pipeline applies them."""
+    task_params = (getattr(model.config, 'task_specific_params', None) or {}).get('summarization', {})
+    return {k: v for k, v in task_params.items() if k != 'prefix'}
+
+def section_settings(model, section, overrides=None):
+    """
+    Generation keyword arguments for one section.
+    Args:
+        model: The seq2seq model (its config supplies the summarization defaults)
+        section (str): Key of BRIEF_SECTIONS
+        overrides (dict): Section -> settings, applied over SECTION_SETTINGS
+    Returns:
+        dict: Keyword arguments for model.generate
+    """
+    settings = _task_settings(model)
+    settings.update(GENERATION_SETTINGS)
+    settings.update(SECTION_SETTINGS.get(section, {}))
+    settings.update((overrides or {}).get(section, {}))
+    return settings
+
+def _settings_groups(model, overrides):
+    """Sections grouped by identical settings, in BRIEF_SECTIONS order."""
+    groups = {}
+    for section in BRIEF_SECTIONS:
+        settings = section_settings(model, section, overrides)
+        key = json.dumps(settings, sort_keys=True)
+        groups.setdefault(key, (settings, []))[1].append(section)
+    return list(groups.values())
+
+def _count_generated(output, pad_token_id, skip=0):
+    """Generated tokens in a batch of output ids, ignoring padding and the first skip positions."""
+    return int(output[:, skip:].ne(pad_token_id).sum())
+
+def _generate_texts(model, tokenizer, inputs, settings, stats):
+    """Summaries of model inputs, generated in padded batches of similar length; in input order."""
+    import torch
+
+    summaries = [None] * len(inputs)
+    # Similar lengths together keep padding down
+    order = sorted(range(len(inputs)), key=lambda i: len(inputs[i]), reverse=True)
+    for start in range(0, len(order), GENERATION_BATCH):
+        batch = order[start:start + GENERATION_BATCH]
+        encoded = tokenizer([inputs[i] for i in batch], padding=True, truncation=True,
+                            return_tensors='pt').to(model.device)
+        with torch.inference_mode():
+            output = model.generate(**encoded, **settings)
+        for i, summary in zip(batch, tokenizer.batch_decode(output, skip_special_tokens=True)):
+            summaries[i] = summary.strip()
+        stats['batches'] += 1
+        stats['input_tokens'] += int(encoded['attention_mask'].sum())
+        stats['generated_tokens'] += _count_generated(output, tokenizer.pad_token_id)
+    return summaries
+
+def _generate_batched(model, tokenizer, texts, overrides, stats):
+    """Every (case, section) prompt, as padded batches of whole prompts."""
+    briefs = [{} for _ in texts]
+    prefix = _input_prefix()
+    for settings, sections in _settings_groups(model, overrides):
+        rows = [(i, section) for i in range(len(texts)) for section in sections]
+        inputs = [f"{prefix}{BRIEF_SECTIONS[section]}\n{texts[i]}" for i, section in rows]
+        for (i, section), summary in zip(rows, _generate_texts(model, tokenizer, inputs, settings, stats)):
+            briefs[i][section] = summary
+    return briefs
+
+def _generate_shared(model, tokenizer, texts, overrides, stats):
+    """Encode each case once; every section decodes from that encoding with its prompt as decoder prefix."""
+    import torch
+    from transformers.modeling_outputs import BaseModelOutput
+
+    briefs = [{} for _ in texts]
+    prefix = _input_prefix()
+    start_id = model.config.decoder_start_token_id
+    for start in range(0, len(texts), GENERATION_BATCH):
+        batch = texts[start:start + GENERATION_BATCH]
+        inputs = tokenizer([f"{prefix}{text}" for text in batch], padding=True, truncation=True,
+                           return_tensors='pt').to(model.device)
+        with torch.inference_mode():
+            hidden = model.get_encoder()(**inputs).last_hidden_state
+        stats['input_tokens'] += int(inputs['attention_mask'].sum())
+        for settings, sections in _settings_groups(model, overrides):
+            for section in sections:
+                prompt_ids = [start_id] + tokenizer(BRIEF_SECTIONS[section], add_special_tokens=False)['input_ids']
+                decoder_input_ids = torch.tensor([prompt_ids] * len(batch), device=model.device)
+                # Lengths count the decoder prompt too
+                kwargs = dict(settings)
+                for key in ('max_length', 'min_length'):
+                    if key in kwargs:
+                        kwargs[key] += len(prompt_ids)
+                with torch.inference_mode():
+                    # generate expands encoder_outputs for beam search in place, so pass a fresh wrapper
+                    output = model.generate(encoder_outputs=BaseModelOutput(last_hidden_state=hidden),
+                                            attention_mask=inputs['attention_mask'],
+                                            decoder_input_ids=decoder_input_ids, **kwargs)
+                summaries = tokenizer.batch_decode(output[:, len(prompt_ids):], skip_special_tokens=True)
+                for i, summary in enumerate(summaries):
+                    briefs[start + i][section] = summary.strip()
+                stats['batches'] += 1
+                stats['generated_tokens'] += _count_generated(output, tokenizer.pad_token_id, len(prompt_ids))
+    return briefs
+
+def _max_input_tokens(tokenizer):
+    limit = getattr(tokenizer, 'model_max_length', None)
+    # Tokenizers without a limit report a huge sentinel value
+    return limit if limit and limit < 100_000 else DEFAULT_MAX_INPUT_TOKENS
+
+def split_chunks(text, tokenizer, max_tokens=CHUNK_TOKENS):
+    """
+    Split text into chunks of at most max_tokens tokens, on sentence boundaries where possible.
+    Args:
+        text (str): Case text
+        tokenizer: The summarizer's tokenizer
+        max_tokens (int): Chunk size limit
+    Returns:
+        tuple: (list of chunk texts, token count of the whole text)
+    """
+    sentences = [s for s in SENTENCE_BOUNDARY.split(text) if s and s.strip()]
+    if not sentences:
+        return [], 0
+    token_ids = tokenizer(sentences, add_special_tokens=False)['input_ids']
+    chunks, current, size, total = [], [], 0, 0
+    for sentence, ids in zip(sentences, token_ids):
+        total += len(ids)
+        if size + len(ids) > max_tokens and current:
+            chunks.append(' '.join(current))
+            current, size = [], 0
+        if len(ids) > max_tokens:
+            # A sentence longer than a chunk is cut into token windows
+            chunks.extend(tokenizer.decode(ids[i:i + max_tokens]) for i in range(0, len(ids), max_tokens))
+            continue
+        current.append(sentence.strip())
+        size += len(ids)
+    if current:
+        chunks.append(' '.join(current))
+    return chunks, total
+
+def chunk_cache_namespace(settings):
+    """Result cache namespace for chunk summaries: the model and the chunk generation settings."""
+    return f"chunk:{MODEL_NAME}:{config_digest(settings)}"
+
+class ChunkSummaryCache:
+    """Bounded LRU of chunk summaries, keyed by result_cache.cache_key of the chunk text."""
+
+    def __init__(self, size=CHUNK_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            summary = self.entries.get(key)
+            if summary is not None:
+                self.entries.move_to_end(key)
+            return summary
+
+    def put(self, key, summary):
+        with self.lock:
+            self.entries[key] = summary
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+# Shared by every generate_briefs() call in the process (e.g. brief_worker threads)
+CHUNK_CACHE = ChunkSummaryCache()
+
+def condense_texts(model, tokenizer, texts, stats, cache=CHUNK_CACHE, store=None):
+    """
+    Map step: replace each text too long for a section prompt by its joined chunk summaries.
+    Args:
+        model, tokenizer: The summarizer's model and tokenizer
+        texts (list): Case texts
+        stats (dict): Updated in place (chunks, cached_chunks, reduce_levels, stage_seconds)
+        cache (ChunkSummaryCache): Where chunk summaries are looked up and stored
+        store (ResultCache): Also looked up on a miss in cache, and stored to, so
+            summaries outlive the process; None to keep them in memory only
+    Returns:
+        list: Texts that fit the encoder (unchanged where they already did)
+    """
+    prefix = _input_prefix()
+    limit = _max_input_tokens(tokenizer)
+    prompt_tokens = max(len(tokenizer(f"{prefix}{prompt}\n")['input_ids']) for prompt in BRIEF_SECTIONS.values())
+    chunk_tokens = min(CHUNK_TOKENS, limit - len(tokenizer(prefix)['input_ids']))
+    settings = {**_task_settings(model), **CHUNK_SETTINGS}
+    namespace = chunk_cache_namespace(settings)
+    texts = list(texts)
+    pending = list(range(len(texts)))
+    for level in range(MAX_REDUCE_LEVELS):
+        start = time.perf_counter()
+        chunked = {}
+        for i in pending:
+            chunks, total = split_chunks(texts[i], tokenizer, chunk_tokens)
+            if total > limit - prompt_tokens:
+                chunked[i] = chunks
+        stats['stage_seconds']['split'] += time.perf_counter() - start
+        if not chunked:
+            break
+
+        start = time.perf_counter()
+        chunks = [chunk for case_chunks in chunked.values() for chunk in case_chunks]
+        keys = [cache_key(namespace, chunk) for chunk in chunks]
+        summaries = {key: cache.get(key) for key in keys}
+        if store is not None:
+            # Summarized by an earlier run or another process
+            for key in [key for key, summary in summaries.items() if summary is None]:
+                summaries[key] = store.get(key)
+                if summaries[key] is not None:
+                    cache.put(key, summaries[key])
+        todo = {key: chunk for key, chunk in zip(keys, chunks) if summaries[key] is None}
+        # Chunks of every long case in the batch are summarized together
+        generated = _generate_texts(model, tokenizer, [f"{prefix}{chunk}" for chunk in todo.values()], settings, stats)
+        for key, summary in zip(todo, generated):
+            cache.put(key, summary)
+            if store is not None:
+                store.put(key, summary, namespace)
+            summaries[key] = summary
+        position = 0
+        for i, case_chunks in chunked.items():
+            texts[i] = '\n'.join(summaries[key] for key in keys[position:position + len(case_chunks)])
+            position += len(case_chunks)
+        stats['chunks'] += len(chunks)
+        stats['cached_chunks'] += sum(1 for key in keys if key not in todo)
+        stats['reduce_levels'] = max(stats['reduce_levels'], level + 1)
+        stats['stage_seconds']['map'] += time.perf_counter() - start
+        pending = list(chunked)
+    return texts
+
+def generate_briefs(texts, summarizer, shared_encoder=False, settings=None, stats=None, store=None):
+    """
+    Generate structured case briefs for several cases at once.
+    Args:
+        texts (list): Case texts
+        summarizer: Pipeline from load_model()
+        shared_encoder (bool): Encode each case once and reuse it for every section
+        settings (dict): Per-section generation overrides (see SECTION_SETTINGS)
+        stats (dict): Updated in place with cases, sections, batches, input_tokens,
+                      generated_tokens, seconds, tokens_per_sec, and for long cases
+                      chunks, cached_chunks, reduce_levels and stage_seconds
+                      (split, map and reduce, the section generation)
+        store (ResultCache): Persistent cache for chunk summaries of long cases, or None
+    Returns:
+        list: One brief dict per text, sections in BRIEF_SECTIONS order
+    """
+    if stats is None:
+        stats = {}
+    for key in ('cases', 'sections', 'batches', 'input_tokens', 'generated_tokens', 'seconds',
+                'chunks', 'cached_chunks', 'reduce_levels'):
+        stats.setdefault(key, 0)
+    stage_seconds = stats.setdefault('stage_seconds', {})
+    for stage in ('split', 'map', 'reduce'):
+        stage_seconds.setdefault(stage, 0.0)
+    model, tokenizer = summarizer.model, summarizer.tokenizer
+    generate = _generate_shared if shared_encoder else _generate_batched
+    start = time.perf_counter()
+    texts = condense_texts(model, tokenizer, texts, stats, store=store)
+    reduce_start = time.perf_counter()
+    briefs = generate(model, tokenizer, texts, settings, stats)
+    stage_seconds['reduce'] += time.perf_counter() - reduce_start
+    stats['seconds'] += time.perf_counter() - start
+    stats['cases'] += len(texts)
+    stats['sections'] += len(texts) * len(BRIEF_SECTIONS)
+    stats['tokens_per_sec'] = round(stats['generated_tokens'] / stats['seconds'], 1) if stats['seconds'] else None
+    return [{section: brief[section] for section in BRIEF_SECTIONS} for brief in briefs]
+
+def generate_brief(text, summarizer, **options):
+    """Generate a structured case brief from text (options as for generate_briefs)."""
+    return generate_briefs([text], summarizer, **options)[0]
+
+def brief_cache_namespace(shared_encoder=False, settings=None):
+    """Result cache namespace for briefs: the model and every setting that shapes its output."""
+    config = {
+        'sections': BRIEF_SECTIONS,
+        'generation': GENERATION_SETTINGS,
+        'section_settings': {**SECTION_SETTINGS, **(settings or {})},
+        'shared_encoder': shared_encoder,
+        'chunks': [CHUNK_TOKENS, CHUNK_SETTINGS, MAX_REDUCE_LEVELS],
+    }
+    return f"brief:{MODEL_NAME}:{config_digest(config)}"
+
+def cached_briefs(texts, cache, get_summarizer, stats=None, **options):
+    """
+    generate_briefs() through the result cache, which also keeps the chunk
+    summaries of long cases.
+    Args:
+        texts (list): Case texts
+        cache (ResultCache): Where briefs are looked up and stored, or None to always generate
+        get_summarizer: Function returning the summarizer; only called when some text is not cached
+        stats (dict): As for generate_briefs (covers the generated briefs only)
+        options: shared_encoder and settings, as for generate_briefs
+    Returns:
+        list: (brief, True if it came from the cache) per text
+    """
+    texts = list(texts)
+    namespace = brief_cache_namespace(**options)
+    keys = [cache_key(namespace, text) for text in texts]
+    briefs = [cache.get(key) for key in keys] if cache is not None else [None] * len(texts)
+    missing = [i for i, brief in enumerate(briefs) if brief is None]
+    if missing:
+        generated = generate_briefs([texts[i] for i in missing], get_summarizer(), stats=stats, store=cache,
+                                    **options)
+        for i, brief in zip(missing, generated):
+            briefs[i] = brief
+            if cache is not None:
+                cache.put(keys[i], brief, namespace)
+    missing = set(missing)
+    return [(brief, i not in missing) for i, brief in enumerate(briefs)]
+
+def _read_jsonl_cases(path):
+    """Yield (id, text) for each {"id", "text"} line of a JSON lines file."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for position, line in enumerate(f):
+            if line.strip():
+                case = json.loads(line)
+                yield case.get('id', position), case.get('text') or case.get('content') or ''
 
 def main():
     parser = argparse.ArgumentParser(description='Generate a structured case brief from legal text.')
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument('--input_file', type=str, help='Path to file containing legal case text')
     group.add_argument('--text', type=str, help='Raw legal case text as input')
+    group.add_argument('--jsonl', type=str, help='Bulk mode: JSON lines file of {"id", "text"} cases')
+    parser.add_argument('--cases_per_batch', type=int, default=CASES_PER_BATCH, help='--jsonl: cases briefed together')
+    parser.add_argument('--shared_encoder', action='store_true', help='Encode each case once for all sections')
+    parser.add_argument('--section_settings', type=json.loads, default=None,
+                        help='JSON of per-section generation settings, e.g. \'{"holding": {"max_length": 60}}\'')
+    parser.add_argument('--cache', type=str, default=str(DEFAULT_CACHE_PATH), help='Result cache file')
+    parser.add_argument('--no-cache', action='store_true', help='Generate without reading or writing the cache')
     args = parser.parse_args()
 
+    options = {'shared_encoder': args.shared_encoder, 'settings': args.section_settings}
+    stats = {}
+    cache = None if args.no_cache else ResultCache(args.cache)
+    # The model is loaded on the first cache miss, and only once
+    get_summarizer = functools.lru_cache(maxsize=None)(load_model)
+
+    if args.jsonl:
+        batch = []
+
+        def flush():
+            results = cached_briefs([text for _, text in batch], cache, get_summarizer, stats=stats, **options)
+            for (case_id, _), (brief, cached) in zip(batch, results):
+                print(json.dumps({'id': case_id, 'brief': brief, 'cached': cached}, ensure_ascii=False), flush=True)
+            batch.clear()
+
+        for case_id, text in _read_jsonl_cases(args.jsonl):
+            if len(text.strip()) < 30:
+                print(json.dumps({'id': case_id, 'status': 'error', 'message': 'Input text too short or missing.'}))
+                continue
+            batch.append((case_id, text))
+            if len(batch) >= args.cases_per_batch:
+                flush()
+        if batch:
+            flush()
+        print(json.dumps({'status': 'ok', 'stats': stats}), file=sys.stderr)
+        return
+
     if args.input_file:
         with open(args.input_file, 'r', encoding='utf-8') as f:
             text = f.read()
@@ -70,9 +468,11 @@ def main():
         print(json.dumps({'status': 'error', 'message': 'Input text too short or missing.'}))
         sys.exit(1)
 
-    summarizer = load_model()
-    brief = generate_brief(text, summarizer)
-    print(json.dumps({'status': 'ok', 'brief': brief}, ensure_ascii=False, indent=2))
+    [(brief, cached)] = cached_briefs([text], cache, get_summarizer, stats=stats, **options)
+    response = {'status': 'ok', 'brief': brief, 'cached': cached}
+    if not cached:
+        response['stats'] = stats
+    print(json.dumps(response, ensure_ascii=False, indent=2))
 
 if __name__ == '__main__':
     main()
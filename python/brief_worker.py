@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+LexiAid Brief Worker
+Persistent case-brief generation fed by a SQLite job queue.
+
+Uploads enqueue a job and return at once; a long-running worker loads the
+summarizer once, works through queued jobs on up to --concurrency threads and
+writes each finished brief to the job row and to legal_resources.summary.
+Failed jobs are retried with exponential backoff up to max_attempts. A job
+whose worker dies is picked up again once its lease runs out.
+
+Briefs go through the result cache (result_cache.py): a submitted case whose
+brief is already cached is completed at once and its brief returned with the
+job, and the worker stores every brief it generates.
+
+Usage:
+    python brief_worker.py --serve --concurrency 2       # run the worker
+    python brief_worker.py --submit --resource_id 42 < case.txt
+    python brief_worker.py --status 17
+"""
+
+import argparse
+import json
+import logging
+import signal
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+from corpus_store import MYSQL_CONFIG
+from result_cache import ResultCache, DEFAULT_CACHE_PATH, cache_key
+
+DEFAULT_QUEUE_PATH = Path(__file__).parent / 'brief_jobs.sqlite3'
+DEFAULT_CONCURRENCY = 1
+# Attempts per job before it is marked failed
+MAX_ATTEMPTS = 3
+# Seconds before the first retry; doubled for every further attempt
+RETRY_DELAY = 30.0
+# Seconds a worker may hold a job before another worker may take it over
+JOB_LEASE = 900.0
+# Seconds an idle worker thread sleeps between queue polls
+POLL_INTERVAL = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    resource_id INTEGER,
+    text TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    brief TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    available_at REAL NOT NULL,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, available_at);
+"""
+
+JOB_STATUSES = ('queued', 'running', 'done', 'failed')
+
+
+class JobQueue:
+    """SQLite-backed queue of brief jobs, safe to share between threads and processes."""
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH):
+        self.path = Path(path)
+        self._local = threading.local()
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        """This thread's connection (sqlite3 connections are not shared across threads)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            # Readers (status requests) do not block the worker's writes
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def submit(self, text, resource_id=None, max_attempts=MAX_ATTEMPTS, brief=None):
+        """Queue a brief for text and return the job id. A job given its brief is recorded as done."""
+        now = time.time()
+        status = 'queued' if brief is None else 'done'
+        brief = None if brief is None else json.dumps(brief, ensure_ascii=False)
+        cursor = self._connect().execute(
+            "INSERT INTO jobs (resource_id, text, status, max_attempts, brief, created_at, updated_at, available_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (resource_id, text, status, max_attempts, brief, now, now, now))
+        return cursor.lastrowid
+
+    def claim(self, lease=JOB_LEASE):
+        """
+        Take the oldest runnable job: queued and due, or running with an expired lease.
+        Returns:
+            sqlite3.Row: The claimed job, or None when there is nothing to do
+        """
+        conn = self._connect()
+        while True:
+            now = time.time()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                job = conn.execute(
+                    "SELECT * FROM jobs WHERE (status = 'queued' AND available_at <= ?)"
+                    " OR (status = 'running' AND lease_until < ?) ORDER BY id LIMIT 1",
+                    (now, now)).fetchone()
+                if job is None:
+                    conn.execute('COMMIT')
+                    return None
+                if job['attempts'] >= job['max_attempts']:
+                    # Its worker died on the last attempt
+                    conn.execute("UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                                 (job['error'] or 'Worker stopped while generating the brief', now, job['id']))
+                    conn.execute('COMMIT')
+                    continue
+                conn.execute("UPDATE jobs SET status = 'running', attempts = attempts + 1,"
+                             " lease_until = ?, updated_at = ? WHERE id = ?",
+                             (now + lease, now, job['id']))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            return self.get(job['id'])
+
+    def complete(self, job_id, brief):
+        """Store a finished brief."""
+        self._connect().execute(
+            "UPDATE jobs SET status = 'done', brief = ?, error = NULL, lease_until = NULL, updated_at = ?"
+            " WHERE id = ?",
+            (json.dumps(brief, ensure_ascii=False), time.time(), job_id))
+
+    def fail(self, job_id, error, retry_delay=RETRY_DELAY):
+        """Record a failed attempt; the job is retried later unless it is out of attempts."""
+        conn = self._connect()
+        now = time.time()
+        job = self.get(job_id)
+        if job['attempts'] < job['max_attempts']:
+            delay = retry_delay * 2 ** (job['attempts'] - 1)
+            conn.execute("UPDATE jobs SET status = 'queued', error = ?, available_at = ?, lease_until = NULL,"
+                         " updated_at = ? WHERE id = ?", (error, now + delay, now, job_id))
+        else:
+            conn.execute("UPDATE jobs SET status = 'failed', error = ?, lease_until = NULL, updated_at = ?"
+                         " WHERE id = ?", (error, now, job_id))
+
+    def get(self, job_id):
+        """The job row, or None."""
+        return self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def status(self, job_id):
+        """
+        Public view of a job.
+        Returns:
+            dict: id, status, attempts, resource_id, timestamps, error, and brief once done
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+        view = {
+            'id': job['id'],
+            'status': job['status'],
+            'resource_id': job['resource_id'],
+            'attempts': job['attempts'],
+            'max_attempts': job['max_attempts'],
+            'created_at': job['created_at'],
+            'updated_at': job['updated_at'],
+        }
+        if job['error']:
+            view['error'] = job['error']
+        if job['status'] == 'done':
+            view['brief'] = json.loads(job['brief'])
+        return view
+
+    def counts(self):
+        """Number of jobs in each status."""
+        rows = self._connect().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        counts.update({row['status']: row['n'] for row in rows})
+        return counts
+
+
+def store_brief(resource_id, brief, config=MYSQL_CONFIG):
+    """Write a finished brief to legal_resources.summary, as upload_case.php stores it."""
+    import mysql.connector
+
+    conn = mysql.connector.connect(**config)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE legal_resources SET summary = %s WHERE resource_id = %s",
+                       (json.dumps(brief, ensure_ascii=False), resource_id))
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+
+
+class BriefWorker:
+    def __init__(self, queue, generate, concurrency=DEFAULT_CONCURRENCY, write_back=store_brief,
+                 poll_interval=POLL_INTERVAL):
+        """
+        Args:
+            queue (JobQueue): Where jobs come from and results go
+            generate: Function text -> brief dict, with the model already loaded
+            concurrency (int): Jobs generated at the same time
+            write_back: Function (resource_id, brief) called for jobs with a resource_id, or None
+            poll_interval (float): Seconds an idle thread waits before polling again
+        """
+        self.queue = queue
+        self.generate = generate
+        self.concurrency = max(1, concurrency)
+        self.write_back = write_back
+        self.poll_interval = poll_interval
+        self.stopping = threading.Event()
+
+    def run_once(self):
+        """Process one job if there is one. Returns True if a job was processed."""
+        job = self.queue.claim()
+        if job is None:
+            return False
+        start = time.perf_counter()
+        try:
+            brief = self.generate(job['text'])
+            if self.write_back is not None and job['resource_id'] is not None:
+                self.write_back(job['resource_id'], brief)
+            self.queue.complete(job['id'], brief)
+            logging.info(f"Brief job {job['id']} done in {time.perf_counter() - start:.1f}s")
+        except Exception as e:
+            logging.error(f"Brief job {job['id']} attempt {job['attempts']} failed: {e}")
+            self.queue.fail(job['id'], str(e))
+        return True
+
+    def _loop(self):
+        while not self.stopping.is_set():
+            if not self.run_once():
+                self.stopping.wait(self.poll_interval)
+
+    def serve(self):
+        """Run worker threads until interrupted or terminated; jobs in progress are finished first."""
+        threads = [threading.Thread(target=self._loop, name=f'brief-worker-{i}', daemon=True)
+                   for i in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        logging.info(f"Brief worker running with {self.concurrency} thread(s) on {self.queue.path}")
+        # Service managers stop the worker with SIGTERM; finish current jobs like on Ctrl+C
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stopping.set())
+        try:
+            while any(thread.is_alive() for thread in threads):
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            self.stopping.set()
+            for thread in threads:
+                thread.join()
+        logging.info("Brief worker stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Queue-fed case brief generation worker')
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument('--serve', action='store_true', help='Load the model once and process queued jobs')
+    mode.add_argument('--submit', action='store_true', help='Queue a brief for --text or the text on stdin')
+    mode.add_argument('--status', type=int, metavar='JOB_ID', help='Report a job (with its brief once done)')
+    mode.add_argument('--stats', action='store_true', help='Number of jobs in each status')
+    parser.add_argument('--queue', default=str(DEFAULT_QUEUE_PATH), help='SQLite queue file')
+    parser.add_argument('--text', help='--submit: case text (read from stdin if omitted)')
+    parser.add_argument('--resource_id', type=int, help='--submit: legal_resources row the brief is written to')
+    parser.add_argument('--max_attempts', type=int, default=MAX_ATTEMPTS, help='--submit: attempts before giving up')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='--serve: jobs generated at once')
+    parser.add_argument('--no-db', action='store_true', help='--serve: keep briefs in the queue only')
+    parser.add_argument('--cache', default=str(DEFAULT_CACHE_PATH), help='Result cache file')
+    parser.add_argument('--no-cache', action='store_true', help='Neither use nor fill the result cache')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    try:
+        queue = JobQueue(args.queue)
+        cache = None if args.no_cache else ResultCache(args.cache)
+        if args.serve:
+            from brief_generator import load_model, cached_briefs
+            summarizer = load_model()
+            worker = BriefWorker(queue, lambda text: cached_briefs([text], cache, lambda: summarizer)[0][0],
+                                 args.concurrency, write_back=None if args.no_db else store_brief)
+            worker.serve()
+            return 0
+        if args.submit:
+            text = args.text if args.text is not None else sys.stdin.read()
+            if not text or len(text.strip()) < 30:
+                raise ValueError('Input text too short or missing.')
+            brief = None
+            if cache is not None:
+                from brief_generator import brief_cache_namespace
+                brief = cache.get(cache_key(brief_cache_namespace(), text))
+            job_id = queue.submit(text, args.resource_id, args.max_attempts, brief=brief)
+            response = {'status': 'ok', 'job_id': job_id, 'job_status': 'queued'}
+            if brief is not None:
+                # Already briefed, so no worker is involved: the caller stores the
+                # brief itself instead of the worker writing it to the database
+                response.update({'job_status': 'done', 'brief': brief, 'cached': True})
+        elif args.stats:
+            response = {'status': 'ok', 'jobs': queue.counts()}
+        else:
+            job = queue.status(args.status)
+            if job is None:
+                raise ValueError(f"No brief job {args.status}")
+            response = {'status': 'ok', 'job': job}
+    except Exception as e:
+        response = {'status': 'error', 'message': str(e)}
+
+    print(json.dumps(response, ensure_ascii=False))
+    return 0 if response['status'] == 'ok' else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
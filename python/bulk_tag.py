@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+LexiAid Bulk Tagging
+Re-tags a whole corpus with auto_tag's classifier in one long-running process.
+
+Cases are streamed from legal_documents.json, a directory of .txt files or
+the legal_resources table, classified in chunks across a process pool, and
+written either as JSON lines or back to MySQL with one batched UPDATE per
+chunk. After every chunk is durably written a checkpoint records how far the
+run got, so an interrupted run resumes where it stopped.
+
+Usage:
+    python bulk_tag.py --json legal_documents.json --output tags.jsonl
+    python bulk_tag.py --dir cases/ --output tags.jsonl --workers 8
+    python bulk_tag.py --mysql --update_db
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from auto_tag import classify
+from corpus_store import MYSQL_CONFIG, iter_json_documents, iter_mysql_documents, chunked
+
+# Cases classified per worker task (and per UPDATE batch / checkpoint)
+TAG_CHUNK = 256
+# Chunks queued per worker, so workers never wait for the reader
+CHUNKS_PER_WORKER = 2
+
+
+def iter_json_cases(path, skip=0):
+    """Yield (key, text) for the documents of a JSON corpus, after the first skip."""
+    for position, doc in enumerate(iter_json_documents(path)):
+        if position < skip:
+            continue
+        key = doc.get('resource_id', doc.get('id', position))
+        yield key, doc.get('content') or doc.get('summary') or ''
+
+
+def iter_dir_cases(directory, skip=0):
+    """Yield (relative path, text) for every .txt file under directory, in sorted order."""
+    directory = Path(directory)
+    for position, path in enumerate(sorted(directory.rglob('*.txt'))):
+        if position < skip:
+            continue
+        yield path.relative_to(directory).as_posix(), path.read_text(encoding='utf-8', errors='replace')
+
+
+def iter_mysql_cases(config, after_id=None):
+    """Yield (resource_id, content) from legal_resources in id order, after after_id."""
+    where = f"AND resource_id > {int(after_id)}" if after_id is not None else ''
+    for row in iter_mysql_documents(config, f"""
+        SELECT resource_id, content
+        FROM legal_resources
+        WHERE content IS NOT NULL {where}
+        ORDER BY resource_id
+    """):
+        yield row['resource_id'], row['content']
+
+
+def tag_chunk(texts):
+    """Worker task: classification of each text, without match positions."""
+    return [classify(text, positions=False) for text in texts]
+
+
+class JSONLinesWriter:
+    """Appends one {"key", "categories", "tags", "matches", ...} line per case."""
+
+    def __init__(self, path, offset=0):
+        self.path = Path(path)
+        self.file = open(self.path, 'a+b')
+        # Drop lines written after the last checkpoint so resumed cases are not duplicated
+        self.file.truncate(offset)
+        self.file.seek(offset)
+
+    def write(self, keys, results):
+        lines = (json.dumps({'key': key, **result}, ensure_ascii=False) + '\n' for key, result in zip(keys, results))
+        self.file.write(''.join(lines).encode('utf-8'))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return len(keys)
+
+    def position(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+class MySQLWriter:
+    """Writes tags (and optionally categories) back to legal_resources, one transaction per chunk."""
+
+    def __init__(self, config, category_column=None):
+        import mysql.connector
+
+        self.conn = mysql.connector.connect(**config)
+        self.category_column = category_column
+        assignments = 'tags = %s' + (f', `{category_column}` = %s' if category_column else '')
+        self.statement = f"UPDATE legal_resources SET {assignments} WHERE resource_id = %s"
+
+    def write(self, keys, results):
+        rows = []
+        for key, result in zip(keys, results):
+            if not isinstance(key, int):
+                continue   # Only rows identified by resource_id can be updated
+            # tags is a JSON column in database.sql
+            values = [json.dumps(result['tags'], ensure_ascii=False)]
+            if self.category_column:
+                values.append(','.join(result['categories']))
+            rows.append((*values, key))
+        cursor = self.conn.cursor()
+        try:
+            cursor.executemany(self.statement, rows)
+            self.conn.commit()
+        finally:
+            cursor.close()
+        return len(rows)
+
+    def position(self):
+        return None
+
+    def close(self):
+        self.conn.close()
+
+
+def load_checkpoint(path):
+    """The saved checkpoint, or None when there is none."""
+    if not path.exists():
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, checkpoint):
+    """Atomically replace the checkpoint file."""
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def run(cases, writer, checkpoint_path, checkpoint, workers=1, chunk_size=TAG_CHUNK, report=None):
+    """
+    Classify cases chunk by chunk and write the results in input order.
+    Args:
+        cases: Iterable of (key, text)
+        writer: JSONLinesWriter or MySQLWriter
+        checkpoint_path (Path): Where progress is saved after every written chunk
+        checkpoint (dict): Progress so far (position, last_key, written, ...), updated in place
+        workers (int): Processes classifying chunks; 1 classifies in this process
+        chunk_size (int): Cases per task and per write
+        report: Called with the checkpoint after every chunk, for progress output
+    Returns:
+        dict: The final checkpoint
+    """
+    def commit(keys, results):
+        checkpoint['written'] += writer.write(keys, results)
+        checkpoint['position'] += len(keys)
+        checkpoint['last_key'] = keys[-1]
+        checkpoint['output_offset'] = writer.position()
+        save_checkpoint(checkpoint_path, checkpoint)
+        if report:
+            report(checkpoint)
+
+    chunks = ((list(keys), list(texts)) for keys, texts in
+              (zip(*chunk) for chunk in chunked(cases, chunk_size)))
+    if workers <= 1:
+        for keys, texts in chunks:
+            commit(keys, tag_chunk(texts))
+        return checkpoint
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Submitted in order and collected in order, so the checkpoint position
+        # always covers a contiguous prefix of the input
+        pending = deque()
+        for keys, texts in chunks:
+            pending.append((keys, pool.submit(tag_chunk, texts)))
+            if len(pending) >= workers * CHUNKS_PER_WORKER:
+                keys, future = pending.popleft()
+                commit(keys, future.result())
+        while pending:
+            keys, future = pending.popleft()
+            commit(keys, future.result())
+    return checkpoint
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Classify and tag a whole corpus')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--json', help='Corpus JSON file ({"documents": [...]} or a list)')
+    source.add_argument('--dir', help='Directory of .txt case files (searched recursively)')
+    source.add_argument('--mysql', action='store_true', help='The legal_resources table (DB_HOST/DB_USER/DB_PASS/DB_NAME)')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--output', help='Write results as JSON lines to this file')
+    target.add_argument('--update_db', action='store_true', help='Write tags back to legal_resources with batched UPDATEs')
+    parser.add_argument('--category_column', help='--update_db: also store categories (comma-separated) in this column')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Classifier processes')
+    parser.add_argument('--chunk', type=int, default=TAG_CHUNK, help='Cases per task, write and checkpoint')
+    parser.add_argument('--checkpoint', help='Checkpoint file (default: next to the output, or bulk_tag.checkpoint.json)')
+    parser.add_argument('--restart', action='store_true', help='Ignore any checkpoint and start from the beginning')
+    args = parser.parse_args()
+
+    if args.json:
+        source_name = f"json:{args.json}"
+    elif args.dir:
+        source_name = f"dir:{args.dir}"
+    else:
+        source_name = 'mysql:legal_resources'
+    if args.checkpoint:
+        checkpoint_path = Path(args.checkpoint)
+    elif args.output:
+        checkpoint_path = Path(f"{args.output}.checkpoint.json")
+    else:
+        checkpoint_path = Path(__file__).parent / 'bulk_tag.checkpoint.json'
+
+    writer = None
+    try:
+        checkpoint = None if args.restart else load_checkpoint(checkpoint_path)
+        if checkpoint is not None and checkpoint.get('source') != source_name:
+            raise ValueError(f"Checkpoint {checkpoint_path} belongs to {checkpoint.get('source')}; use --restart")
+        resumed = checkpoint is not None
+        if checkpoint is None:
+            checkpoint = {'source': source_name, 'position': 0, 'last_key': None, 'written': 0, 'output_offset': 0}
+
+        if args.json:
+            cases = iter_json_cases(args.json, skip=checkpoint['position'])
+        elif args.dir:
+            cases = iter_dir_cases(args.dir, skip=checkpoint['position'])
+        else:
+            cases = iter_mysql_cases(MYSQL_CONFIG, after_id=checkpoint['last_key'])
+
+        if args.output:
+            writer = JSONLinesWriter(args.output, checkpoint['output_offset'] if resumed else 0)
+        else:
+            writer = MySQLWriter(MYSQL_CONFIG, args.category_column)
+
+        start = time.perf_counter()
+        start_position = checkpoint['position']
+
+        def report(state):
+            done = state['position'] - start_position
+            rate = done / max(time.perf_counter() - start, 1e-9)
+            print(f"tagged {state['position']} cases ({rate:.0f}/s)", file=sys.stderr)
+
+        run(cases, writer, checkpoint_path, checkpoint, args.workers, args.chunk, report)
+        elapsed = time.perf_counter() - start
+        done = checkpoint['position'] - start_position
+        response = {
+            'status': 'ok',
+            'source': source_name,
+            'resumed_from': start_position if resumed else None,
+            'tagged': done,
+            'written': checkpoint['written'],
+            'total': checkpoint['position'],
+            'seconds': round(elapsed, 2),
+            'cases_per_sec': round(done / elapsed, 1) if elapsed > 0 else None,
+            'workers': args.workers,
+        }
+    except Exception as e:
+        response = {'status': 'error', 'message': str(e)}
+    finally:
+        if writer is not None:
+            writer.close()
+
+    stream = sys.stdout if response['status'] == 'ok' else sys.stderr
+    print(json.dumps(response, ensure_ascii=False), file=stream)
+    return 0 if response['status'] == 'ok' else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+LexiAid Corpus Store
+Streaming document sources and an on-disk store for full document text.
+
+- iter_json_documents: parses legal_documents.json incrementally, one document
+  at a time, instead of json.load on the whole file
+- iter_mysql_documents: reads legal_resources through an unbuffered
+  (server-side) cursor in chunks of rows
+- DocumentStore: append-only JSON-lines file of full documents with an
+  offset table, so only lightweight records need to stay in memory; each
+  process keeps its own file
+- append_journal / iter_journal: JSON-lines log of incremental corpus
+  updates (add/update/delete), replayed after the corpus is loaded;
+  rotate_journal starts a new one once compaction has saved the corpus
+- write_json_documents: writes a corpus file in the shape iter_json_documents reads
+"""
+
+import itertools
+import json
+import logging
+import os
+import threading
+import weakref
+from array import array
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+# Characters read from the JSON file per refill of the parse buffer
+READ_BLOCK = 1 << 16
+# Rows fetched from MySQL per round trip
+FETCH_ROWS = 1000
+
+# The site's MySQL database (DB_HOST/DB_USER/DB_PASS/DB_NAME). The default
+# database is the one site/upload_case.php stores uploaded cases in, so scripts
+# that read or update legal_resources work on the same rows as the site.
+MYSQL_CONFIG = {
+    'host': os.environ.get('DB_HOST', 'localhost'),
+    'user': os.environ.get('DB_USER', 'root'),
+    'password': os.environ.get('DB_PASS', ''),
+    'database': os.environ.get('DB_NAME', 'lexiaid'),
+}
+
+
+def chunked(iterable, size):
+    """Yield lists of up to size items from iterable."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_json_documents(path, key='documents'):
+    """
+    Yield documents from a JSON file without loading it all at once.
+    Accepts either {"documents": [...]} or a top-level list.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = ''
+        pos = 0
+        eof = False
+
+        def refill():
+            # Drop consumed text and append the next block
+            nonlocal buffer, pos, eof
+            block = f.read(READ_BLOCK)
+            buffer = buffer[pos:] + block
+            pos = 0
+            eof = not block
+
+        # Find the opening bracket of the document array
+        while True:
+            stripped = buffer.lstrip()
+            if stripped.startswith('['):
+                pos = len(buffer) - len(stripped) + 1
+                break
+            marker = buffer.find(f'"{key}"')
+            bracket = buffer.find('[', marker) if marker != -1 else -1
+            if bracket != -1:
+                pos = bracket + 1
+                break
+            if eof:
+                raise ValueError(f"No '{key}' array found in {path}")
+            refill()
+
+        while True:
+            # Skip separators between array items
+            while True:
+                while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    break
+                refill()
+            if pos >= len(buffer):
+                raise ValueError(f"Unexpected end of file in {path}")
+            if buffer[pos] == ']':
+                return
+
+            try:
+                doc, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # The item continues past the buffer; read more and retry
+                refill()
+                continue
+            yield doc
+            pos = end
+
+
+def iter_mysql_documents(config, query, fetch_rows=FETCH_ROWS):
+    """
+    Yield rows of query as dicts, streamed from the server in chunks.
+    The cursor is unbuffered so the client never holds the full result set.
+    """
+    import mysql.connector
+
+    conn = mysql.connector.connect(**config)
+    try:
+        cursor = conn.cursor(dictionary=True, buffered=False)
+        try:
+            cursor.execute(query)
+            while True:
+                rows = cursor.fetchmany(fetch_rows)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
+
+def write_json_documents(path, documents, key='documents'):
+    """
+    Write documents as {"documents": [...]}, one document per line, replacing
+    path atomically so a reader never sees a partial corpus.
+    """
+    path = Path(path)
+    tmp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(f'{{\n    "{key}": [')
+        for position, doc in enumerate(documents):
+            f.write(',\n        ' if position else '\n        ')
+            f.write(json.dumps(doc, ensure_ascii=False))
+        f.write('\n    ]\n}\n')
+    os.replace(tmp, path)
+
+
+@contextmanager
+def _journal_locked(path):
+    """
+    Hold the journal's lock file. The daemon, the service and one-shot runs
+    append to the same journal, and compaction rotates it, under this lock.
+    """
+    with open(f'{path}.lock', 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            # Retries for 10 seconds, then raises OSError
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def append_journal(path, ops):
+    """
+    Append corpus update operations to a JSON-lines journal.
+    Returns:
+        tuple: (start, end) byte offsets of the appended lines
+    """
+    data = ''.join(json.dumps(op, ensure_ascii=False) + '\n' for op in ops).encode('utf-8')
+    with _journal_locked(path), open(path, 'ab') as f:
+        start = f.seek(0, os.SEEK_END)
+        f.write(data)
+        return start, start + len(data)
+
+
+def journal_size(path):
+    """Bytes of complete operations in a journal (0 if there is none)."""
+    with _journal_locked(path):
+        try:
+            return os.path.getsize(path)
+        except FileNotFoundError:
+            return 0
+
+
+def iter_journal(path, stop=None):
+    """Yield the operations recorded in a journal, oldest first, up to byte offset stop."""
+    if not Path(path).exists():
+        return
+    pos = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if stop is not None and pos >= stop:
+                break
+            pos += len(line)
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def rotate_journal(path, applied):
+    """
+    Replace a journal whose operations are now part of the saved corpus.
+    Lines outside the applied byte ranges were appended by another process
+    and not applied here, so they are carried over to the new journal.
+    Args:
+        path (Path): Journal file
+        applied (list): (start, end) byte ranges already applied to the saved corpus
+    """
+    with _journal_locked(path):
+        try:
+            data = Path(path).read_bytes()
+        except FileNotFoundError:
+            return
+        kept = bytearray()
+        pos = 0
+        for start, end in sorted(applied):
+            kept += data[pos:start]
+            pos = max(pos, end)
+        kept += data[pos:]
+        tmp = Path(f'{path}.{os.getpid()}.tmp')
+        tmp.write_bytes(kept)
+        os.replace(tmp, path)
+
+
+def document_key(doc):
+    """Stable external key of a document (its resource_id or id), or None."""
+    for field in ('resource_id', 'id'):
+        if doc.get(field) is not None:
+            return f"{field}:{doc[field]}"
+    return None
+
+
+def light_record(doc):
+    """The fields kept in memory for a document: everything except its full content."""
+    return {key: value for key, value in doc.items() if key != 'content'}
+
+
+# Store files are numbered per process, so every instance and rebuild gets its own
+_STORE_SEQUENCE = itertools.count()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    paths.clear()
+
+
+class DocumentStore:
+    def __init__(self, path):
+        """
+        Open a document store for the corpus at path (e.g. legal_documents.docs.jsonl).
+        The store is private to this instance: documents are written to
+        path's stem plus '.<pid>.<n>.jsonl', so engines in other processes (a daemon
+        and a one-shot CLI run) never read or replace each other's file.
+        The file is removed when the store is closed or the process exits.
+        """
+        self.base_path = Path(path)
+        self.path = self._new_path()
+        self.offsets = array('q')
+        self._writer = None
+        self._reader = None
+        self._tmp_path = None
+        self._lock = threading.Lock()
+        # Files this instance owns, removed by close() or at exit
+        self._owned = [self.path]
+        self._finalizer = weakref.finalize(self, _remove_files, self._owned)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _new_path(self):
+        base = self.base_path
+        return base.with_name(f"{base.stem}.{os.getpid()}.{next(_STORE_SEQUENCE)}{base.suffix}")
+
+    def _remove_stale(self):
+        """Delete store files left behind by processes that no longer run."""
+        if os.name != 'posix':
+            return
+        for path in self.base_path.parent.glob(f"{self.base_path.stem}.*{self.base_path.suffix}"):
+            pid = path.name[len(self.base_path.stem) + 1:].split('.', 1)[0]
+            if pid.isdigit() and int(pid) != os.getpid() and not _pid_alive(int(pid)):
+                _remove_files([path])
+
+    def reset(self):
+        """
+        Start writing a new store. Documents go to a new file until commit(),
+        so the previous one can still be read (compact() rebuilds from it).
+        """
+        self.close(remove=False)
+        self.offsets = array('q')
+        self.base_path.parent.mkdir(parents=True, exist_ok=True)
+        self._remove_stale()
+        self._tmp_path = self._new_path()
+        self._owned.append(self._tmp_path)
+        self._writer = open(self._tmp_path, 'wb')
+
+    def commit(self):
+        """Switch to the documents written since reset() and delete the previous file."""
+        if self._tmp_path is None:
+            self.flush()
+            return
+        self._writer.close()
+        self._writer = None
+        previous, self.path, self._tmp_path = self.path, self._tmp_path, None
+        self._owned.remove(previous)
+        _remove_files([previous])
+
+    def append(self, doc):
+        """Write a full document and return its id."""
+        if self._writer is None:
+            self._writer = open(self.path, 'ab')
+        with self._lock:
+            self._writer.seek(0, 2)
+            self.offsets.append(self._writer.tell())
+            self._writer.write(json.dumps(doc, ensure_ascii=False).encode('utf-8') + b'\n')
+            return len(self.offsets) - 1
+
+    def flush(self):
+        if self._writer is not None:
+            self._writer.flush()
+
+    def get(self, doc_id):
+        """Read one full document from disk."""
+        with self._lock:
+            if self._writer is not None:
+                self._writer.flush()
+            if self._tmp_path is not None:
+                raise RuntimeError("Document store is being rebuilt; call commit() first")
+            if self._reader is None:
+                self._reader = open(self.path, 'rb')
+            self._reader.seek(self.offsets[doc_id])
+            return json.loads(self._reader.readline().decode('utf-8'))
+
+    def __iter__(self):
+        """Yield every document stored at the time of the call, in id order."""
+        self.flush()
+        return self._read_all(self.path, len(self.offsets))
+
+    @staticmethod
+    def _read_all(path, count):
+        with open(path, 'rb') as f:
+            for _ in range(count):
+                yield json.loads(f.readline().decode('utf-8'))
+
+    def close(self, remove=True):
+        """Close the file handles and, unless remove is False, delete this store's files."""
+        for handle in (self._writer, self._reader):
+            if handle is not None:
+                handle.close()
+        self._writer = None
+        self._reader = None
+        if remove:
+            self._finalizer()
+        logging.debug(f"Closed document store {self.path}")
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+LexiAid Embedding Store
+Persistent on-disk cache of document embeddings keyed by model and text hash.
+
+Each model gets a raw float32 vector file that is memory-mapped on load, plus a
+JSON manifest mapping the SHA-1 of every encoded text to its row. Only texts
+whose hash is not in the manifest are sent to the model.
+
+Several processes may share one store: writers take a lock file, re-read the
+manifest, append at the real end of the vector file and replace the manifest
+atomically, so no process overwrites rows another has recorded.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from lazy_imports import lazy_import
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+# Loaded on first use (see lazy_imports.py)
+np = lazy_import('numpy')
+
+DEFAULT_CACHE_DIR = Path(__file__).parent / 'embedding_cache'
+
+
+def text_hash(text):
+    """Return the cache key for a text."""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingStore:
+    def __init__(self, model_name, cache_dir=None):
+        """Open (or create) the store for model_name under cache_dir."""
+        self.model_name = model_name
+        self.cache_dir = Path(cache_dir or DEFAULT_CACHE_DIR)
+        slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+        self.vectors_path = self.cache_dir / f"{slug}.f32"
+        self.manifest_path = self.cache_dir / f"{slug}.json"
+        self.lock_path = self.cache_dir / f"{slug}.lock"
+        self.dim = None
+        self.rows = {}
+        # Identifies one version of the vector file; prune() writes a new one
+        self.generation = None
+        # Rows appended by this instance but not yet in the manifest (see save())
+        self._pending = {}
+        self._manifest_stat = None
+        if self.manifest_path.exists():
+            with self._locked():
+                self._refresh()
+
+    @contextmanager
+    def _locked(self):
+        """
+        Hold the store's lock file. The daemon, the service and one-shot runs
+        share the cache, so every read of the manifest and every write of the
+        vector file happens under it.
+        """
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_path, 'a+b') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                # Retries for 10 seconds, then raises OSError
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _stored_rows(self):
+        """Whole rows in the vector file."""
+        try:
+            return self.vectors_path.stat().st_size // (4 * self.dim)
+        except FileNotFoundError:
+            return 0
+
+    def _refresh(self):
+        """
+        Bring rows up to date with the manifest on disk (call with the lock held).
+        Rows other processes added are picked up. If the vector file was rewritten
+        by prune(), rows this instance appended but had not saved are gone with it.
+        """
+        try:
+            stat = self.manifest_path.stat()
+            signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            signature = None
+        if signature == self._manifest_stat:
+            return
+        self._manifest_stat = signature
+        try:
+            if signature is None:
+                raise FileNotFoundError("no manifest")
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('model_name') != self.model_name:
+                raise ValueError("manifest belongs to a different model")
+            dim, rows, generation = manifest['dim'], manifest['rows'], manifest.get('generation')
+            stored = self.vectors_path.stat().st_size // (4 * dim) if self.vectors_path.exists() else 0
+            if rows and stored <= max(rows.values()):
+                raise ValueError("vector file is shorter than the manifest")
+        except (ValueError, KeyError, OSError) as e:
+            if signature is not None:
+                logging.warning(f"Ignoring embedding cache {self.manifest_path}: {e}")
+            dim, rows, generation = None, {}, None
+        if generation != self.generation:
+            self._pending = {}
+        self.dim, self.generation = dim, generation
+        self.rows = {**rows, **self._pending}
+
+    def _write_manifest(self):
+        """Atomically write the manifest next to the vector file (call with the lock held)."""
+        tmp_path = self.manifest_path.with_name(f"{self.manifest_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'model_name': self.model_name, 'dim': self.dim, 'generation': self.generation,
+                       'rows': self.rows}, f)
+        os.replace(tmp_path, self.manifest_path)
+        stat = self.manifest_path.stat()
+        self._manifest_stat = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        self._pending = {}
+
+    def _vectors(self):
+        """Memory-map the stored vectors."""
+        if not self.rows:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(self._stored_rows(), self.dim))
+
+    def encode(self, model, texts, save_manifest=True, batch_size=None):
+        """
+        Return embeddings for texts, encoding only those missing from the store.
+        Args:
+            model: Object with an encode(list_of_texts) method
+            texts (list): Texts to embed
+            save_manifest (bool): Write the manifest now; pass False when encoding
+                a corpus chunk by chunk and call save() once at the end
+            batch_size (int): Model batch size, or None for the model's default
+        Returns:
+            np.ndarray: float32 matrix with one row per text
+        """
+        hashes = [text_hash(text) for text in texts]
+        options = {'batch_size': batch_size} if batch_size else {}
+
+        with self._locked():
+            self._refresh()
+            missing = {}
+            for key, text in zip(hashes, texts):
+                if key not in self.rows and key not in missing:
+                    missing[key] = text
+
+        # The model runs without the lock; other processes may add rows meanwhile
+        new_vectors = np.asarray(model.encode(list(missing.values()), **options), dtype=np.float32) if missing else None
+        logging.info(f"Embedding cache: {len(texts) - len(missing)} cached, {len(missing)} encoded")
+
+        with self._locked():
+            self._refresh()
+            if missing:
+                new = [i for i, key in enumerate(missing) if key not in self.rows]
+                self._append([list(missing)[i] for i in new], new_vectors[new])
+            # Rows cached at the first look can vanish if another process pruned the file since
+            lost = {key: text for key, text in zip(hashes, texts) if key not in self.rows}
+            if lost:
+                self._append(list(lost), np.asarray(model.encode(list(lost.values()), **options), dtype=np.float32))
+            if save_manifest and self._pending:
+                self._write_manifest()
+
+            if not texts:
+                return np.zeros((0, self.dim or 0), dtype=np.float32)
+            rows = np.fromiter((self.rows[key] for key in hashes), dtype=np.int64, count=len(hashes))
+            return np.array(self._vectors()[rows])
+
+    def _append(self, keys, vectors):
+        """
+        Append new vectors at the end of the vector file and record their rows
+        (call with the lock held, after _refresh()).
+        """
+        if not keys:
+            return
+        if self.dim is None:
+            # No usable manifest: start a new vector file and publish it at once,
+            # so other processes append to it rather than replace it
+            self.dim = int(vectors.shape[1])
+            self.generation = uuid.uuid4().hex
+            self.rows = {}
+            self._pending = {}
+            with open(self.vectors_path, 'wb'):
+                pass
+            self._write_manifest()
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension changed from {self.dim} to {vectors.shape[1]}")
+
+        row_bytes = self.dim * 4
+        with open(self.vectors_path, 'r+b') as f:
+            # Start at the next whole row: a partial row left by an interrupted
+            # append is skipped, and rows other processes have not saved yet are kept
+            start = -(-f.seek(0, os.SEEK_END) // row_bytes)
+            f.seek(start * row_bytes)
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+
+        for offset, key in enumerate(keys):
+            self.rows[key] = start + offset
+            self._pending[key] = start + offset
+
+    def save(self):
+        """Write the manifest if rows were added since it was last saved."""
+        if not self._pending:
+            return
+        with self._locked():
+            self._refresh()
+            if self._pending:
+                self._write_manifest()
+
+    def prune(self, keys):
+        """Rewrite the store keeping only the embeddings whose text hash is in keys."""
+        with self._locked():
+            self._refresh()
+            keep = [key for key in dict.fromkeys(keys) if key in self.rows]
+            if len(keep) == len(self.rows):
+                return
+            vectors = self._vectors()
+            kept = np.array(vectors[[self.rows[key] for key in keep]]) if keep else None
+            del vectors
+            # A new file replaces the old one, so processes still reading the old one are unaffected
+            tmp_path = self.vectors_path.with_name(f"{self.vectors_path.name}.{os.getpid()}.tmp")
+            with open(tmp_path, 'wb') as f:
+                if kept is not None:
+                    f.write(np.ascontiguousarray(kept, dtype=np.float32).tobytes())
+            os.replace(tmp_path, self.vectors_path)
+            self.generation = uuid.uuid4().hex
+            self.rows = {key: row for row, key in enumerate(keep)}
+            self._write_manifest()
+        logging.info(f"Embedding cache pruned to {len(keep)} entries")
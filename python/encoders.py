@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+LexiAid Encoders
+Pluggable sentence encoders for the search engine.
+
+- torch: the SentenceTransformer model running in PyTorch (the reference)
+- onnx: the same transformer exported to ONNX and run by ONNX Runtime on CPU
+- onnx-int8: the ONNX model with its weights dynamically quantised to int8
+
+The ONNX backends tokenize with the model's own fast tokenizer, truncate at the
+model's max_seq_length and mean-pool over the attention mask exactly as
+SentenceTransformer does, so their embeddings match the PyTorch ones within
+PARITY_MIN_COSINE. Exporting needs PyTorch once; encoding afterwards only
+needs onnxruntime and tokenizers.
+
+Check parity and compare throughput on the corpus passages with:
+    python encoders.py --compare
+"""
+
+import argparse
+import json
+import logging
+import re
+import sys
+import time
+from pathlib import Path
+
+from lazy_imports import lazy_import
+
+# Loaded on first use (see lazy_imports.py)
+np = lazy_import('numpy')
+
+ENCODER_BACKENDS = ('torch', 'onnx', 'onnx-int8')
+DEFAULT_MODEL = 'all-MiniLM-L6-v2'
+ONNX_DIR = Path(__file__).parent / 'onnx_models'
+CORPUS_PATH = Path(__file__).parent / 'legal_documents.json'
+ONNX_OPSET = 14
+DEFAULT_BATCH_SIZE = 32
+
+# Least cosine similarity to the PyTorch embedding of the same text
+PARITY_MIN_COSINE = {
+    'onnx': 0.9999,
+    'onnx-int8': 0.98,
+}
+
+
+def encoder_name(model_name, backend='torch'):
+    """
+    Identity of the vectors a backend produces, for embedding caches and index
+    fingerprints. The fp32 ONNX model reproduces the PyTorch vectors, so the
+    two share cached embeddings; int8 vectors are kept apart.
+    """
+    return f"{model_name}@int8" if backend == 'onnx-int8' else model_name
+
+
+def import_backend(backend):
+    """Import the libraries backend runs on; for torch this is most of startup."""
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Unknown encoder '{backend}', expected one of {ENCODER_BACKENDS}")
+    if backend == 'torch':
+        import sentence_transformers  # noqa: F401
+    else:
+        import onnxruntime  # noqa: F401
+        import tokenizers  # noqa: F401
+
+
+def make_encoder(model_name=DEFAULT_MODEL, backend='torch'):
+    """Load model_name on the given backend."""
+    import_backend(backend)
+    if backend == 'torch':
+        return SentenceTransformerEncoder(model_name)
+    return ONNXEncoder(model_name, quantize=backend == 'onnx-int8')
+
+
+class SentenceTransformerEncoder:
+    backend = 'torch'
+
+    def __init__(self, model_name=DEFAULT_MODEL):
+        from sentence_transformers import SentenceTransformer
+        self.model_name = model_name
+        self.name = encoder_name(model_name, self.backend)
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts, batch_size=DEFAULT_BATCH_SIZE, **kwargs):
+        """Embed a text or a list of texts; same contract as SentenceTransformer.encode."""
+        return self.model.encode(texts, batch_size=batch_size, **kwargs)
+
+
+def _model_dir(model_name, model_dir=None):
+    slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+    return Path(model_dir or ONNX_DIR) / slug
+
+
+def export_onnx(model_name=DEFAULT_MODEL, model_dir=None, quantize=False):
+    """
+    Write the ONNX model, tokenizer and pooling settings for model_name.
+    The fp32 export loads the model in PyTorch; the int8 model is quantised
+    from the fp32 one.
+    Args:
+        model_name (str): SentenceTransformer model to export
+        model_dir (Path): Parent directory, ONNX_DIR by default
+        quantize (bool): Also write the int8 model
+    Returns:
+        Path: Directory holding model.onnx, model.int8.onnx and encoder.json
+    """
+    directory = _model_dir(model_name, model_dir)
+    fp32_path = directory / 'model.onnx'
+    if not fp32_path.exists():
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(model_name, device='cpu')
+        modules = list(model)
+        pooling = next((m for m in modules if type(m).__name__ == 'Pooling'), None)
+        if pooling is None or pooling.get_pooling_mode_str() != 'mean':
+            raise ValueError(f"{model_name} does not use mean pooling; only mean-pooled models can be exported")
+
+        tokenizer = model.tokenizer
+        transformer = modules[0].auto_model.eval()
+        sample = tokenizer(['LexiAid ONNX export'], return_tensors='pt')
+        # BERT-style forward order; models without token types take the first two
+        inputs = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+        axes = {name: {0: 'batch', 1: 'sequence'} for name in inputs + ['last_hidden_state']}
+
+        directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = directory / 'model.onnx.tmp'
+        with torch.no_grad():
+            torch.onnx.export(transformer, tuple(sample[name] for name in inputs), str(tmp_path),
+                              input_names=inputs, output_names=['last_hidden_state'],
+                              dynamic_axes=axes, opset_version=ONNX_OPSET, do_constant_folding=True)
+        tokenizer.save_pretrained(str(directory))
+        config = {
+            'model_name': model_name,
+            'max_seq_length': model.max_seq_length,
+            'normalize': any(type(m).__name__ == 'Normalize' for m in modules),
+            'pad_id': tokenizer.pad_token_id,
+            'pad_token': tokenizer.pad_token,
+        }
+        with open(directory / 'encoder.json', 'w', encoding='utf-8') as f:
+            json.dump(config, f, indent=2)
+        tmp_path.replace(fp32_path)
+        logging.info(f"Exported {model_name} to {fp32_path}")
+
+    int8_path = directory / 'model.int8.onnx'
+    if quantize and not int8_path.exists():
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        tmp_path = directory / 'model.int8.onnx.tmp'
+        quantize_dynamic(str(fp32_path), str(tmp_path), weight_type=QuantType.QInt8)
+        tmp_path.replace(int8_path)
+        logging.info(f"Quantised {model_name} to {int8_path}")
+    return directory
+
+
+class ONNXEncoder:
+    backend = 'onnx'
+
+    def __init__(self, model_name=DEFAULT_MODEL, quantize=False, model_dir=None):
+        """
+        Args:
+            model_name (str): SentenceTransformer model; exported on first use
+            quantize (bool): Run the int8 model instead of the fp32 one
+            model_dir (Path): Where exported models live, ONNX_DIR by default
+        """
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.model_name = model_name
+        self.quantize = quantize
+        self.backend = 'onnx-int8' if quantize else 'onnx'
+        self.name = encoder_name(model_name, self.backend)
+
+        directory = export_onnx(model_name, model_dir, quantize)
+        with open(directory / 'encoder.json', 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        self.max_seq_length = config['max_seq_length']
+        self.normalize = config['normalize']
+
+        self.tokenizer = Tokenizer.from_file(str(directory / 'tokenizer.json'))
+        self.tokenizer.enable_truncation(max_length=self.max_seq_length)
+        self.tokenizer.enable_padding(pad_id=config['pad_id'], pad_token=config['pad_token'])
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        path = directory / ('model.int8.onnx' if quantize else 'model.onnx')
+        self.session = ort.InferenceSession(str(path), options, providers=['CPUExecutionProvider'])
+        self.input_names = [node.name for node in self.session.get_inputs()]
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {
+            'input_ids': np.array([e.ids for e in encodings], dtype=np.int64),
+            'attention_mask': mask,
+            'token_type_ids': np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {name: feeds[name] for name in self.input_names})[0]
+        # Mean of the token vectors, ignoring padding
+        weights = mask[:, :, None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+        if self.normalize:
+            pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled.astype(np.float32)
+
+    def encode(self, texts, batch_size=DEFAULT_BATCH_SIZE, **kwargs):
+        """
+        Embed a text or a list of texts.
+        Args:
+            texts (str|list): Text(s) to embed
+            batch_size (int): Texts per ONNX Runtime call
+        Returns:
+            np.ndarray: float32 vector for a single text, otherwise one row per text
+        """
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        # Longest first, as SentenceTransformer does, so batches pad to similar lengths
+        order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+        batches = [self._encode_batch([texts[i] for i in order[start:start + batch_size]])
+                   for start in range(0, len(texts), batch_size)]
+        vectors = np.empty((len(texts), batches[0].shape[1]), dtype=np.float32)
+        vectors[order] = np.vstack(batches)
+        return vectors[0] if single else vectors
+
+
+def sample_texts(count, corpus_path=None):
+    """Passage texts from the search corpus, repeated up to count."""
+    from corpus_store import iter_json_documents
+    from passages import split_passages, passage_source, passage_texts
+
+    texts = []
+    for doc in iter_json_documents(corpus_path or CORPUS_PATH):
+        texts.extend(passage_texts(doc, split_passages(passage_source(doc))))
+        if len(texts) >= count:
+            break
+    if not texts:
+        raise ValueError("No documents to sample texts from")
+    return [texts[i % len(texts)] for i in range(count)]
+
+
+def _throughput(encoder, texts, batch_size):
+    encoder.encode(texts[:batch_size], batch_size=batch_size)   # warm-up
+    start = time.perf_counter()
+    vectors = np.asarray(encoder.encode(texts, batch_size=batch_size), dtype=np.float32)
+    return vectors, len(texts) / (time.perf_counter() - start)
+
+
+def compare(model_name=DEFAULT_MODEL, count=512, batch_size=DEFAULT_BATCH_SIZE, backends=('onnx', 'onnx-int8')):
+    """
+    Parity and throughput of the ONNX backends against PyTorch.
+    Embeddings are compared after L2 normalisation, since every index
+    normalises before scoring.
+    Returns:
+        dict: Per-backend texts/sec and, for ONNX, cosine to the PyTorch vectors
+    """
+    texts = sample_texts(count)
+    reference, rate = _throughput(make_encoder(model_name, 'torch'), texts, batch_size)
+    reference /= np.maximum(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12)
+    report = {'torch': {'texts_per_sec': round(rate, 1)}}
+    for backend in backends:
+        vectors, rate = _throughput(make_encoder(model_name, backend), texts, batch_size)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        cosines = (vectors * reference).sum(axis=1)
+        report[backend] = {
+            'texts_per_sec': round(rate, 1),
+            'speedup': round(rate / report['torch']['texts_per_sec'], 2),
+            'min_cosine': round(float(cosines.min()), 6),
+            'mean_cosine': round(float(cosines.mean()), 6),
+            'max_abs_diff': round(float(np.abs(vectors - reference).max()), 6),
+            'tolerance': PARITY_MIN_COSINE[backend],
+            'parity': bool(cosines.min() >= PARITY_MIN_COSINE[backend]),
+        }
+    return {'model': model_name, 'texts': count, 'batch_size': batch_size, 'backends': report}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the sentence encoder to ONNX and check it against PyTorch')
+    parser.add_argument('--model', default=DEFAULT_MODEL, help='SentenceTransformer model name')
+    parser.add_argument('--export', action='store_true', help='Export the fp32 and int8 ONNX models and exit')
+    parser.add_argument('--compare', action='store_true', help='Parity and throughput of onnx/onnx-int8 against torch')
+    parser.add_argument('--texts', type=int, default=512, help='Corpus passages encoded by --compare')
+    parser.add_argument('--batch_size', type=int, default=DEFAULT_BATCH_SIZE, help='Encoder batch size')
+    args = parser.parse_args()
+
+    try:
+        if args.export:
+            response = {'status': 'success', 'path': str(export_onnx(args.model, quantize=True))}
+        elif args.compare:
+            response = {'status': 'success', **compare(args.model, args.texts, args.batch_size)}
+            if not all(result.get('parity', True) for result in response['backends'].values()):
+                response['status'] = 'error'
+                response['message'] = 'ONNX embeddings differ from PyTorch beyond tolerance'
+        else:
+            parser.error('nothing to do: pass --export or --compare')
+    except Exception as e:
+        response = {'status': 'error', 'message': str(e)}
+
+    stream = sys.stdout if response['status'] == 'success' else sys.stderr
+    print(json.dumps(response, ensure_ascii=False, indent=2), file=stream)
+    return 0 if response['status'] == 'success' else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+LexiAid Keyword Index
+Inverted index with BM25 scoring shared by every keyword search fallback.
+
+Documents are tokenised once into postings (term -> doc ids and term
+frequencies). A query only touches the postings of its own terms, and top-k
+selection uses MaxScore pruning: once the k-th best score beats the best score
+the remaining terms could add, those terms stop admitting new candidates.
+
+Pure Python on purpose, so it keeps working when numpy or the ML stack is not
+available.
+"""
+
+import hashlib
+import heapq
+import json
+import logging
+import math
+import os
+import re
+from pathlib import Path
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+STOPWORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is',
+    'it', 'of', 'on', 'or', 'that', 'the', 'to', 'was', 'were', 'with',
+])
+
+
+def tokenize(text):
+    """Lowercase text and split it into index terms."""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def searchable_text(doc):
+    """The text of a document that keyword search matches against."""
+    return f"{doc.get('title', '')} {doc.get('content', '')} {doc.get('summary', '')} {' '.join(doc.get('tags', []))}"
+
+
+def document_digest(doc):
+    """Hash of one document's searchable text."""
+    return hashlib.sha1(searchable_text(doc).encode('utf-8')).digest()
+
+
+def corpus_fingerprint(documents):
+    """Hash of every document's searchable text, used to detect a stale saved index."""
+    digest = hashlib.sha1()
+    for doc in documents:
+        digest.update(document_digest(doc))
+    return digest.hexdigest()
+
+
+class KeywordIndex:
+    def __init__(self, k1=1.5, b=0.75):
+        """Create an empty BM25 index with the given parameters."""
+        self.k1 = k1
+        self.b = b
+        self.postings = {}      # term -> [doc_ids, term_frequencies]
+        self.max_tf = {}        # term -> highest frequency in any document
+        self.doc_lengths = []
+        self.total_length = 0
+        self.deleted = set()    # tombstoned doc ids, skipped by search
+        self.fingerprint = ''
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    @classmethod
+    def build(cls, documents, **params):
+        """
+        Build an index over documents (any iterable, read once); doc ids are
+        positions in iteration order.
+        """
+        index = cls(**params)
+        digest = hashlib.sha1()
+        for doc in documents:
+            index.add_document(doc)
+            digest.update(document_digest(doc))
+        index.fingerprint = digest.hexdigest()
+        logging.info(f"Built keyword index: {len(index)} documents, {len(index.postings)} terms")
+        return index
+
+    def add_document(self, doc):
+        """Index one document and return its id."""
+        doc_id = len(self.doc_lengths)
+        counts = {}
+        tokens = tokenize(searchable_text(doc))
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for term, tf in counts.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = [[], []]
+            posting[0].append(doc_id)
+            posting[1].append(tf)
+            if tf > self.max_tf.get(term, 0):
+                self.max_tf[term] = tf
+        self.doc_lengths.append(len(tokens))
+        self.total_length += len(tokens)
+        return doc_id
+
+    def delete_document(self, doc_id):
+        """Tombstone a document; its postings stay until the index is rebuilt."""
+        self.deleted.add(doc_id)
+
+    def _idf(self, term):
+        df = len(self.postings[term][0])
+        return math.log(1 + (len(self.doc_lengths) - df + 0.5) / (df + 0.5))
+
+    def _upper_bound(self, term):
+        """Highest score term can contribute to any document."""
+        tf = self.max_tf[term]
+        return self._idf(term) * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b))
+
+    def search(self, query, top_k=5, mask=None):
+        """
+        Rank documents for query with BM25.
+        Args:
+            query (str): The search query
+            top_k (int): Number of results to return
+            mask (sequence): Optional per-document booleans; False documents are never scored
+        Returns:
+            list: (doc_id, score) pairs, best first; score is normalised to [0, 1]
+        """
+        terms = [term for term in dict.fromkeys(tokenize(query)) if term in self.postings]
+        if not terms or top_k <= 0:
+            return []
+
+        bounds = {term: self._upper_bound(term) for term in terms}
+        terms.sort(key=bounds.get, reverse=True)
+        max_possible = sum(bounds.values())
+        avg_length = self.total_length / len(self.doc_lengths)
+
+        scores = {}
+        remaining = max_possible
+        for term in terms:
+            # Once the k-th best score exceeds what the remaining terms could
+            # add, documents not seen so far can no longer reach the top k
+            admit_new = True
+            if len(scores) >= top_k:
+                threshold = heapq.nlargest(top_k, scores.values())[-1]
+                admit_new = threshold < remaining
+
+            idf = self._idf(term)
+            doc_ids, tfs = self.postings[term]
+            for doc_id, tf in zip(doc_ids, tfs):
+                current = scores.get(doc_id)
+                if current is None and (not admit_new or doc_id in self.deleted
+                                        or (mask is not None and not mask[doc_id])):
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = (current or 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            remaining -= bounds[term]
+
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        return [(doc_id, score / max_possible) for doc_id, score in best]
+
+    def save(self, path):
+        """Write the index to a JSON file."""
+        data = {
+            'k1': self.k1,
+            'b': self.b,
+            'fingerprint': self.fingerprint,
+            'doc_lengths': self.doc_lengths,
+            'postings': self.postings,
+        }
+        tmp_path = Path(f"{path}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Read an index written by save()."""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        index = cls(k1=data['k1'], b=data['b'])
+        index.fingerprint = data['fingerprint']
+        index.doc_lengths = data['doc_lengths']
+        index.total_length = sum(index.doc_lengths)
+        index.postings = data['postings']
+        index.max_tf = {term: max(posting[1]) for term, posting in index.postings.items()}
+        return index
+
+
+def load_or_build(documents, path=None, fingerprint=None):
+    """
+    Return a keyword index for documents, reusing the one saved at path
+    when it was built from the same corpus.
+    """
+    fingerprint = fingerprint or corpus_fingerprint(documents)
+    if path and Path(path).exists():
+        try:
+            index = KeywordIndex.load(path)
+            if index.fingerprint == fingerprint:
+                return index
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Could not load keyword index {path}: {e}")
+
+    index = KeywordIndex.build(documents)
+    if path:
+        try:
+            index.save(path)
+        except OSError as e:
+            logging.warning(f"Could not save keyword index {path}: {e}")
+    return index
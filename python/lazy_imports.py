@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+LexiAid Lazy Imports
+Defers loading heavy modules until one of their attributes is first used.
+
+The search CLI often never needs numpy or the transformer stack: a running
+daemon answers the query, or the request is a journalled corpus update.
+lazy_import() registers a placeholder module that is executed on first
+attribute access, so those paths skip the cost entirely while code that does
+need the module keeps using it as a normal import.
+
+Modules share the placeholder by calling lazy_import() themselves: a plain
+`import numpy` statement inspects the module it finds in sys.modules, which
+is itself an attribute access and loads it on the spot.
+"""
+
+import importlib.util
+import sys
+
+
+def lazy_import(name):
+    """
+    Return module name, loaded on first attribute access.
+    Every lazy_import() of the same name receives the same placeholder, and an
+    already imported module is returned as is.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named '{name}'")
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
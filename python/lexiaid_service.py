@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+LexiAid Service
+One resident process answering search, tagging and brief requests over local HTTP.
+
+    POST /search     {"query", "top_k", "min_score", "search_method", "filters"}, as semantic_search.py
+    POST /documents  corpus add/update/delete/compact, as semantic_search.py --update
+    POST /tag        {"text"}, as auto_tag.py
+    POST /brief      {"text", "shared_encoder", "settings"}, as brief_generator.py
+    GET  /health     which models are loaded and how busy each endpoint is
+    GET  /metrics    request counters and latency histograms, Prometheus text format
+    GET  /stats      the same metrics as JSON
+
+Every model is loaded by the first request that needs it and then shared by
+all later requests. Each endpoint has its own pool of worker threads and a
+bounded queue in front of it: a request that finds the queue full is refused
+at once with HTTP 503 instead of waiting behind work that cannot catch up, and
+a burst of slow brief requests never holds up searches.
+
+The service listens where the search daemon does, so semantic_search.py
+forwards queries and corpus updates to it unchanged.
+
+Usage:
+    python lexiaid_service.py
+    python lexiaid_service.py --search_workers 4 --brief_workers 1 --preload search,tag
+"""
+
+import argparse
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import search_daemon
+from metrics import Metrics
+from result_cache import ResultCache, DEFAULT_CACHE_PATH
+
+ENDPOINTS = ('search', 'documents', 'tag', 'brief')
+# Worker threads per endpoint. Briefs are slow and memory hungry; corpus
+# updates are applied one at a time.
+DEFAULT_WORKERS = {'search': 4, 'documents': 1, 'tag': 2, 'brief': 1}
+# Requests allowed to wait for a worker before new ones get 503
+DEFAULT_QUEUE_SIZE = {'search': 64, 'documents': 16, 'tag': 64, 'brief': 8}
+MODELS = ('search', 'tag', 'brief')
+
+
+class LazyModel:
+    """A model loaded by the first request that needs it, then shared by every request."""
+
+    def __init__(self, name, load):
+        """
+        Args:
+            name (str): Name reported by /health
+            load: Function returning the loaded model
+        """
+        self.name = name
+        self._load = load
+        self._lock = threading.Lock()
+        self._model = None
+        self.load_seconds = None
+
+    def get(self):
+        if self._model is None:
+            with self._lock:
+                # A failed load raises to its request and is retried by the next one
+                if self._model is None:
+                    start = time.perf_counter()
+                    logging.info(f"Loading {self.name} model")
+                    self._model = self._load()
+                    self.load_seconds = round(time.perf_counter() - start, 2)
+                    logging.info(f"Loaded {self.name} model in {self.load_seconds}s")
+        return self._model
+
+    def stats(self):
+        return {'loaded': self._model is not None, 'load_seconds': self.load_seconds}
+
+
+class EndpointPool:
+    """Worker threads for one endpoint, with a bounded number of requests waiting for them."""
+
+    def __init__(self, name, workers, queue_size, metrics=None):
+        self.name = name
+        self.metrics = metrics
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f'{name}-worker')
+        # One slot per running or waiting request
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def run(self, fn, *args):
+        """
+        Run fn(*args) on one of the pool's workers and wait for its result.
+        Raises search_daemon.Overloaded when every worker is busy and the queue is full.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            self._record('rejected')
+            raise search_daemon.Overloaded(f"The {self.name} queue is full, retry later")
+        with self._lock:
+            self.in_flight += 1
+        start = time.perf_counter()
+        outcome = 'failed'
+        try:
+            response = self._executor.submit(fn, *args).result()
+            outcome = 'ok' if response.get('status') in ('success', 'ok') else 'error'
+            return response
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.completed += 1
+            self._slots.release()
+            self._record(outcome, (time.perf_counter() - start) * 1000)
+
+    def _record(self, outcome, ms=None):
+        # Queue wait is included: it is what the caller experiences
+        if self.metrics is None:
+            return
+        self.metrics.inc('service_requests_total', endpoint=self.name, outcome=outcome)
+        if ms is not None:
+            self.metrics.observe('service_request_ms', ms, endpoint=self.name)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'running': min(self.in_flight, self.workers),
+                'queued': max(0, self.in_flight - self.workers),
+                'completed': self.completed,
+                'rejected': self.rejected,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _text(payload):
+    text = payload.get('text') if isinstance(payload, dict) else None
+    if not isinstance(text, str) or len(text.strip()) < 30:
+        raise ValueError('Input text too short or missing.')
+    return text
+
+
+class LexiAidService:
+    """The models, endpoint pools and route handlers of one service process."""
+
+    def __init__(self, workers=None, queue_size=None, engine_options=None, cache_path=DEFAULT_CACHE_PATH):
+        """
+        Args:
+            workers (dict): Endpoint -> worker threads (defaults to DEFAULT_WORKERS)
+            queue_size (dict): Endpoint -> waiting requests allowed (defaults to DEFAULT_QUEUE_SIZE)
+            engine_options (dict): Keyword arguments for LegalSearchEngine
+            cache_path: Result cache for tags and briefs, or None to disable it
+        """
+        workers = {**DEFAULT_WORKERS, **(workers or {})}
+        queue_size = {**DEFAULT_QUEUE_SIZE, **(queue_size or {})}
+        self.metrics = Metrics()
+        self.metrics.describe('service_requests_total', 'Requests per endpoint, by outcome (ok, error, failed, rejected)')
+        self.metrics.describe('service_request_ms', 'Request latency per endpoint in milliseconds, queue wait included')
+        self.pools = {name: EndpointPool(name, workers[name], queue_size[name], self.metrics) for name in ENDPOINTS}
+        self.cache = ResultCache(cache_path) if cache_path else None
+        self.started = time.time()
+        engine_options = engine_options or {}
+
+        def load_search():
+            from semantic_search import LegalSearchEngine
+            return LegalSearchEngine(**engine_options)
+
+        def load_tagger():
+            import auto_tag
+            return auto_tag
+
+        def load_summarizer():
+            from brief_generator import load_model
+            return load_model()
+
+        self.models = {
+            'search': LazyModel('search', load_search),
+            'tag': LazyModel('tag', load_tagger),
+            'brief': LazyModel('brief', load_summarizer),
+        }
+
+    def search(self, payload):
+        from semantic_search import handle_request
+        return handle_request(self.models['search'].get(), payload)
+
+    def documents(self, payload):
+        from semantic_search import handle_update
+        return handle_update(self.models['search'].get(), payload)
+
+    def tag(self, payload):
+        try:
+            text = _text(payload)
+        except ValueError as e:
+            return {'status': 'error', 'message': str(e)}
+        auto_tag = self.models['tag'].get()
+        if self.cache is None:
+            result, cached = auto_tag.classify(text), False
+        else:
+            result, cached = auto_tag.cached_classify(text, self.cache)
+        return {'status': 'ok', **result, 'cached': cached}
+
+    def brief(self, payload):
+        try:
+            text = _text(payload)
+        except ValueError as e:
+            return {'status': 'error', 'message': str(e)}
+        from brief_generator import cached_briefs
+        options = {'shared_encoder': bool(payload.get('shared_encoder')), 'settings': payload.get('settings')}
+        stats = {}
+        # A cached brief is answered without loading the summarizer
+        [(brief, cached)] = cached_briefs([text], self.cache, self.models['brief'].get, stats=stats, **options)
+        response = {'status': 'ok', 'brief': brief, 'cached': cached}
+        if not cached:
+            response['stats'] = stats
+        return response
+
+    def routes(self):
+        """POST path -> handler running on that endpoint's pool."""
+        def pooled(name):
+            handler = getattr(self, name)
+            return lambda payload: self.pools[name].run(handler, payload)
+        return {f'/{name}': pooled(name) for name in ENDPOINTS}
+
+    def health(self):
+        return {
+            'status': 'ok',
+            'uptime_seconds': round(time.time() - self.started, 1),
+            'models': {name: model.stats() for name, model in self.models.items()},
+            'endpoints': {name: pool.stats() for name, pool in self.pools.items()},
+        }
+
+    def _search_engine(self):
+        """The search engine if it has been loaded (metrics never load it)."""
+        model = self.models['search']
+        return model.get() if model.stats()['loaded'] else None
+
+    def metrics_text(self):
+        """Service metrics, then the search engine's, in the Prometheus text format."""
+        engine = self._search_engine()
+        return self.metrics.render() + (engine.metrics_text() if engine else '')
+
+    def stats(self):
+        engine = self._search_engine()
+        return {
+            'status': 'ok',
+            'service': self.metrics.snapshot(),
+            'search': engine.metrics_snapshot() if engine else None,
+        }
+
+    def pages(self):
+        """GET path -> page function."""
+        return {'/health': self.health, '/metrics': self.metrics_text, '/stats': self.stats}
+
+    def preload(self, names):
+        """Load the named models now instead of on their first request."""
+        for name in names:
+            self.models[name].get()
+
+    def shutdown(self):
+        for pool in self.pools.values():
+            pool.shutdown()
+
+
+def main():
+    from semantic_search import INDEX_BACKENDS, ENCODER_BACKENDS
+
+    parser = argparse.ArgumentParser(description='Resident LexiAid search, tagging and brief service')
+    parser.add_argument('--host', default=search_daemon.DEFAULT_HOST, help='Listen address')
+    parser.add_argument('--port', type=int, default=search_daemon.DEFAULT_PORT, help='Listen port')
+    for name in ENDPOINTS:
+        parser.add_argument(f'--{name}_workers', type=int, default=DEFAULT_WORKERS[name],
+                            help=f'/{name}: worker threads')
+        parser.add_argument(f'--{name}_queue', type=int, default=DEFAULT_QUEUE_SIZE[name],
+                            help=f'/{name}: requests allowed to wait before 503')
+    parser.add_argument('--preload', default='', help=f"Comma-separated models to load at startup ({', '.join(MODELS)})")
+    parser.add_argument('--encoder', choices=ENCODER_BACKENDS, default='torch', help='Search sentence encoder')
+    parser.add_argument('--index', choices=sorted(INDEX_BACKENDS), default='flat', help='Search vector index backend')
+    parser.add_argument('--cache', default=str(DEFAULT_CACHE_PATH), help='Result cache for tags and briefs')
+    parser.add_argument('--no-cache', action='store_true', help='Do not cache tags and briefs')
+    args = parser.parse_args()
+    # Logging goes to search.log, as configured by semantic_search
+
+    preload = [name.strip() for name in args.preload.split(',') if name.strip()]
+    unknown = sorted(set(preload) - set(MODELS))
+    if unknown:
+        parser.error(f"Unknown model(s) to preload: {', '.join(unknown)}")
+
+    service = LexiAidService(
+        workers={name: getattr(args, f'{name}_workers') for name in ENDPOINTS},
+        queue_size={name: getattr(args, f'{name}_queue') for name in ENDPOINTS},
+        engine_options={'index_backend': args.index, 'encoder': args.encoder},
+        cache_path=None if args.no_cache else args.cache,
+    )
+    try:
+        service.preload(preload)
+        search_daemon.serve(service.routes(), args.host, args.port, pages=service.pages(), name='LexiAid service')
+    finally:
+        service.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
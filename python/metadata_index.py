@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+LexiAid Metadata Index
+Columnar document metadata for filtering searches before they are scored.
+
+Year is an integer column, jurisdiction and type are dictionary-encoded
+category columns, and every tag has its own postings list that is turned into
+a bitmap the first time a filter uses it. A filter becomes one boolean mask
+over document ids, which the vector and keyword indexes take so that rejected
+documents are never scored, instead of being dropped after top-k.
+
+Filters (all optional, combined with AND):
+    {"year": 1954}                 exact year
+    {"year_min": 1950, "year_max": 1970}
+    {"jurisdiction": "Federal"}    or a list, matching any of the values
+    {"type": ["case", "statute"]}
+    {"tags": ["Civil Rights"]}     a tag or a list; documents need every tag
+"""
+
+import re
+from array import array
+
+from lazy_imports import lazy_import
+
+# Loaded on first use (see lazy_imports.py)
+np = lazy_import('numpy')
+
+FILTER_FIELDS = ('year', 'year_min', 'year_max', 'jurisdiction', 'type', 'tags')
+CATEGORY_FIELDS = ('jurisdiction', 'type')
+
+# Stored for documents whose year is missing or not a number
+NO_YEAR = -1
+
+YEAR_PATTERN = re.compile(r'\d{4}')
+
+
+def parse_year(value):
+    """The year of a document as an int, or NO_YEAR."""
+    if isinstance(value, int):
+        return value
+    match = YEAR_PATTERN.search(str(value or ''))
+    return int(match.group()) if match else NO_YEAR
+
+
+def parse_tags(value):
+    """Normalised tags from a list or a comma-separated string (the MySQL column)."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    return [tag for tag in (str(tag).strip().lower() for tag in value) if tag]
+
+
+def validate_filters(filters):
+    """Raise ValueError if filters is not a filter object of known fields."""
+    if not isinstance(filters, dict):
+        raise ValueError("Filters must be a JSON object")
+    unknown = set(filters) - set(FILTER_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown filter field(s) {sorted(unknown)}, expected {FILTER_FIELDS}")
+
+
+def _values(value):
+    """A filter value as a list of normalised strings."""
+    if isinstance(value, (list, tuple)):
+        return [str(item).strip().lower() for item in value]
+    return [str(value).strip().lower()]
+
+
+class MetadataIndex:
+    def __init__(self):
+        """Empty index; document ids are positions in add() order."""
+        self.years = array('i')
+        self.categories = {field: {} for field in CATEGORY_FIELDS}    # field -> value -> code
+        self.codes = {field: array('i') for field in CATEGORY_FIELDS}  # field -> code per document
+        self.tag_postings = {}      # tag -> doc ids
+        self._tag_masks = {}        # tag -> bool array, built on first use
+        self._columns = {}          # numpy copies of the array columns
+
+    def __len__(self):
+        return len(self.years)
+
+    def add(self, doc):
+        """Record one document's metadata and return its id."""
+        doc_id = len(self.years)
+        self.years.append(parse_year(doc.get('year')))
+        for field in CATEGORY_FIELDS:
+            value = doc.get(field)
+            if value is None or value == '':
+                self.codes[field].append(-1)
+                continue
+            mapping = self.categories[field]
+            key = str(value).strip().lower()
+            if key not in mapping:
+                mapping[key] = len(mapping)
+            self.codes[field].append(mapping[key])
+        for tag in dict.fromkeys(parse_tags(doc.get('tags'))):
+            postings = self.tag_postings.get(tag)
+            if postings is None:
+                postings = self.tag_postings[tag] = array('i')
+            postings.append(doc_id)
+        self._tag_masks.clear()
+        self._columns.clear()
+        return doc_id
+
+    def _column(self, name):
+        column = self._columns.get(name)
+        if column is None:
+            source = self.years if name == 'year' else self.codes[name]
+            column = self._columns[name] = np.array(source, dtype=np.int32)
+        return column
+
+    def tag_mask(self, tag):
+        """Bitmap of the documents carrying tag."""
+        mask = self._tag_masks.get(tag)
+        if mask is None:
+            mask = np.zeros(len(self), dtype=bool)
+            postings = self.tag_postings.get(tag)
+            if postings is not None:
+                mask[np.frombuffer(postings, dtype=np.int32)] = True
+            self._tag_masks[tag] = mask
+        return mask
+
+    def mask(self, filters):
+        """
+        Boolean mask of the documents matching filters.
+        Args:
+            filters (dict): See the module docstring
+        Returns:
+            np.ndarray: One bool per document, or None when filters is empty
+        """
+        if not filters:
+            return None
+        validate_filters(filters)
+
+        mask = np.ones(len(self), dtype=bool)
+        if filters.get('year') is not None:
+            mask &= self._column('year') == int(filters['year'])
+        if filters.get('year_min') is not None:
+            mask &= self._column('year') >= int(filters['year_min'])
+        if filters.get('year_max') is not None:
+            years = self._column('year')
+            mask &= (years <= int(filters['year_max'])) & (years != NO_YEAR)
+        for field in CATEGORY_FIELDS:
+            if filters.get(field) is None:
+                continue
+            mapping = self.categories[field]
+            wanted = [mapping[value] for value in _values(filters[field]) if value in mapping]
+            mask &= np.isin(self._column(field), wanted)
+        for tag in parse_tags(filters.get('tags')):
+            mask &= self.tag_mask(tag)
+        return mask
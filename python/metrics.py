@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+LexiAid Metrics
+Thread-safe counters, gauges and latency histograms with labels, rendered as
+JSON (for --stats and /stats) or in the Prometheus text format (for /metrics).
+
+Histograms have fixed millisecond buckets, so recording is O(log buckets) and
+memory does not grow with traffic; percentiles are estimated from the buckets.
+"""
+
+import threading
+from bisect import bisect_left
+
+# Upper bounds (ms) of the latency histogram buckets
+DEFAULT_BUCKETS_MS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class Histogram:
+    """Counts of observed values per bucket, with their sum and maximum."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS_MS):
+        self.buckets = tuple(sorted(buckets))
+        # The last count is for values above the largest bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (the maximum for the overflow bucket)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return round(min(bound, self.max), 3)
+        return round(self.max, 3)
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean_ms': round(self.sum / self.count, 3) if self.count else None,
+            'p50_ms': self.quantile(0.5),
+            'p95_ms': self.quantile(0.95),
+            'p99_ms': self.quantile(0.99),
+            'max_ms': round(self.max, 3),
+        }
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _label_text(key):
+    return ','.join(f'{name}={value}' for name, value in key)
+
+
+def _prometheus_labels(key, extra=()):
+    pairs = [*key, *extra]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Metrics:
+    """A registry of named, labelled counters, gauges and histograms."""
+
+    def __init__(self, prefix='lexiaid'):
+        """
+        Args:
+            prefix (str): Prepended to every metric name in the Prometheus output
+        """
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._help = {}
+
+    def describe(self, name, text):
+        """Help text shown for name in the Prometheus output."""
+        self._help[name] = text
+
+    def inc(self, name, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(self, name, value_ms, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value_ms)
+
+    def snapshot(self):
+        """
+        Every metric as plain data.
+        Returns:
+            dict: counters, gauges and histograms, each name -> {"label=value,...": value}
+        """
+        with self._lock:
+            return {
+                'counters': {name: {_label_text(key): value for key, value in series.items()}
+                             for name, series in self._counters.items()},
+                'gauges': {name: {_label_text(key): value for key, value in series.items()}
+                           for name, series in self._gauges.items()},
+                'histograms': {name: {_label_text(key): hist.snapshot() for key, hist in series.items()}
+                               for name, series in self._histograms.items()},
+            }
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format."""
+        lines = []
+
+        def header(name, kind):
+            full = f'{self.prefix}_{name}'
+            if name in self._help:
+                lines.append(f'# HELP {full} {self._help[name]}')
+            lines.append(f'# TYPE {full} {kind}')
+            return full
+
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                full = header(name, 'counter')
+                for key, value in sorted(series.items()):
+                    lines.append(f'{full}{_prometheus_labels(key)} {value}')
+            for name, series in sorted(self._gauges.items()):
+                full = header(name, 'gauge')
+                for key, value in sorted(series.items()):
+                    lines.append(f'{full}{_prometheus_labels(key)} {value}')
+            for name, series in sorted(self._histograms.items()):
+                full = header(name, 'histogram')
+                for key, hist in sorted(series.items()):
+                    cumulative = 0
+                    for bound, n in zip(hist.buckets, hist.counts):
+                        cumulative += n
+                        lines.append(f'{full}_bucket{_prometheus_labels(key, [("le", bound)])} {cumulative}')
+                    lines.append(f'{full}_bucket{_prometheus_labels(key, [("le", "+Inf")])} {hist.count}')
+                    lines.append(f'{full}_sum{_prometheus_labels(key)} {round(hist.sum, 3)}')
+                    lines.append(f'{full}_count{_prometheus_labels(key)} {hist.count}')
+        return ''.join(line + '\n' for line in lines)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+LexiAid Micro-Batching
+Collects concurrent requests on an asyncio event loop into small batches.
+
+The first request of a batch waits at most max_wait_ms for others to arrive
+(or until max_batch are queued); the whole batch is then handed to a
+synchronous function on a worker thread, and each caller's future is resolved
+with its own result. While one batch is being processed new requests keep
+queueing, so batches grow on their own under load.
+"""
+
+import asyncio
+import logging
+from collections import deque
+
+DEFAULT_MAX_BATCH = 32
+DEFAULT_MAX_WAIT_MS = 5.0
+
+
+class MicroBatcher:
+    def __init__(self, process_batch, max_batch=DEFAULT_MAX_BATCH, max_wait_ms=DEFAULT_MAX_WAIT_MS, executor=None):
+        """
+        Args:
+            process_batch: Function taking a list of items and returning one result per item
+            max_batch (int): Largest batch handed to process_batch
+            max_wait_ms (float): Longest a request waits for others to join its batch
+            executor: concurrent.futures executor for process_batch, or None for the loop's default
+        """
+        self.process_batch = process_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.executor = executor
+        self.batches = 0
+        self.items = 0
+        self._pending = deque()
+        self._arrived = None
+        self._task = None
+
+    async def submit(self, item):
+        """Queue item and wait for its result."""
+        loop = asyncio.get_running_loop()
+        if self._task is None:
+            self._arrived = asyncio.Event()
+            self._task = loop.create_task(self._run())
+        future = loop.create_future()
+        self._pending.append((item, future))
+        self._arrived.set()
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._arrived.wait()
+            # Give other requests up to max_wait to join the first one
+            deadline = loop.time() + self.max_wait
+            while len(self._pending) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                self._arrived.clear()
+                try:
+                    await asyncio.wait_for(self._arrived.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            batch = [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+            if not self._pending:
+                self._arrived.clear()
+            if not batch:
+                continue
+
+            self.batches += 1
+            self.items += len(batch)
+            try:
+                results = await loop.run_in_executor(self.executor, self.process_batch, [item for item, _ in batch])
+            except Exception as e:
+                logging.error(f"Micro-batch of {len(batch)} failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self):
+        """Batch counters for reporting."""
+        return {
+            'batches': self.batches,
+            'requests': self.items,
+            'mean_batch': round(self.items / self.batches, 2) if self.batches else 0.0,
+            'max_batch': self.max_batch,
+            'max_wait_ms': self.max_wait * 1000.0
+        }
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+LexiAid Passages
+Splits documents into overlapping passages for embedding.
+
+Sentence encoders such as all-MiniLM-L6-v2 truncate their input at 256 word
+pieces, so a long opinion embedded as a single string is represented by its
+opening paragraphs only. Each document is instead cut into overlapping windows
+of PASSAGE_WORDS words that are embedded separately; a document scores as its
+best passage.
+
+Chunking multiplies the number of vectors, so the passage -> document map is
+kept in flat typed arrays (PassageMap) rather than one dict per passage.
+"""
+
+import re
+from array import array
+
+from lazy_imports import lazy_import
+
+# Loaded on first use (see lazy_imports.py)
+np = lazy_import('numpy')
+
+# Words per passage; roughly 200 word pieces, inside the encoder's 256 limit
+PASSAGE_WORDS = 160
+# Words shared by consecutive passages, so a sentence split at a boundary
+# still appears whole in one of them
+PASSAGE_OVERLAP = 40
+
+WORD_PATTERN = re.compile(r'\S+')
+
+
+def passage_source(doc):
+    """The text of a document that is split into passages."""
+    return doc.get('content', doc.get('summary', ''))
+
+
+def split_passages(text, words=PASSAGE_WORDS, overlap=PASSAGE_OVERLAP):
+    """
+    Cut text into overlapping windows of words.
+    Args:
+        text (str): Text to split
+        words (int): Words per passage
+        overlap (int): Words shared by consecutive passages
+    Returns:
+        list: (start, end) character offsets into text; at least one span,
+              so every document is searchable
+    """
+    bounds = [match.span() for match in WORD_PATTERN.finditer(text)]
+    if len(bounds) <= words:
+        return [(0, len(text))]
+
+    stride = max(1, words - overlap)
+    spans = []
+    for first in range(0, len(bounds), stride):
+        last = min(first + words, len(bounds)) - 1
+        spans.append((bounds[first][0], bounds[last][1]))
+        if last == len(bounds) - 1:
+            break
+    return spans
+
+
+def passage_texts(doc, spans):
+    """The strings embedded for a document's passages, each prefixed with its title."""
+    text = passage_source(doc)
+    return [f"{doc['title']}. {text[start:end]}" for start, end in spans]
+
+
+class PassageMap:
+    def __init__(self):
+        """Empty map; row i of the passage matrix is passage i here."""
+        self.doc_ids = array('i')
+        self.starts = array('i')
+        self.ends = array('i')
+        self._doc_array = None
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def add(self, doc_id, spans):
+        """Record the passages of one document, in row order."""
+        for start, end in spans:
+            self.doc_ids.append(doc_id)
+            self.starts.append(start)
+            self.ends.append(end)
+        self._doc_array = None
+
+    def span(self, row):
+        """Character offsets of the passage stored at row."""
+        return self.starts[row], self.ends[row]
+
+    def doc_array(self):
+        """Document id of every row as a numpy array (cached until the next add)."""
+        if self._doc_array is None or len(self._doc_array) != len(self.doc_ids):
+            self._doc_array = np.array(self.doc_ids, dtype=np.int64)
+        return self._doc_array
+
+    def best_per_document(self, scores, rows, k):
+        """
+        Max-pool passage hits to documents.
+        Args:
+            scores (np.ndarray): Passage scores for one query, best first
+            rows (np.ndarray): Passage rows matching scores; -1 marks padding
+            k (int): Number of documents wanted
+        Returns:
+            tuple: (doc_ids, scores, rows) of each document's best passage, best first
+        """
+        valid = rows >= 0
+        scores = scores[valid]
+        rows = rows[valid]
+        docs = self.doc_array()[rows]
+        # Hits are sorted, so a document's first occurrence is its best passage
+        _, first = np.unique(docs, return_index=True)
+        first = np.sort(first)[:k]
+        return docs[first], scores[first], rows[first]
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+LexiAid Quantization
+Compressed storage for the embedding matrix behind the vector indexes.
+
+- float16: half-precision copy of every vector (2x smaller)
+- int8: scalar quantisation with one scale per dimension (4x smaller)
+- pq: product quantisation; each vector is split into `subspaces` slices and
+  every slice stored as the id of its nearest of 256 trained centroids
+  (dim * 4 / subspaces times smaller, e.g. 192x for 384 dims and 8 subspaces)
+
+Only the codes stay resident. Candidates are scored on the codes, and the best
+`rerank` of them are re-scored exactly against full-precision vectors read
+from a memory-mapped float32 file, so the page cache rather than the process
+holds the float32 matrix.
+"""
+
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+from lazy_imports import lazy_import
+
+# Loaded on first use (see lazy_imports.py)
+np = lazy_import('numpy')
+
+# Rows decoded at once when scoring the whole matrix, to bound temporary memory
+SCORE_BLOCK = 65536
+# Candidates re-scored exactly per query
+DEFAULT_RERANK = 256
+# Product quantisation: slices per vector and centroids per slice
+PQ_SUBSPACES = 8
+PQ_CENTROIDS = 256
+
+
+class Float16Quantizer:
+    kind = 'float16'
+
+    def train(self, vectors):
+        return self
+
+    def encode(self, vectors):
+        return vectors.astype(np.float16)
+
+    def score(self, queries, codes):
+        """Approximate inner products of queries with a block of codes."""
+        return queries @ codes.astype(np.float32).T
+
+    def state(self):
+        return {}
+
+    @classmethod
+    def from_state(cls, data):
+        return cls()
+
+
+class Int8Quantizer:
+    kind = 'int8'
+
+    def __init__(self):
+        self.scales = None
+
+    def train(self, vectors):
+        """Pick each dimension's scale so its largest magnitude maps to 127."""
+        peak = np.abs(vectors).max(axis=0) if len(vectors) else np.ones(vectors.shape[1], dtype=np.float32)
+        self.scales = (np.maximum(peak, 1e-12) / 127.0).astype(np.float32)
+        return self
+
+    def encode(self, vectors):
+        return np.clip(np.rint(vectors / self.scales), -127, 127).astype(np.int8)
+
+    def score(self, queries, codes):
+        # Fold the scales into the query instead of decoding every code
+        return (queries * self.scales) @ codes.astype(np.float32).T
+
+    def state(self):
+        return {'scales': self.scales}
+
+    @classmethod
+    def from_state(cls, data):
+        quantizer = cls()
+        quantizer.scales = data['scales']
+        return quantizer
+
+
+class PQQuantizer:
+    kind = 'pq'
+
+    def __init__(self, subspaces=PQ_SUBSPACES, train_iters=10, seed=0):
+        self.subspaces = subspaces
+        self.train_iters = train_iters
+        self.seed = seed
+        self.centroids = None   # (subspaces, PQ_CENTROIDS, dim // subspaces)
+
+    def _split(self, vectors):
+        n, dim = vectors.shape
+        if dim % self.subspaces:
+            raise ValueError(f"Embedding dimension {dim} is not divisible by {self.subspaces} PQ subspaces")
+        return vectors.reshape(n, self.subspaces, dim // self.subspaces)
+
+    def train(self, vectors):
+        """k-means in every subspace on a sample of vectors."""
+        rng = np.random.default_rng(self.seed)
+        sample = vectors[rng.choice(len(vectors), min(len(vectors), PQ_CENTROIDS * 64), replace=False)]
+        parts = self._split(sample)
+        k = min(PQ_CENTROIDS, len(sample))
+        centroids = np.zeros((self.subspaces, PQ_CENTROIDS, parts.shape[2]), dtype=np.float32)
+        for s in range(self.subspaces):
+            points = parts[:, s, :]
+            current = points[rng.choice(len(points), k, replace=False)].copy()
+            for _ in range(self.train_iters):
+                assign = self._nearest(points, current)
+                sums = np.zeros_like(current)
+                np.add.at(sums, assign, points)
+                counts = np.bincount(assign, minlength=k)
+                empty = counts == 0
+                # Re-seed empty clusters from random sample points
+                sums[empty] = points[rng.choice(len(points), int(empty.sum()))]
+                counts[empty] = 1
+                current = sums / counts[:, None]
+            centroids[s, :k] = current
+            # Unused slots (tiny corpora) repeat the first centroid and are never chosen
+            centroids[s, k:] = current[0]
+        self.centroids = centroids
+        logging.info(f"Trained PQ codebooks: {self.subspaces} subspaces x {k} centroids")
+        return self
+
+    @staticmethod
+    def _nearest(points, centroids):
+        # argmin of squared distance, dropping the constant |x|^2 term
+        return np.argmax(points @ centroids.T - 0.5 * (centroids ** 2).sum(axis=1), axis=1)
+
+    def encode(self, vectors):
+        parts = self._split(vectors)
+        codes = np.empty((len(vectors), self.subspaces), dtype=np.uint8)
+        for s in range(self.subspaces):
+            codes[:, s] = self._nearest(parts[:, s, :], self.centroids[s])
+        return codes
+
+    def score(self, queries, codes):
+        """Asymmetric distance computation: per-query lookup tables summed over subspaces."""
+        tables = np.einsum('qsd,scd->qsc', self._split(queries), self.centroids)
+        scores = np.zeros((len(queries), len(codes)), dtype=np.float32)
+        for s in range(self.subspaces):
+            scores += tables[:, s, codes[:, s]]
+        return scores
+
+    def state(self):
+        return {'centroids': self.centroids}
+
+    @classmethod
+    def from_state(cls, data):
+        quantizer = cls(subspaces=len(data['centroids']))
+        quantizer.centroids = data['centroids']
+        return quantizer
+
+
+QUANTIZERS = {
+    'float16': Float16Quantizer,
+    'int8': Int8Quantizer,
+    'pq': PQQuantizer,
+}
+
+
+def make_quantizer(kind, **params):
+    """Create an untrained quantizer of the given kind."""
+    if kind not in QUANTIZERS:
+        raise ValueError(f"Unknown quantisation '{kind}', expected one of {sorted(QUANTIZERS)}")
+    return QUANTIZERS[kind](**params)
+
+
+class QuantizedVectors:
+    """
+    Resident codes plus full-precision vectors for exact re-ranking.
+    The full-precision rows live in a memory-mapped file; rows added after it
+    was written are kept in a small in-memory tail until the next save().
+    """
+
+    def __init__(self, quantizer):
+        self.quantizer = quantizer
+        self.codes = None
+        self.full = None
+        self.tail = None
+        self._file = None
+
+    def __len__(self):
+        return 0 if self.codes is None else len(self.codes)
+
+    @property
+    def nbytes(self):
+        """Resident size of the codes and the in-memory tail."""
+        return self.codes.nbytes + self.tail.nbytes
+
+    def build(self, vectors):
+        """Train the quantizer on normalised float32 vectors and encode them."""
+        self.quantizer.train(vectors)
+        self.codes = self._encode(vectors)
+        # Spill the full-precision rows to an anonymous file until save() names one
+        self._file = tempfile.TemporaryFile()
+        self._file.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        self._file.flush()
+        self.full = self._map(self._file, len(vectors), vectors.shape[1])
+        self.tail = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        return self
+
+    def _encode(self, vectors):
+        return np.concatenate([
+            self.quantizer.encode(vectors[start:start + SCORE_BLOCK])
+            for start in range(0, len(vectors), SCORE_BLOCK)
+        ]) if len(vectors) else self.quantizer.encode(vectors)
+
+    @staticmethod
+    def _map(source, rows, dim):
+        if not rows:
+            return np.zeros((0, dim), dtype=np.float32)
+        return np.memmap(source, dtype=np.float32, mode='r', shape=(rows, dim))
+
+    def add(self, vectors):
+        """Encode and append normalised vectors."""
+        self.codes = np.concatenate([self.codes, self.quantizer.encode(vectors)])
+        self.tail = np.vstack([self.tail, vectors.astype(np.float32)])
+
+    def approx(self, queries, rows=None):
+        """
+        Scores of queries against the codes, all rows or only rows.
+        Returns:
+            np.ndarray: (len(queries), n) float32 approximate inner products
+        """
+        if rows is not None:
+            return self.quantizer.score(queries, self.codes[rows])
+        scores = np.empty((len(queries), len(self.codes)), dtype=np.float32)
+        for start in range(0, len(self.codes), SCORE_BLOCK):
+            block = self.codes[start:start + SCORE_BLOCK]
+            scores[:, start:start + len(block)] = self.quantizer.score(queries, block)
+        return scores
+
+    def exact(self, rows):
+        """Full-precision vectors for rows, read from the memory map and tail."""
+        rows = np.asarray(rows, dtype=np.int64)
+        base = len(self.full)
+        out = np.empty((len(rows), self.tail.shape[1]), dtype=np.float32)
+        in_file = rows < base
+        # Sorted reads keep memory-map access sequential
+        order = np.argsort(rows[in_file])
+        file_rows = rows[in_file][order]
+        out_idx = np.flatnonzero(in_file)[order]
+        out[out_idx] = self.full[file_rows]
+        out[~in_file] = self.tail[rows[~in_file] - base]
+        return out
+
+    def rerank(self, query, candidates, k):
+        """Exact scores of candidate rows for one query, top k best first."""
+        if not len(candidates):
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+        sims = self.exact(candidates) @ query
+        order = np.argsort(-sims, kind='stable')[:k]
+        return sims[order], candidates[order]
+
+    def state(self, prefix='q_'):
+        """Arrays to save alongside an index (the full-precision rows go to their own file)."""
+        data = {f'{prefix}{key}': value for key, value in self.quantizer.state().items()}
+        data[f'{prefix}kind'] = self.quantizer.kind
+        data[f'{prefix}codes'] = self.codes
+        data[f'{prefix}dim'] = self.tail.shape[1]
+        return data
+
+    def save_full(self, path):
+        """Write the full-precision rows to path and map them from there."""
+        path = Path(path)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            for start in range(0, len(self.full), SCORE_BLOCK):
+                f.write(np.ascontiguousarray(self.full[start:start + SCORE_BLOCK]).tobytes())
+            f.write(self.tail.tobytes())
+        # Replace rather than rewrite, so other processes keep their old mapping
+        os.replace(tmp_path, path)
+        rows, dim = len(self.codes), self.tail.shape[1]
+        self.full = self._map(path, rows, dim)
+        self.tail = np.zeros((0, dim), dtype=np.float32)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @classmethod
+    def load(cls, data, full_path, prefix='q_'):
+        """Rebuild from arrays written by state() and the file written by save_full()."""
+        kind = str(data[f'{prefix}kind'])
+        quantizer = QUANTIZERS[kind].from_state({
+            key[len(prefix):]: data[key] for key in data.files
+            if key.startswith(prefix) and key not in (f'{prefix}kind', f'{prefix}codes', f'{prefix}dim')
+        })
+        dim = int(data[f'{prefix}dim'])
+        vectors = cls(quantizer)
+        vectors.codes = data[f'{prefix}codes']
+        expected = len(vectors.codes) * dim * 4
+        if not Path(full_path).exists() or Path(full_path).stat().st_size != expected:
+            raise ValueError(f"Full-precision vectors {full_path} do not match the index")
+        vectors.full = cls._map(full_path, len(vectors.codes), dim)
+        vectors.tail = np.zeros((0, dim), dtype=np.float32)
+        return vectors
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+LexiAid Query Cache
+Thread-safe LRU cache with optional time-to-live and hit/miss counters,
+used by LegalSearchEngine for query embeddings and result lists.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+# Returned by get() on a miss, so None can be cached as a value
+MISSING = object()
+
+
+def normalize_query(query):
+    """Cache key form of a query: lowercased with whitespace collapsed."""
+    return ' '.join(query.lower().split())
+
+
+class LRUCache:
+    def __init__(self, maxsize=1024, ttl=None):
+        """
+        Args:
+            maxsize (int): Maximum number of entries; 0 disables the cache
+            ttl (float): Seconds an entry stays valid, or None for no expiry
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        """Return the cached value for key, or MISSING."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                self.evictions += 1
+            self.misses += 1
+            return MISSING
+
+    def put(self, key, value):
+        """Store value under key, evicting the least recently used entries."""
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry; counters are kept."""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Counters for reporting in responses."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+LexiAid Result Cache
+Content-addressed store for generated briefs (and the chunk summaries of long
+cases) and tags.
+
+Results are keyed by a hash of the normalised case text together with a
+namespace naming what produced them (the summarization model and brief
+settings, or the CATEGORY_KEYWORDS version), so changing the model or the
+keywords never serves stale results. Entries live in one SQLite file; when
+its contents grow past max_bytes the least recently used entries are evicted.
+
+A cache that cannot be opened, read or written behaves as an empty one: it
+never makes a brief or tagging request fail.
+
+Usage:
+    python result_cache.py --stats
+    python result_cache.py --clear
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+from pathlib import Path
+
+DEFAULT_CACHE_PATH = Path(os.environ.get('LEXIAID_RESULT_CACHE', Path(__file__).parent / 'result_cache.sqlite3'))
+# Total size of cached values before least recently used entries are evicted
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# Eviction frees space down to this fraction of max_bytes, so it does not run on every put
+EVICT_TO = 0.9
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    namespace TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_accessed ON results (accessed_at);
+"""
+
+
+def normalize_text(text):
+    """Text as it is hashed: Unicode NFC with runs of whitespace collapsed to one space."""
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def cache_key(namespace, text):
+    """Hex SHA-256 of namespace and normalised text."""
+    return hashlib.sha256(f"{namespace}\0{normalize_text(text)}".encode('utf-8')).hexdigest()
+
+
+def config_digest(config):
+    """Short stable hash of a JSON-serialisable configuration, for use in namespaces."""
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+
+class ResultCache:
+    """SQLite-backed LRU of JSON results, safe to share between threads and processes."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Args:
+            path (str|Path): SQLite file, created on first use
+            max_bytes (int): Size budget for cached values
+        """
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+    def _connect(self):
+        """This thread's connection (sqlite3 connections are not shared across threads)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        """
+        Look up a result and mark it as recently used.
+        Returns:
+            The cached value, or None on a miss
+        """
+        try:
+            conn = self._connect()
+            row = conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            return json.loads(row[0])
+        except sqlite3.Error as e:
+            print(f"Result cache unavailable: {e}", file=sys.stderr)
+            return None
+
+    def put(self, key, value, namespace=''):
+        """Store a result, evicting least recently used entries if the cache is over budget."""
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO results (key, namespace, value, size, created_at, accessed_at)"
+                         " VALUES (?, ?, ?, ?, ?, ?)", (key, namespace, data, len(data.encode('utf-8')), now, now))
+            self._evict(conn)
+        except sqlite3.Error as e:
+            print(f"Result cache unavailable: {e}", file=sys.stderr)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = total - int(self.max_bytes * EVICT_TO)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            freed = 0
+            for key, size in conn.execute("SELECT key, size FROM results ORDER BY accessed_at").fetchall():
+                if freed >= target:
+                    break
+                conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                freed += size
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def stats(self):
+        """Entries and bytes per namespace, and the size budget."""
+        rows = self._connect().execute(
+            "SELECT namespace, COUNT(*), COALESCE(SUM(size), 0) FROM results GROUP BY namespace").fetchall()
+        return {
+            'path': str(self.path),
+            'max_bytes': self.max_bytes,
+            'entries': sum(row[1] for row in rows),
+            'bytes': sum(row[2] for row in rows),
+            'namespaces': {row[0]: {'entries': row[1], 'bytes': row[2]} for row in rows},
+        }
+
+    def clear(self):
+        """Remove every entry."""
+        self._connect().execute("DELETE FROM results")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or clear the brief and tag result cache')
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument('--stats', action='store_true', help='Entries and size per namespace')
+    mode.add_argument('--clear', action='store_true', help='Remove every cached result')
+    parser.add_argument('--cache', default=str(DEFAULT_CACHE_PATH), help='SQLite cache file')
+    args = parser.parse_args()
+
+    try:
+        cache = ResultCache(args.cache)
+        if args.clear:
+            cache.clear()
+        response = {'status': 'ok', **cache.stats()}
+    except Exception as e:
+        response = {'status': 'error', 'message': str(e)}
+
+    print(json.dumps(response, ensure_ascii=False))
+    return 0 if response['status'] == 'ok' else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
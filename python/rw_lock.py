@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+LexiAid Readers-Writer Lock
+Lets any number of searches run at once while corpus updates run alone.
+
+Searches only read the engine's indexes; adds, updates, deletes and
+compaction modify or swap them. Readers therefore share the lock and a writer
+waits until every reader has left. A thread that holds the write side may
+take either side again, so update_document can call add_documents and a
+delete can trigger compaction.
+
+New readers are admitted while a writer waits, so a hybrid search's worker
+threads can join the read side their caller already holds. Searches are
+short, so a waiting writer still gets its turn between them.
+"""
+
+import threading
+from contextlib import contextmanager
+
+
+class ReadWriteLock:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = None
+        self._depth = 0
+
+    @contextmanager
+    def read(self):
+        """Hold the shared side for the with-block."""
+        me = threading.get_ident()
+        with self._cond:
+            while self._writer is not None and self._writer != me:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        """Hold the exclusive side for the with-block (re-entrant)."""
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer != me:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+                self._writer = me
+            self._depth += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._depth -= 1
+                if not self._depth:
+                    self._writer = None
+                    self._cond.notify_all()
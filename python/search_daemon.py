@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+LexiAid Search Daemon
+Serves search requests from a resident LegalSearchEngine over local HTTP.
+
+The daemon speaks the same JSON shape that semantic_search.py reads from stdin:
+POST /search with {"query": ..., "top_k": ..., "min_score": ...} and it answers
+with the same response object the CLI prints. Other POST routes (such as
+/documents for corpus updates) are supplied by the caller of serve(), and so are
+GET pages such as /health, /metrics (Prometheus text format) and /stats.
+
+A route handler that cannot take more work raises Overloaded; the request is
+answered with HTTP 503 so the client can back off instead of queueing.
+
+serve() handles each connection on its own thread; serve_async() runs every
+connection on one asyncio event loop, so route handlers can be coroutines that
+batch concurrent requests (see micro_batch.py).
+"""
+
+import json
+import logging
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import request as urlrequest
+from urllib import error as urlerror
+
+DEFAULT_HOST = os.environ.get('LEXIAID_SEARCH_HOST', '127.0.0.1')
+DEFAULT_PORT = int(os.environ.get('LEXIAID_SEARCH_PORT', '8765'))
+
+# Requests larger than this are rejected before being read
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class Overloaded(Exception):
+    """Raised by a route handler whose queue is full; answered with HTTP 503."""
+
+
+# Content type of pages answered with text instead of JSON (the Prometheus text format)
+TEXT_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def query_daemon(payload, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=10.0, path='/search'):
+    """
+    Send a request to a running daemon.
+    Returns the decoded response, or None if the daemon is not reachable.
+    """
+    url = f"http://{host}:{port}{path}"
+    body = json.dumps(payload).encode('utf-8')
+    req = urlrequest.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    try:
+        with urlrequest.urlopen(req, timeout=timeout) as resp:
+            return json.loads(resp.read().decode('utf-8'))
+    except urlerror.HTTPError as e:
+        # The daemon answered; pass its JSON error body through if there is one
+        try:
+            return json.loads(e.read().decode('utf-8'))
+        except (ValueError, OSError):
+            logging.warning(f"Search daemon returned HTTP {e.code}")
+            return None
+    except (urlerror.URLError, OSError, ValueError) as e:
+        logging.info(f"Search daemon unavailable at {url}: {e}")
+        return None
+
+
+def fetch_page(path, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=10.0):
+    """
+    GET a page from a running daemon.
+    Returns the decoded JSON (or the text of a text page), or None if the daemon is not reachable.
+    """
+    url = f"http://{host}:{port}{path}"
+    try:
+        with urlrequest.urlopen(url, timeout=timeout) as resp:
+            body = resp.read().decode('utf-8')
+            if resp.headers.get_content_type() == 'application/json':
+                return json.loads(body)
+            return body
+    except (urlerror.URLError, OSError, ValueError) as e:
+        logging.info(f"Search daemon page unavailable at {url}: {e}")
+        return None
+
+
+def _route(routes, method, path, length, pages=None):
+    """
+    Check a request before its body is read.
+    Returns (handler, None) for a valid POST, otherwise (None, (code, response)).
+    """
+    if method == 'GET':
+        page = (pages or {}).get(path.partition('?')[0])
+        if page is not None:
+            try:
+                return None, (200, page())
+            except Exception as e:
+                logging.error(f"daemon - GET {path} failed: {e}")
+                return None, (500, {'status': 'error', 'message': str(e)})
+        if path == '/health':
+            return None, (200, {'status': 'ok'})
+        return None, (404, {'status': 'error', 'message': 'Not found'})
+    handler = routes.get(path) if method == 'POST' else None
+    if handler is None:
+        return None, (404, {'status': 'error', 'message': 'Not found'})
+    if length <= 0 or length > MAX_BODY_BYTES:
+        return None, (400, {'status': 'error', 'message': 'Invalid request body'})
+    return handler, None
+
+
+def _decode(body):
+    """Decoded JSON payload, or None if body is not JSON."""
+    try:
+        return json.loads(body.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _status_code(response):
+    # Search answers 'success'; tagging and briefs answer 'ok' like their scripts
+    return 200 if response.get('status') in ('success', 'ok') else 400
+
+
+def _encode(data):
+    """(content type, body bytes) of a response: text for a str, JSON otherwise."""
+    if isinstance(data, str):
+        return TEXT_CONTENT_TYPE, data.encode('utf-8')
+    return 'application/json; charset=utf-8', json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+def _call(handler, payload, peer):
+    """Run a synchronous route handler. Returns (code, response)."""
+    try:
+        response = handler(payload)
+        return _status_code(response), response
+    except Overloaded as e:
+        return 503, {'status': 'error', 'message': str(e) or 'Server busy, retry later'}
+    except Exception as e:
+        logging.error(f"daemon {peer} - handler error: {e}")
+        return 500, {'status': 'error', 'message': str(e)}
+
+
+BAD_JSON = (400, {'status': 'error', 'message': 'Request body must be JSON'})
+
+
+class SearchRequestHandler(BaseHTTPRequestHandler):
+    """HTTP handler that forwards JSON requests to the server's route handlers."""
+
+    def do_GET(self):
+        self._send_json(*_route(self.server.routes, 'GET', self.path, 0, self.server.pages)[1])
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        handler, error = _route(self.server.routes, 'POST', self.path, length, self.server.pages)
+        if error:
+            self._send_json(*error)
+            return
+
+        payload = _decode(self.rfile.read(length))
+        if payload is None:
+            self._send_json(*BAD_JSON)
+            return
+
+        self._send_json(*_call(handler, payload, self.address_string()))
+
+    def _send_json(self, code, data):
+        content_type, body = _encode(data)
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Route access logs to search.log instead of stderr
+        logging.info(f"daemon {self.address_string()} - {format % args}")
+
+
+def serve(routes, host=DEFAULT_HOST, port=DEFAULT_PORT, pages=None, name='Search daemon'):
+    """
+    Serve requests until interrupted.
+    routes maps a POST path (e.g. '/search') to a function that takes the
+    decoded request payload and returns a response dict. pages maps a GET
+    path (e.g. '/health', '/metrics') to a function taking no arguments that
+    returns a response dict, or a str to be sent as text/plain.
+    """
+    server = ThreadingHTTPServer((host, port), SearchRequestHandler)
+    server.daemon_threads = True
+    server.routes = routes
+    server.pages = pages
+    logging.info(f"{name} listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logging.info(f"{name} stopped")
+
+
+async def _handle_connection(reader, writer, routes, pages=None):
+    """Answer HTTP/1.1 requests on one connection (keep-alive aware)."""
+    import asyncio
+    peer = writer.get_extra_info('peername')
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line.strip():
+                break
+            method, path, version = request_line.decode('latin-1').split()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            length = int(headers.get('content-length') or 0)
+            handler, error = _route(routes, method, path, length, pages)
+            keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+            if handler is not None:
+                payload = _decode(await reader.readexactly(length))
+                if payload is None:
+                    error = BAD_JSON
+            elif 0 < length <= MAX_BODY_BYTES:
+                # Consume the rejected body so the next request starts cleanly
+                await reader.readexactly(length)
+            elif length:
+                keep_alive = False
+            if error:
+                code, response = error
+            else:
+                try:
+                    response = await handler(payload)
+                    code = _status_code(response)
+                except Overloaded as e:
+                    code, response = 503, {'status': 'error', 'message': str(e) or 'Server busy, retry later'}
+                except Exception as e:
+                    logging.error(f"daemon {peer} - handler error: {e}")
+                    code, response = 500, {'status': 'error', 'message': str(e)}
+
+            content_type, body = _encode(response)
+            reason = {200: 'OK', 503: 'Service Unavailable'}.get(code, 'Error')
+            writer.write(
+                f"HTTP/1.1 {code} {reason}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + body
+            )
+            await writer.drain()
+            logging.info(f"daemon {peer} - {method} {path} {code}")
+            if not keep_alive:
+                break
+    except (ValueError, asyncio.IncompleteReadError, ConnectionError) as e:
+        logging.warning(f"daemon {peer} - dropped connection: {e}")
+    finally:
+        writer.close()
+
+
+def serve_async(routes, host=DEFAULT_HOST, port=DEFAULT_PORT, pages=None):
+    """
+    Serve requests from a single asyncio event loop until interrupted.
+    routes maps a POST path to a coroutine function that takes the decoded
+    request payload and returns a response dict; pages is as for serve().
+    """
+    # Imported on use: clients of the daemon only need query_daemon()
+    import asyncio
+
+    async def run():
+        server = await asyncio.start_server(lambda reader, writer: _handle_connection(reader, writer, routes, pages),
+                                            host, port)
+        logging.info(f"Search daemon (asyncio) listening on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logging.info("Search daemon stopped")
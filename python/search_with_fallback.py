@@ -6,64 +6,55 @@ import json
 import sys
 import argparse
 from pathlib import Path
-import re
 
-def simple_keyword_search(query, documents, top_k=5):
+from keyword_index import KeywordIndex, load_or_build
+
+def simple_keyword_search(query, documents, top_k=5, index=None):
     """Fallback keyword-based search when ML models are unavailable"""
-    query_words = set(query.lower().split())
+    if index is None:
+        index = KeywordIndex.build(documents)
+
     results = []
-    
-    for doc in documents:
-        # Create searchable text
-        searchable = f"{doc['title']} {doc['content']} {' '.join(doc.get('tags', []))}".lower()
-        
-        # Count keyword matches
-        matches = sum(1 for word in query_words if word in searchable)
-        
-        if matches > 0:
-            # Simple relevance score based on keyword matches and length
-            score = matches / len(query_words)
-            
-            results.append({
-                'title': doc['title'],
-                'summary': doc['content'][:200] + '...' if len(doc['content']) > 200 else doc['content'],
-                'similarity_score': score,
-                'tags': doc.get('tags', []),
-                'year': doc.get('year', 'N/A')
-            })
-    
-    # Sort by score and return top results
-    results.sort(key=lambda x: x['similarity_score'], reverse=True)
-    return results[:top_k]
+    for doc_id, score in index.search(query, top_k):
+        doc = documents[doc_id]
+        results.append({
+            'title': doc['title'],
+            'summary': doc['content'][:200] + '...' if len(doc['content']) > 200 else doc['content'],
+            'similarity_score': score,
+            'tags': doc.get('tags', []),
+            'year': doc.get('year', 'N/A')
+        })
+    return results
 
-def semantic_search_with_fallback(query, documents, top_k=5, min_score=0.3):
+def semantic_search_with_fallback(query, documents, top_k=5, min_score=0.3, keyword_index=None):
     """Try semantic search, fallback to keyword search if needed"""
     try:
         # Try to import and use SentenceTransformers
         from sentence_transformers import SentenceTransformer
-        import numpy as np
-        from sklearn.metrics.pairwise import cosine_similarity
+        # The engine's flat index instead of scikit-learn's cosine_similarity,
+        # which costs far more to import than the search itself
+        from vector_index import make_index
         
         # Load model (with timeout protection)
         model = SentenceTransformer('all-MiniLM-L6-v2')
         
-        # Encode documents
+        # Encode documents, reusing cached vectors for unchanged texts. The cache
+        # directory is this script's own: LegalSearchEngine prunes its store for the
+        # same model down to the engine's corpus, which would drop these vectors
+        from embedding_store import EmbeddingStore, DEFAULT_CACHE_DIR
         texts = [f"{doc['title']}. {doc['content']}" for doc in documents]
-        doc_embeddings = model.encode(texts)
+        doc_embeddings = EmbeddingStore('all-MiniLM-L6-v2', DEFAULT_CACHE_DIR / 'search_with_fallback').encode(model, texts)
         
         # Encode query
         query_embedding = model.encode(query)
         
-        # Calculate similarities
-        similarities = cosine_similarity([query_embedding], doc_embeddings)[0]
-        
-        # Get top results
-        top_indices = np.argsort(similarities)[::-1]
+        # Top results by cosine similarity, best first
+        scores, ids = make_index('flat').build(doc_embeddings).search(query_embedding, min(top_k, len(documents)))
         
         results = []
-        for idx in top_indices:
-            score = float(similarities[idx])
-            if score < min_score:
+        for score, idx in zip(scores[0], ids[0]):
+            score = float(score)
+            if idx < 0 or score < min_score:
                 break
                 
             doc = documents[idx]
@@ -74,16 +65,13 @@ def semantic_search_with_fallback(query, documents, top_k=5, min_score=0.3):
                 'tags': doc.get('tags', []),
                 'year': doc.get('year', 'N/A')
             })
-            
-            if len(results) >= top_k:
-                break
         
         return results
         
     except Exception as e:
         # Fallback to keyword search
         print(f"Using keyword search fallback: {e}", file=sys.stderr)
-        return simple_keyword_search(query, documents, top_k)
+        return simple_keyword_search(query, documents, top_k, keyword_index)
 
 def main():
     parser = argparse.ArgumentParser(description='Legal document search with fallback')
@@ -102,8 +90,11 @@ def main():
         if not documents:
             raise ValueError("No documents found in JSON file")
         
+        # Keyword index is built once per corpus and saved next to it
+        keyword_index = load_or_build(documents, json_path.with_suffix('.keyword.json'))
+
         # Perform search
-        results = semantic_search_with_fallback(args.query, documents, args.top_k, args.min_score)
+        results = semantic_search_with_fallback(args.query, documents, args.top_k, args.min_score, keyword_index)
         
         response = {
             'status': 'success',
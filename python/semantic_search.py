@@ -4,16 +4,41 @@ LexiAid Semantic Search Engine
 AI-powered legal document search using transformer models
 """
 
+import time
+_IMPORT_START = time.perf_counter()
+
 import sys
 import json
 import argparse
+import hashlib
 import os
-import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
 import logging
 from pathlib import Path
 
+from lazy_imports import lazy_import
+
+# numpy is only loaded once a search or corpus load touches it, so forwarding a
+# query to the daemon or journalling an update never pays for it
+np = lazy_import('numpy')
+
+import search_daemon
+from embedding_store import EmbeddingStore, text_hash
+from vector_index import make_index, load_index, validate_index_params, INDEX_BACKENDS
+from keyword_index import KeywordIndex, load_or_build, document_digest
+from corpus_store import (DocumentStore, iter_json_documents, write_json_documents, chunked, light_record,
+                          document_key, append_journal, iter_journal, journal_size, rotate_journal)
+from query_cache import LRUCache, MISSING, normalize_query
+from passages import PassageMap, split_passages, passage_source, passage_texts
+from metadata_index import MetadataIndex, validate_filters
+from encoders import ENCODER_BACKENDS, encoder_name, import_backend, make_encoder
+from metrics import Metrics
+from rw_lock import ReadWriteLock
+
+# Time spent importing this module, reported by --profile-startup
+IMPORT_MS = (time.perf_counter() - _IMPORT_START) * 1000
+
 # Set up logging to file only (not to stdout to avoid interfering with JSON output)
 log_file = Path(__file__).parent / 'search.log'
 logging.basicConfig(
@@ -24,14 +49,157 @@ logging.basicConfig(
     ]
 )
 
+CORPUS_PATH = Path(__file__).parent / 'legal_documents.json'
+# Incremental corpus updates, replayed on top of CORPUS_PATH at load
+JOURNAL_PATH = CORPUS_PATH.with_suffix('.updates.jsonl')
+
+SEARCH_METHODS = ('auto', 'semantic', 'keyword', 'hybrid')
+UPDATE_OPS = ('add', 'update', 'delete')
+# Index parameters that only affect searching; changing them keeps a saved index valid
+SEARCH_PARAMS = ('nprobe', 'rerank')
+
+# Reciprocal-rank fusion constant; larger values flatten the rank curve
+RRF_K = 60
+# Each hybrid component may take this long before its results are dropped
+HYBRID_TIMEOUT = 2.0
+# Candidates pulled from each component per requested result in hybrid mode
+HYBRID_CANDIDATES = 4
+# Model batch size for encoding many queries at once
+BATCH_ENCODE_SIZE = 64
+# Model batch size for encoding document passages
+PASSAGE_BATCH_SIZE = 128
+# Passages retrieved per requested document before max-pooling to documents;
+# widened automatically when one document's passages crowd out the rest
+PASSAGE_OVERSAMPLE = 4
+# Requests read from stdin per search_many call in --jsonl mode
+JSONL_BATCH = 256
+# Documents read, stored and embedded per ingest step
+INGEST_CHUNK = 512
+# Compact once tombstones exceed this share of the corpus (and COMPACT_MIN_DELETED)
+COMPACT_RATIO = 0.2
+COMPACT_MIN_DELETED = 50
+# Query embedding and result list caches (entries, seconds)
+QUERY_CACHE_SIZE = 4096
+QUERY_CACHE_TTL = 24 * 3600
+RESULT_CACHE_SIZE = 1024
+RESULT_CACHE_TTL = 300
+
+# load_timings phases as reported by the metrics (the startup_ms gauge)
+STARTUP_PHASES = {
+    'model_import': 'model_import',
+    'model_load': 'model_load',
+    'documents': 'corpus_load',
+    'encode': 'corpus_encode',
+    'vector_index': 'vector_index',
+    'keyword_index': 'keyword_index',
+    'journal_replay': 'journal_replay',
+}
+# Per-search phases recorded in the timings block and the phase_ms histograms
+SEARCH_PHASES = ('query_encode', 'similarity', 'top_k', 'keyword', 'result_construction')
+
+@contextmanager
+def _phase(timings, name):
+    """Add the time spent in the with-block to timings[f'{name}_ms'] (if timings is a dict)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            key = f'{name}_ms'
+            timings[key] = round(timings.get(key, 0.0) + (time.perf_counter() - start) * 1000, 3)
+
+class CorpusReadError(Exception):
+    """The corpus JSON file could not be read or parsed."""
+
+def _read_corpus(path):
+    """iter_json_documents, with read and parse errors raised as CorpusReadError."""
+    try:
+        yield from iter_json_documents(path)
+    except (OSError, UnicodeDecodeError, ValueError) as e:
+        # json.JSONDecodeError is a ValueError
+        raise CorpusReadError(f"{path}: {e}") from e
+
+def _check_deadline(deadline):
+    """Raise TimeoutError once time.monotonic() has passed deadline (None: no deadline)."""
+    if deadline is not None and time.monotonic() > deadline:
+        raise TimeoutError("Search deadline passed")
+
+def _new_metrics():
+    metrics = Metrics()
+    metrics.describe('search_requests_total', 'Searches answered, by the method that ran')
+    metrics.describe('search_fallbacks_total', 'Searches that fell back from the requested method, by reason')
+    metrics.describe('search_latency_ms', 'End-to-end search latency in milliseconds, by method')
+    metrics.describe('search_phase_ms', 'Time per search phase in milliseconds')
+    metrics.describe('search_batches_total', 'search_many calls')
+    metrics.describe('search_batch_latency_ms', 'search_many latency in milliseconds')
+    metrics.describe('startup_ms', 'Milliseconds spent per load phase since the engine started')
+    metrics.describe('cache_hits', 'Query embedding and result cache hits')
+    metrics.describe('cache_misses', 'Query embedding and result cache misses')
+    metrics.describe('documents', 'Live documents in the corpus')
+    return metrics
+
 class LegalSearchEngine:
-    def __init__(self, model_name='all-MiniLM-L6-v2'):
-        """Initialize the search engine with the specified transformer model."""
+    def __init__(self, model_name='all-MiniLM-L6-v2', index_backend='flat', index_params=None,
+                 result_cache_size=RESULT_CACHE_SIZE, encoder='torch', corpus_path=None, embedding_cache_dir=None):
+        """
+        Initialize the search engine with the specified transformer model.
+        Args:
+            model_name (str): SentenceTransformer model to embed documents with
+            index_backend (str): Vector index backend, 'flat' (exact), 'ivf' (approximate)
+                or 'sharded' (exact, scored by a pool of worker processes)
+            index_params (dict): Backend parameters, e.g. {'nlist': 256, 'nprobe': 8} for 'ivf',
+                or {'quantize': 'int8', 'rerank': 256} for compressed vector storage,
+                or {'shards': 32, 'workers': 32} for 'sharded'
+            result_cache_size (int): Cached result lists; 0 disables the result cache
+            encoder (str): Encoder backend, 'torch' (SentenceTransformer), 'onnx' (ONNX Runtime)
+                or 'onnx-int8' (ONNX Runtime with int8 weights); see encoders.py
+            corpus_path (Path): Corpus JSON file (CORPUS_PATH by default). The document store,
+                saved indexes and update journal are kept next to it.
+            embedding_cache_dir (Path): Passage embedding cache (embedding_store's default if None)
+        """
+        self.model_name = model_name
+        self.encoder = encoder
+        # Identity of the vectors this encoder produces, for caches and index fingerprints
+        self.embedding_name = encoder_name(model_name, encoder)
+        self.index_backend = index_backend
+        self.index_params = index_params or {}
+        self.corpus_path = Path(corpus_path) if corpus_path else CORPUS_PATH
+        self.doc_store = DocumentStore(self.corpus_path.with_suffix('.docs.jsonl'))
+        self.journal_path = self.corpus_path.with_suffix('.updates.jsonl')
+        # (start, end) byte ranges of the journal already applied to this engine
+        self._journal_applied = []
+        # Set when the corpus file could not be read; compaction then leaves it alone
+        self._corpus_unreadable = False
+        self.embedding_cache_dir = embedding_cache_dir
+        self.documents = []
+        self.id_map = {}
+        self.deleted = set()
+        self.passages = PassageMap()
+        self.metadata = MetadataIndex()
+        self.embedding_store = None
+        self._live_mask = None
+        # Searches share the read side; corpus updates and reloads take the write side
+        self._lock = ReadWriteLock()
+        self.embeddings = None
+        self.index = None
+        self.keyword_index = None
+        self._executor = None
+        self.corpus_version = ''
+        self.query_cache = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+        self.result_cache = LRUCache(result_cache_size, RESULT_CACHE_TTL)
+        # Milliseconds per startup phase (model_import, model_load, documents,
+        # encode, vector_index, keyword_index, journal_replay)
+        self.load_timings = {}
+        # Counters and latency histograms of the searches answered (see metrics_snapshot)
+        self.metrics = _new_metrics()
         try:
             logging.info(f"Initializing LegalSearchEngine with model: {model_name}")
-            self.model = SentenceTransformer(model_name)
-            self.documents = []
-            self.embeddings = None
+            # Imported here rather than at module level: torch and transformers
+            # take seconds to import and most CLI invocations never need them
+            with self._timed('model_import'):
+                import_backend(encoder)
+            with self._timed('model_load'):
+                self.model = make_encoder(model_name, encoder)
             self.load_documents()
             logging.info("LegalSearchEngine initialized successfully")
         except Exception as e:
@@ -39,35 +207,346 @@ class LegalSearchEngine:
             # Fallback to simple keyword search if model fails
             self.model = None
             self.load_documents()
+        self.startup_timings = dict(self.load_timings)
+
+    @contextmanager
+    def _timed(self, phase):
+        """Add the time spent in the with-block to load_timings[phase]."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.load_timings[phase] = self.load_timings.get(phase, 0.0) + elapsed
 
     def load_documents(self):
-        """Load legal documents from JSON file or use fallback sample data."""
+        """
+        Stream legal documents from the JSON file (or fallback sample data).
+        Full documents go to the on-disk document store and only light records
+        stay in memory; each chunk is embedded as it arrives.
+        """
+        # Anything cached was computed against the previous corpus
+        self.query_cache.clear()
+        self.result_cache.clear()
+        with self._lock.write():
+            self._load_corpus()
+
+    def _load_corpus(self):
+        nested = ('encode', 'vector_index')
+        before = sum(self.load_timings.get(phase, 0.0) for phase in nested)
+        with self._timed('documents'):
+            # Only a corpus that cannot be read falls back to the sample data. Failures
+            # of the document store, embedding cache or vector index propagate:
+            # serving seven sample cases in place of the real corpus hides them.
+            self._corpus_unreadable = False
+            try:
+                if self.corpus_path.exists():
+                    self._ingest(_read_corpus(self.corpus_path), embed=True)
+                    logging.info(f"Loaded {len(self.documents)} documents from JSON file")
+                else:
+                    # Fallback sample data
+                    self._ingest(self.get_sample_documents(), embed=True)
+                    logging.warning(f"JSON file not found, using {len(self.documents)} sample documents")
+            except CorpusReadError as e:
+                logging.error(f"Could not read documents file: {e}")
+                self._corpus_unreadable = True
+                self._ingest(self.get_sample_documents(), embed=False)
+        # Encoding and indexing ran inside _ingest; 'documents' keeps the reading and storing
+        self.load_timings['documents'] -= sum(self.load_timings.get(phase, 0.0) for phase in nested) - before
+
+        # Keyword index for the fallback path, reused from disk when the corpus is unchanged
         try:
-            json_path = Path(__file__).parent / 'legal_documents.json'
-            if json_path.exists():
-                with open(json_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.documents = data.get('documents', [])
-                logging.info(f"Loaded {len(self.documents)} documents from JSON file")
-            else:
-                # Fallback sample data
-                self.documents = self.get_sample_documents()
-                logging.warning(f"JSON file not found, using {len(self.documents)} sample documents")
-            
-            # Pre-compute embeddings for all documents if model is available
-            if self.model and self.documents:
-                texts = [f"{doc['title']}. {doc.get('content', doc.get('summary', ''))}" for doc in self.documents]
-                self.embeddings = self.model.encode(texts)
-                logging.info(f"Computed embeddings for {len(self.documents)} documents")
-                
-        except json.JSONDecodeError as e:
-            logging.error(f"Invalid JSON in documents file: {e}")
-            self.documents = self.get_sample_documents()
+            with self._timed('keyword_index'):
+                self.keyword_index = load_or_build(self.doc_store, self.corpus_path.with_suffix('.keyword.json'),
+                                                   self.corpus_version)
         except Exception as e:
-            logging.error(f"Error loading documents: {e}")
-            self.documents = self.get_sample_documents()
+            logging.error(f"Error building keyword index: {e}")
+            self.keyword_index = None
+
+        # Re-apply incremental updates made since the corpus file was written
+        replayed = 0
+        stop = journal_size(self.journal_path)
+        self._journal_applied = [(0, stop)]
+        with self._timed('journal_replay'):
+            for op in iter_journal(self.journal_path, stop):
+                try:
+                    self.apply_update(op, journal=False)
+                    replayed += 1
+                except Exception as e:
+                    logging.error(f"Skipping bad journal entry: {e}")
+        if replayed:
+            logging.info(f"Replayed {replayed} corpus updates from {self.journal_path}")
+
+    def _ingest(self, source, embed, persist=True):
+        """
+        Read documents from source in chunks of INGEST_CHUNK, writing full
+        documents to the document store and, if embed is set and a model is
+        loaded, encoding each chunk's passages (reusing cached vectors for
+        unchanged texts).
+        """
+        self.documents = []
+        self.id_map = {}
+        self.deleted = set()
+        self.passages = PassageMap()
+        self.metadata = MetadataIndex()
+        self._live_mask = None
+        self.embeddings = None
+        self.index = None
+        self.doc_store.reset()
+        store = EmbeddingStore(self.embedding_name, self.embedding_cache_dir) if embed and self.model else None
+        self.embedding_store = store
+        digest = hashlib.sha1()
+        hashes = []
+        vector_chunks = []
+
+        for chunk in chunked(source, INGEST_CHUNK):
+            texts = []
+            for doc in chunk:
+                doc_id = self.doc_store.append(doc)
+                self.documents.append(light_record(doc))
+                self.metadata.add(doc)
+                digest.update(document_digest(doc))
+                key = document_key(doc)
+                if key is not None:
+                    self.id_map[key] = doc_id
+                if store is not None:
+                    texts.extend(self._add_passages(doc_id, doc))
+            if store is not None:
+                hashes.extend(text_hash(text) for text in texts)
+                with self._timed('encode'):
+                    vector_chunks.append(store.encode(self.model, texts, save_manifest=False,
+                                                      batch_size=PASSAGE_BATCH_SIZE))
+
+        self.doc_store.commit()
+        self.corpus_version = digest.hexdigest()
+
+        # Pre-compute embeddings for all documents if model is available
+        if vector_chunks:
+            store.save()
+            if len(store.rows) > 2 * len(hashes):
+                store.prune(hashes)
+            self.embeddings = np.vstack(vector_chunks)
+            del vector_chunks
+            logging.info(f"Computed embeddings for {len(self.passages)} passages of {len(self.documents)} documents")
+            with self._timed('vector_index'):
+                self._build_index(hashes, persist)
+
+    def _build_index(self, hashes, persist=True):
+        """
+        Load the saved vector index for this corpus, or build and save a new one.
+        With persist=False the index is built in memory only.
+        """
+        build_params = {k: v for k, v in self.index_params.items() if k not in SEARCH_PARAMS}
+        digest = hashlib.sha1(f"{self.embedding_name}|{json.dumps(build_params, sort_keys=True)}".encode('utf-8'))
+        for key in hashes:
+            digest.update(key.encode('ascii'))
+        fingerprint = digest.hexdigest()
+        index_path = self.corpus_path.with_suffix(f'.{self.index_backend}.npz')
+
+        index = None
+        if persist and index_path.exists():
+            try:
+                index = load_index(index_path)
+                if index.kind != self.index_backend or index.fingerprint != fingerprint:
+                    index = None
+                else:
+                    for name in SEARCH_PARAMS:
+                        if name in self.index_params:
+                            setattr(index, name, self.index_params[name])
+            except Exception as e:
+                logging.warning(f"Could not load vector index {index_path}: {e}")
+                index = None
+
+        if index is None:
+            index = make_index(self.index_backend, **self.index_params).build(self.embeddings)
+            index.fingerprint = fingerprint
+            if persist and index.persistent:
+                index.save(index_path)
+                logging.info(f"Saved {index.kind} index to {index_path}")
+
+        self.index = index
+        # Share the index's normalised matrix rather than keeping a second copy;
+        # a quantised index keeps only codes resident and has no float32 matrix
+        self.embeddings = index.vectors
+        if index.store is not None:
+            logging.info(f"{index.store.quantizer.kind} vector storage: {index.store.nbytes / 2**20:.1f} MiB resident")
+
+    def _add_passages(self, doc_id, doc):
+        """Split a document into passages, record them and return their texts."""
+        spans = split_passages(passage_source(doc))
+        self.passages.add(doc_id, spans)
+        return passage_texts(doc, spans)
+
+    def add_documents(self, documents, journal=True):
+        """
+        Add documents to the loaded corpus without re-embedding it.
+        A document whose resource_id/id is already present replaces the old one.
+        Args:
+            documents (list): Documents in the legal_documents.json shape
+            journal (bool): Record the change so it survives a reload
+        Returns:
+            list: Internal ids of the added documents
+        """
+        documents = list(documents)
+        if not documents:
+            return []
+        with self._lock.write():
+            if journal:
+                self._journal_applied.append(
+                    append_journal(self.journal_path, [{'op': 'add', 'document': doc} for doc in documents]))
+
+            digest = hashlib.sha1(self.corpus_version.encode('ascii'))
+            doc_ids = []
+            texts = []
+            for doc in documents:
+                key = document_key(doc)
+                if key in self.id_map:
+                    self._tombstone(self.id_map[key])
+                doc_id = self.doc_store.append(doc)
+                self.documents.append(light_record(doc))
+                self.metadata.add(doc)
+                if self.keyword_index is not None:
+                    self.keyword_index.add_document(doc)
+                if key is not None:
+                    self.id_map[key] = doc_id
+                digest.update(document_digest(doc))
+                doc_ids.append(doc_id)
+                if self.index is not None:
+                    texts.extend(self._add_passages(doc_id, doc))
+            self.doc_store.flush()
+
+            if self.index is not None:
+                # Only the new documents' passages are encoded; the rest of the index is untouched
+                self.index.add(self.embedding_store.encode(self.model, texts, batch_size=PASSAGE_BATCH_SIZE))
+                self.embeddings = self.index.vectors
+
+            self.corpus_version = digest.hexdigest()
+            self._live_mask = None
+            self.result_cache.clear()
+            logging.info(f"Added {len(doc_ids)} documents")
+            return doc_ids
+
+    def update_document(self, key, document, journal=True):
+        """
+        Replace the document with external key (see corpus_store.document_key)
+        by document. Returns the new internal id.
+        """
+        with self._lock.write():
+            if journal:
+                self._journal_applied.append(
+                    append_journal(self.journal_path, [{'op': 'update', 'key': key, 'document': document}]))
+            if key in self.id_map:
+                self._tombstone(self.id_map.pop(key))
+            return self.add_documents([document], journal=False)[0]
+
+    def delete_document(self, key, journal=True):
+        """Tombstone the document with external key. Returns False if it is unknown."""
+        with self._lock.write():
+            if key not in self.id_map:
+                return False
+            if journal:
+                self._journal_applied.append(append_journal(self.journal_path, [{'op': 'delete', 'key': key}]))
+            self._tombstone(self.id_map.pop(key))
+            self.corpus_version = hashlib.sha1(f"{self.corpus_version}|-{key}".encode('utf-8')).hexdigest()
+            self.result_cache.clear()
+            self.maybe_compact()
+            return True
+
+    def _tombstone(self, doc_id):
+        """Hide a document from every search path until the next compaction."""
+        self.deleted.add(doc_id)
+        if self.keyword_index is not None:
+            self.keyword_index.delete_document(doc_id)
+        self._live_mask = None
+
+    def apply_update(self, op, journal=True):
+        """
+        Apply one corpus operation in the journal/daemon shape:
+        {"op": "add", "documents": [...]}, {"op": "update", "key": ..., "document": {...}}
+        or {"op": "delete", "key": ...}. Instead of "key", "resource_id" or "id" may be given.
+        """
+        kind = op.get('op')
+        if kind == 'add':
+            documents = op.get('documents') or [op['document']]
+            return self.add_documents(documents, journal)
+        key = op.get('key') or document_key(op)
+        if key is None:
+            raise ValueError("A key, resource_id or id is required")
+        if kind == 'update':
+            return self.update_document(key, op['document'], journal)
+        if kind == 'delete':
+            return self.delete_document(key, journal)
+        raise ValueError(f"Unknown corpus operation '{kind}'")
+
+    def live_mask(self):
+        """Boolean array of documents that are not tombstoned, or None when nothing is."""
+        if not self.deleted:
+            return None
+        if self._live_mask is None or len(self._live_mask) != len(self.documents):
+            live = np.ones(len(self.documents), dtype=bool)
+            live[list(self.deleted)] = False
+            self._live_mask = live
+        return self._live_mask
+
+    def document_mask(self, filters=None):
+        """
+        Boolean array of documents a search may return: not tombstoned and
+        matching filters (see metadata_index). None when every document qualifies.
+        """
+        mask = self.metadata.mask(filters)
+        live = self.live_mask()
+        if live is None:
+            return mask
+        return live if mask is None else mask & live
+
+    def _passage_mask(self, doc_mask, passages=None):
+        """Expand a document mask to the passage rows of the vector index."""
+        if doc_mask is None:
+            return None
+        if passages is None:
+            passages = self.passages
+        return doc_mask[passages.doc_array()]
+
+    def maybe_compact(self):
+        """Compact when tombstones make up more than COMPACT_RATIO of the corpus."""
+        if len(self.deleted) >= COMPACT_MIN_DELETED and len(self.deleted) > COMPACT_RATIO * len(self.documents):
+            self.compact()
+
+    def compact(self):
+        """
+        Drop tombstoned documents and rebuild the indexes from the document
+        store. Cached embeddings are reused, so nothing is re-encoded. The live
+        corpus and the rebuilt indexes are saved and the journal is rotated,
+        so the next load starts from the compacted corpus instead of replaying
+        every update since the corpus file was first written.
+        Returns:
+            int: Number of documents removed
+        """
+        with self._lock.write():
+            removed = len(self.deleted)
+            if not removed:
+                return 0
+            deleted = self.deleted
+            embed = self.index is not None
+            persist = not self._corpus_unreadable
+            live = (doc for doc_id, doc in enumerate(iter(self.doc_store)) if doc_id not in deleted)
+            self._ingest(live, embed=embed, persist=persist)
+            if persist:
+                write_json_documents(self.corpus_path, iter(self.doc_store))
+                self.keyword_index = load_or_build(self.doc_store, self.corpus_path.with_suffix('.keyword.json'),
+                                                   self.corpus_version)
+                # Every update applied here is now in the corpus file
+                rotate_journal(self.journal_path, self._journal_applied)
+                self._journal_applied = []
+            else:
+                logging.warning(f"Not saving the compacted corpus over unreadable {self.corpus_path}")
+                self.keyword_index = KeywordIndex.build(self.doc_store)
+            self.result_cache.clear()
+            logging.info(f"Compacted corpus: removed {removed} tombstoned documents")
+            return removed
 
-    def get_sample_documents(self):
+    @staticmethod
+    def get_sample_documents():
         """Return sample legal documents as fallback."""
         return [
             {
@@ -128,16 +607,36 @@ class LegalSearchEngine:
             }
         ]
 
-    def search(self, query, top_k=5, min_score=0.1):
+    def resolve_method(self, search_method='auto'):
+        """Return the search method that will actually run for search_method."""
+        if search_method not in SEARCH_METHODS:
+            raise ValueError(f"Unknown search method '{search_method}', expected one of {SEARCH_METHODS}")
+        semantic_ready = self.model is not None and self.index is not None
+        if search_method == 'auto':
+            return 'semantic' if semantic_ready else 'keyword'
+        if search_method in ('semantic', 'hybrid') and not semantic_ready:
+            return 'keyword'
+        return search_method
+
+    def search(self, query, top_k=5, min_score=0.1, search_method='auto', timings=None, filters=None):
         """
         Perform semantic search on the documents.
         Args:
             query (str): The search query
             top_k (int): Number of results to return
             min_score (float): Minimum similarity score threshold
+            search_method (str): 'auto', 'semantic', 'keyword' or 'hybrid'
+            timings (dict): Optional dict that receives per-phase durations in ms (query_encode_ms,
+                similarity_ms, top_k_ms, keyword_ms, result_construction_ms, total_ms; see SEARCH_PHASES)
+            filters (dict): Optional metadata filters, e.g. {'year_min': 1950, 'tags': ['Civil Rights']};
+                only matching documents are scored
         Returns:
             list: Top matching documents with their scores
         """
+        if timings is None:
+            timings = {}
+        start = time.perf_counter()
+        method = 'none'
         try:
             logging.info(f"Performing search for query: '{query}' with top_k={top_k}, min_score={min_score}")
             
@@ -145,149 +644,710 @@ class LegalSearchEngine:
                 logging.warning("No documents available for search")
                 return []
 
-            # If we have a model and embeddings, use semantic search
-            if self.model and self.embeddings is not None:
-                return self._semantic_search(query, top_k, min_score)
-            else:
-                # Fallback to keyword search
-                logging.info("Using fallback keyword search")
-                return self._keyword_search(query, top_k)
+            method = self.resolve_method(search_method)
+            if method == 'keyword' and search_method != 'keyword':
+                self.metrics.inc('search_fallbacks_total', reason='model_unavailable')
+            cache_key = self._result_cache_key(query, top_k, min_score, method, filters)
+            results = self.result_cache.get(cache_key)
+            if results is not MISSING:
+                timings['result_cache_hit'] = True
+                return results
+
+            # Corpus updates and compaction modify or swap the indexes; searches
+            # share the read side, so they run concurrently but never mid-update
+            with self._lock.read():
+                doc_mask = self.document_mask(filters)
+                if method == 'hybrid':
+                    results = self._hybrid_search(query, top_k, min_score, timings, doc_mask)
+                elif method == 'semantic':
+                    results = self._semantic_search(query, top_k, min_score, doc_mask, timings)
+                else:
+                    # Fallback to keyword search
+                    logging.info("Using fallback keyword search")
+                    results = self._keyword_search(query, top_k, doc_mask, timings)
+
+            self.result_cache.put(cache_key, results)
+            return results
                 
         except Exception as e:
             logging.error(f"Search error: {e}")
-            # Return keyword search as ultimate fallback
-            return self._keyword_search(query, top_k)
+            self.metrics.inc('search_fallbacks_total', reason='search_error')
+            method = 'keyword'
+            # Return keyword search as ultimate fallback (invalid filters raise again here)
+            with self._lock.read():
+                return self._keyword_search(query, top_k, self.document_mask(filters), timings)
+        finally:
+            timings['total_ms'] = round((time.perf_counter() - start) * 1000, 3)
+            self._record_search(method, timings)
+
+    def _result_cache_key(self, query, top_k, min_score, method, filters):
+        filter_key = json.dumps(filters, sort_keys=True) if filters else ''
+        return (normalize_query(query), top_k, min_score, method, filter_key, self.corpus_version)
+
+    def _record_search(self, method, timings):
+        """Count one answered search and add its phase durations to the histograms."""
+        self.metrics.inc('search_requests_total', method=method)
+        self.metrics.observe('search_latency_ms', timings['total_ms'], method=method)
+        for phase in SEARCH_PHASES:
+            if f'{phase}_ms' in timings:
+                self.metrics.observe('search_phase_ms', timings[f'{phase}_ms'], phase=phase)
+        for component in ('semantic', 'keyword'):
+            for outcome in ('timeout', 'failed'):
+                if timings.get(f'{component}_{outcome}'):
+                    self.metrics.inc('search_fallbacks_total', reason=f'hybrid_{component}_{outcome}')
+
+    def search_many(self, queries, top_k=5, min_score=0.1, filters=None):
+        """
+        Search for many queries at once.
+        All queries are encoded in one model batch and scored against the
+        passage matrix together, instead of one encode and scan per query.
+        Results are cached and counted per query, as search() does.
+        Args:
+            queries (list): Query strings
+            top_k (int or list): Number of results, for every query or one per query
+            min_score (float): Minimum similarity score threshold
+            filters (dict): Optional metadata filters applied to every query
+        Returns:
+            list: One result list per query, in input order
+        """
+        queries = list(queries)
+        if not queries:
+            return []
+        top_ks = list(top_k) if isinstance(top_k, (list, tuple)) else [top_k] * len(queries)
+        if not self.documents:
+            return [[] for _ in queries]
+        if self.resolve_method('auto') != 'semantic':
+            self.metrics.inc('search_fallbacks_total', len(queries), reason='model_unavailable')
+            return [self.search(query, k, min_score, 'keyword', filters=filters) for query, k in zip(queries, top_ks)]
+
+        start = time.perf_counter()
+        all_results = [None] * len(queries)
+        cache_keys = [self._result_cache_key(query, k, min_score, 'semantic', filters)
+                      for query, k in zip(queries, top_ks)]
+        misses = []
+        for position, cache_key in enumerate(cache_keys):
+            results = self.result_cache.get(cache_key)
+            if results is MISSING:
+                misses.append(position)
+            else:
+                all_results[position] = results
+
+        timings = {}
+        if misses:
+            logging.info(f"Performing batch search for {len(misses)} queries with top_k={max(top_ks)}, "
+                         f"min_score={min_score}")
+            with self._lock.read():
+                doc_mask = self.document_mask(filters)
+                query_embeddings = self._encode_queries([queries[position] for position in misses], timings)
+                passage_mask = self._passage_mask(doc_mask)
+                max_k = max(top_ks[position] for position in misses)
+                found = self._search_documents(query_embeddings, max_k, passage_mask, timings)
+                for position, (doc_ids, scores, rows) in zip(misses, found):
+                    keep = scores >= min_score
+                    with _phase(timings, 'result_construction'):
+                        results = [
+                            self._format_result(int(doc_id), float(score), int(row))
+                            for doc_id, score, row in zip(doc_ids[keep], scores[keep], rows[keep])
+                        ][:top_ks[position]]
+                    self.result_cache.put(cache_keys[position], results)
+                    all_results[position] = results
+
+        elapsed = (time.perf_counter() - start) * 1000
+        for _ in queries:
+            # Each query waited for the whole batch; phases are observed once per batch below
+            self._record_search('semantic', {'total_ms': round(elapsed, 3)})
+        self.metrics.inc('search_batches_total')
+        self.metrics.observe('search_batch_latency_ms', elapsed)
+        for phase in SEARCH_PHASES:
+            if f'{phase}_ms' in timings:
+                self.metrics.observe('search_phase_ms', timings[f'{phase}_ms'], phase=phase, batch='true')
+        return all_results
+
+    def _encode_queries(self, queries, timings=None):
+        """Embed queries, encoding only those missing from the query cache in one batch."""
+        with _phase(timings, 'query_encode'):
+            keys = [normalize_query(query) for query in queries]
+            vectors = [self.query_cache.get(key) for key in keys]
+            missing = list(dict.fromkeys(key for key, vector in zip(keys, vectors) if vector is MISSING))
+            if missing:
+                encoded = dict(zip(missing, self.model.encode(missing, batch_size=BATCH_ENCODE_SIZE)))
+                for key, vector in encoded.items():
+                    self.query_cache.put(key, vector)
+                vectors = [encoded[key] if vector is MISSING else vector for key, vector in zip(keys, vectors)]
+            return np.vstack(vectors)
+
+    def cache_stats(self):
+        """Hit/miss counters for the query embedding and result caches."""
+        return {
+            'query_embeddings': self.query_cache.stats(),
+            'results': self.result_cache.stats()
+        }
+
+    def _refresh_gauges(self):
+        """Copy load timings, cache counters and corpus size into the metrics before they are read."""
+        for phase, ms in self.load_timings.items():
+            self.metrics.set('startup_ms', round(ms, 3), phase=STARTUP_PHASES.get(phase, phase))
+        for cache, stats in self.cache_stats().items():
+            self.metrics.set('cache_hits', stats['hits'], cache=cache)
+            self.metrics.set('cache_misses', stats['misses'], cache=cache)
+        self.metrics.set('documents', len(self.documents) - len(self.deleted))
+
+    def metrics_snapshot(self):
+        """Search counters, phase histograms (count, mean, p50/p95/p99, max) and startup timings as JSON data."""
+        self._refresh_gauges()
+        return self.metrics.snapshot()
+
+    def metrics_text(self):
+        """The same metrics in the Prometheus text format."""
+        self._refresh_gauges()
+        return self.metrics.render()
 
-    def _semantic_search(self, query, top_k, min_score):
-        """Perform semantic search using embeddings."""
+    def _search_documents(self, query_embeddings, k, mask=None, timings=None, deadline=None,
+                          index=None, passages=None):
+        """
+        Top k documents per query, each scored by its best passage.
+        Queries whose first PASSAGE_OVERSAMPLE * k passages cover fewer than k
+        documents are searched again with twice as many passages, until every
+        admitted passage has been asked for or every admitted document found.
+        Args:
+            mask (np.ndarray): Optional boolean array over passage rows
+            timings (dict): Receives similarity_ms (vector index scoring, including the
+                index's passage shortlist) and top_k_ms (pooling passages into the top documents)
+            deadline (float): time.monotonic() after which no further index search is started
+            index, passages: Vector index and passage map to search (the engine's current ones if None)
+        Returns:
+            list: Per query, (doc_ids, scores, rows) arrays, best first
+        """
+        if index is None:
+            index = self.index
+        if passages is None:
+            passages = self.passages
+        total = len(passages) if mask is None else int(np.count_nonzero(mask))
+        # Documents with at least one admitted passage; counted on the first retry
+        documents = None
+        results = [None] * len(query_embeddings)
+        pending = np.arange(len(query_embeddings))
+        n = max(1, min(k * PASSAGE_OVERSAMPLE, total))
+        while len(pending):
+            _check_deadline(deadline)
+            with _phase(timings, 'similarity'):
+                scores, rows = index.search(query_embeddings[pending], n, mask)
+            retry = []
+            with _phase(timings, 'top_k'):
+                for i, row_scores, row_ids in zip(pending, scores, rows):
+                    hits = passages.best_per_document(row_scores, row_ids, k)
+                    if len(hits[0]) < k and n < total:
+                        if documents is None:
+                            doc_array = passages.doc_array()
+                            documents = len(np.unique(doc_array if mask is None else doc_array[mask]))
+                        if len(hits[0]) < documents:
+                            retry.append(i)
+                            continue
+                    results[i] = hits
+            pending = np.array(retry, dtype=np.int64)
+            n = max(1, min(n * 2, total))
+        return results
+
+    def _semantic_candidates(self, query, k, min_score, doc_mask=None, timings=None, deadline=None,
+                             index=None, passages=None):
+        """(doc_id, score, passage_row) triples from the vector index, best first."""
         # Encode the query
-        query_embedding = self.model.encode([query])
-        
-        # Calculate cosine similarity
-        similarities = cosine_similarity(query_embedding, self.embeddings)[0]
-        
-        # Get top_k results above threshold
-        top_indices = np.argsort(similarities)[::-1]
-        
-        results = []
-        for idx in top_indices:
-            score = float(similarities[idx])
-            if score < min_score:
-                break
-                
-            doc = self.documents[idx]
-            results.append({
-                'title': doc['title'],
-                'summary': doc.get('summary', doc.get('content', '')[:200] + '...'),
-                'similarity_score': score,
-                'tags': doc.get('tags', []),
-                'year': doc.get('year', 'N/A')
-            })
-            
-            if len(results) >= top_k:
-                break
-        
+        _check_deadline(deadline)
+        query_embedding = self._encode_queries([query], timings)
+
+        # Nearest passages by cosine similarity, max-pooled to documents
+        passage_mask = self._passage_mask(doc_mask, passages)
+        doc_ids, scores, rows = self._search_documents(query_embedding, k, passage_mask, timings, deadline,
+                                                       index, passages)[0]
+        keep = scores >= min_score
+        return [
+            (int(doc_id), float(score), int(row))
+            for doc_id, score, row in zip(doc_ids[keep], scores[keep], rows[keep])
+        ]
+
+    def _semantic_search(self, query, top_k, min_score, doc_mask=None, timings=None):
+        """Perform semantic search using the vector index."""
+        candidates = self._semantic_candidates(query, top_k, min_score, doc_mask, timings)
+        with _phase(timings, 'result_construction'):
+            results = [self._format_result(doc_id, score, row) for doc_id, score, row in candidates]
+
         logging.info(f"Semantic search returned {len(results)} results")
         return results
 
-    def _keyword_search(self, query, top_k):
-        """Fallback keyword-based search."""
-        query_lower = query.lower()
-        query_words = query_lower.split()
-        
-        scored_docs = []
-        for doc in self.documents:
-            search_text = f"{doc['title']} {doc.get('content', '')} {doc.get('summary', '')} {' '.join(doc.get('tags', []))}".lower()
-            
-            # Simple scoring based on word matches
-            score = 0
-            for word in query_words:
-                if word in search_text:
-                    score += 1
-            
-            if score > 0:
-                normalized_score = min(0.95, score / len(query_words))
-                scored_docs.append((doc, normalized_score))
-        
-        # Sort by score and return top results
-        scored_docs.sort(key=lambda x: x[1], reverse=True)
-        
-        results = []
-        for doc, score in scored_docs[:top_k]:
-            results.append({
-                'title': doc['title'],
-                'summary': doc.get('summary', doc.get('content', '')[:200] + '...'),
-                'similarity_score': score,
-                'tags': doc.get('tags', []),
-                'year': doc.get('year', 'N/A')
-            })
-        
+    def _hybrid_search(self, query, top_k, min_score, timings=None, doc_mask=None):
+        """
+        Run keyword and vector retrieval concurrently and merge them with
+        reciprocal-rank fusion. A component that exceeds HYBRID_TIMEOUT is dropped.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='hybrid')
+        if timings is None:
+            timings = {}
+        k = top_k * HYBRID_CANDIDATES
+        # Components check the deadline between steps, so work that was dropped
+        # stops soon instead of occupying the executor for later queries
+        deadline = time.monotonic() + HYBRID_TIMEOUT
+        # The caller holds the read lock only until it stops waiting, so the components
+        # take it themselves and search the indexes captured here, never self.* later
+        index, passages, keyword_index = self.index, self.passages, self.keyword_index
+
+        def semantic(local):
+            with self._lock.read():
+                return self._semantic_candidates(query, k, min_score, doc_mask, local, deadline, index, passages)
+
+        def keyword(local):
+            with self._lock.read():
+                _check_deadline(deadline)
+                return keyword_index.search(query, k, doc_mask)
+
+        def timed(name, fn):
+            # Each component records into its own dict; only finished components'
+            # timings are copied into the response, so late work never touches it
+            local = {}
+            start = time.perf_counter()
+            result = fn(local)
+            local[f'{name}_ms'] = round((time.perf_counter() - start) * 1000, 2)
+            return result, local
+
+        start = time.perf_counter()
+        futures = {
+            'semantic': self._executor.submit(timed, 'semantic', semantic),
+            'keyword': self._executor.submit(timed, 'keyword', keyword),
+        }
+        wait(futures.values(), timeout=HYBRID_TIMEOUT)
+
+        fused = {}
+        passage_rows = {}
+        for name, future in futures.items():
+            if not future.done():
+                # A component still queued never starts; a running one stops at its next deadline check
+                future.cancel()
+                logging.warning(f"Hybrid search: {name} component timed out")
+                timings[f'{name}_timeout'] = True
+                continue
+            try:
+                ranked, local = future.result()
+                timings.update(local)
+            except Exception as e:
+                logging.error(f"Hybrid search: {name} component failed: {e}")
+                timings[f'{name}_failed'] = True
+                continue
+            for rank, hit in enumerate(ranked):
+                doc_id = hit[0]
+                fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+                if len(hit) > 2:
+                    # Semantic hits carry the row of the document's best passage
+                    passage_rows[doc_id] = hit[2]
+
+        # Scale so a document ranked first by both components scores 1.0
+        best_possible = len(futures) / (RRF_K + 1)
+        ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        with _phase(timings, 'result_construction'):
+            results = [
+                self._format_result(doc_id, score / best_possible, passage_rows.get(doc_id))
+                for doc_id, score in ranked
+            ]
+        timings['hybrid_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+        logging.info(f"Hybrid search returned {len(results)} results")
+        return results
+
+    def _keyword_search(self, query, top_k, doc_mask=None, timings=None):
+        """Fallback keyword search using the BM25 inverted index."""
+        if self.keyword_index is None:
+            self.keyword_index = KeywordIndex.build(self.doc_store)
+
+        with _phase(timings, 'keyword'):
+            hits = self.keyword_index.search(query, top_k, doc_mask)
+        with _phase(timings, 'result_construction'):
+            results = [self._format_result(doc_id, score) for doc_id, score in hits]
+
         logging.info(f"Keyword search returned {len(results)} results")
         return results
 
-def main():
-    """Main function for command-line usage."""
+    def _format_result(self, doc_id, score, row=None):
+        """
+        Build the result dict returned to callers for one document.
+        row is the passage that matched; its character offsets into the
+        document's content (or summary, if it has no content) are reported.
+        """
+        doc = self.documents[doc_id]
+        summary = doc.get('summary')
+        if summary is None:
+            # Full content lives on disk; read it only for results that need it
+            summary = self.doc_store.get(doc_id).get('content', '')[:200] + '...'
+        result = {
+            'title': doc['title'],
+            'summary': summary,
+            'similarity_score': score,
+            'tags': doc.get('tags', []),
+            'year': doc.get('year', 'N/A')
+        }
+        if row is not None:
+            start, end = self.passages.span(row)
+            result['passage'] = {'start': start, 'end': end}
+        return result
+
+def _search_response(search_engine, input_data, results, search_method, timings=None):
+    """The success response for one search request, shared by handle_request and handle_batch."""
+    filters = input_data.get('filters') or None
+    response = {
+        'status': 'success',
+        'results': results,
+        'query': input_data['query'],
+        'count': len(results),
+        'search_method': search_method
+    }
+    if filters:
+        response['filters'] = filters
+    if input_data.get('timings') or search_method == 'hybrid':
+        response['timings'] = timings or {}
+    response['cache'] = search_engine.cache_stats()
+    return response
+
+def handle_request(search_engine, input_data):
+    """
+    Answer one search request in the stdin/daemon JSON shape.
+    Args:
+        search_engine (LegalSearchEngine): A loaded search engine
+        input_data (dict): Request with 'query' and optional 'top_k', 'min_score', 'search_method',
+            'filters' (see metadata_index) and 'timings' (true to include per-phase durations)
+    Returns:
+        dict: The JSON response object
+    """
+    query = input_data.get('query', '') if isinstance(input_data, dict) else ''
     try:
-        # Check if input is available on stdin (for proc_open usage)
-        if not sys.stdin.isatty():
-            # Read from stdin for proc_open usage
-            stdin_data = sys.stdin.read().strip()
-            if stdin_data:
-                try:
-                    input_data = json.loads(stdin_data)
-                    query = input_data.get('query', '')
-                    top_k = input_data.get('top_k', 5)
-                    min_score = input_data.get('min_score', 0.1)
-                except json.JSONDecodeError:
-                    # Fallback: treat stdin as plain query
-                    query = stdin_data
-                    top_k = 5
-                    min_score = 0.1
-            else:
-                raise ValueError("No input provided via stdin")
-        else:
-            # Use command line arguments
-            parser = argparse.ArgumentParser(description='Legal document semantic search')
-            parser.add_argument('query', help='The search query')
-            parser.add_argument('--top_k', type=int, default=5, help='Number of results to return')
-            parser.add_argument('--min_score', type=float, default=0.1, help='Minimum similarity score threshold')
-            
-            args = parser.parse_args()
-            query = args.query
-            top_k = args.top_k
-            min_score = args.min_score
-        
         if not query:
             raise ValueError("Query cannot be empty")
-            
-        # Initialize search engine
-        search_engine = LegalSearchEngine()
-        
-        # Perform search
-        results = search_engine.search(query, top_k, min_score)
-        
-        # Prepare response
-        response = {
+        top_k = int(input_data.get('top_k', 5))
+        min_score = float(input_data.get('min_score', 0.1))
+        requested = input_data.get('search_method') or 'auto'
+        search_method = search_engine.resolve_method(requested)
+        filters = input_data.get('filters') or None
+
+        timings = {}
+        # search() gets the method as requested, so it can count a fallback from it
+        results = search_engine.search(query, top_k, min_score, requested, timings, filters)
+        return _search_response(search_engine, input_data, results, search_method, timings)
+    except Exception as e:
+        logging.error(f"Request error: {e}")
+        return {
+            'status': 'error',
+            'message': str(e),
+            'query': query or 'unknown'
+        }
+
+def handle_batch(search_engine, requests):
+    """
+    Answer many requests in the stdin/daemon JSON shape.
+    Every query that needs an embedding is encoded in one model batch first.
+    Semantic requests that share min_score and filters then go through
+    search_many together, which serves and fills the result cache per query;
+    anything else is answered one at a time by handle_request.
+    Returns:
+        list: One response per request, in input order
+    """
+    responses = [None] * len(requests)
+    groups = {}
+    single = []
+    to_encode = []
+    for position, input_data in enumerate(requests):
+        try:
+            if not isinstance(input_data, dict) or not input_data.get('query'):
+                raise ValueError("Query cannot be empty")
+            method = search_engine.resolve_method(input_data.get('search_method') or 'auto')
+            top_k = int(input_data.get('top_k', 5))
+            min_score = float(input_data.get('min_score', 0.1))
+            filters = input_data.get('filters') or None
+            if filters:
+                validate_filters(filters)
+        except Exception:
+            responses[position] = handle_request(search_engine, input_data)
+            continue
+        if method in ('semantic', 'hybrid'):
+            to_encode.append(input_data['query'])
+        if method == 'semantic' and not input_data.get('timings'):
+            # Requests asking for timings are answered one at a time so their phases are their own
+            group_key = (min_score, json.dumps(filters, sort_keys=True) if filters else '')
+            groups.setdefault(group_key, []).append((position, top_k))
+        else:
+            single.append(position)
+
+    if to_encode:
+        # One forward pass; later lookups hit the query embedding cache
+        search_engine._encode_queries(to_encode)
+    for position in single:
+        responses[position] = handle_request(search_engine, requests[position])
+
+    for (min_score, _), members in groups.items():
+        queries = [requests[position]['query'] for position, _ in members]
+        top_ks = [top_k for _, top_k in members]
+        filters = requests[members[0][0]].get('filters') or None
+        for (position, _), results in zip(members, search_engine.search_many(queries, top_ks, min_score, filters)):
+            responses[position] = _search_response(search_engine, requests[position], results, 'semantic')
+    return responses
+
+def run_jsonl(search_engine, stream, out):
+    """Answer one JSON request (or plain query) per input line, one response per output line."""
+    def flush(batch):
+        for response in handle_batch(search_engine, batch):
+            out.write(json.dumps(response, ensure_ascii=False) + '\n')
+        out.flush()
+
+    batch = []
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            input_data = json.loads(line)
+        except json.JSONDecodeError:
+            input_data = {'query': line}
+        if not isinstance(input_data, dict):
+            input_data = {'query': line}
+        batch.append(input_data)
+        if len(batch) >= JSONL_BATCH:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+def handle_update(search_engine, input_data):
+    """
+    Apply one corpus update request (see LegalSearchEngine.apply_update);
+    {"op": "compact"} drops tombstoned documents.
+    Returns:
+        dict: The JSON response object
+    """
+    op = input_data.get('op') if isinstance(input_data, dict) else None
+    try:
+        if op == 'compact':
+            result = search_engine.compact()
+        elif op in UPDATE_OPS:
+            result = search_engine.apply_update(input_data)
+        else:
+            raise ValueError(f"Unknown corpus operation '{op}'")
+        return {
             'status': 'success',
-            'results': results,
-            'query': query,
-            'count': len(results),
-            'search_method': 'semantic' if search_engine.model else 'keyword'
+            'op': op,
+            'result': result,
+            'documents': len(search_engine.documents) - len(search_engine.deleted)
         }
-        
-        # Output JSON to stdout
-        print(json.dumps(response, ensure_ascii=False, indent=None))
+    except Exception as e:
+        logging.error(f"Update error: {e}")
+        return {'status': 'error', 'message': str(e), 'op': op or 'unknown'}
+
+def queue_update(input_data):
+    """
+    Record a corpus update in the journal for the next engine load.
+    Used when no daemon is running to apply it immediately.
+    """
+    op = input_data.get('op') if isinstance(input_data, dict) else None
+    if op == 'compact':
+        return {'status': 'success', 'op': op, 'result': 0}
+    if op not in UPDATE_OPS:
+        return {'status': 'error', 'message': f"Unknown corpus operation '{op}'", 'op': op or 'unknown'}
+    append_journal(JOURNAL_PATH, [input_data])
+    return {'status': 'success', 'op': op, 'queued': True}
+
+def serve_batched(search_engine, host, port, max_batch=None, max_wait_ms=None):
+    """
+    Run the daemon on an asyncio event loop. Concurrent search requests are
+    gathered into micro-batches and answered by handle_batch on a worker
+    thread: one encode for the batch and one matrix product per group.
+    max_batch and max_wait_ms default to the micro_batch module's defaults.
+    """
+    # asyncio is only needed by the daemon, so it stays out of the CLI's import time
+    import asyncio
+    from micro_batch import MicroBatcher, DEFAULT_MAX_BATCH, DEFAULT_MAX_WAIT_MS
+    if max_batch is None:
+        max_batch = DEFAULT_MAX_BATCH
+    if max_wait_ms is None:
+        max_wait_ms = DEFAULT_MAX_WAIT_MS
+    batcher = MicroBatcher(lambda requests: handle_batch(search_engine, requests), max_batch, max_wait_ms)
+
+    async def search(payload):
+        response = await batcher.submit(payload)
+        response['batching'] = batcher.stats()
+        return response
+
+    async def update(payload):
+        return await asyncio.get_running_loop().run_in_executor(None, handle_update, search_engine, payload)
+
+    search_daemon.serve_async({'/search': search, '/documents': update}, host, port, daemon_pages(search_engine))
+
+def daemon_pages(search_engine):
+    """GET pages of the search daemon: /metrics in the Prometheus text format and /stats as JSON."""
+    return {
+        '/metrics': search_engine.metrics_text,
+        '/stats': lambda: {'status': 'success', **search_engine.metrics_snapshot()},
+    }
+
+def startup_profile(search_engine, engine_ms, query_ms):
+    """
+    Where the time to the first answer went, for --profile-startup.
+    Returns:
+        dict: Milliseconds per phase, in the order they ran
+    """
+    profile = {'module_import_ms': round(IMPORT_MS, 2)}
+    for phase in ('model_import', 'model_load', 'documents', 'encode', 'vector_index',
+                  'keyword_index', 'journal_replay'):
+        if phase in search_engine.startup_timings:
+            profile[f'{phase}_ms'] = round(search_engine.startup_timings[phase], 2)
+    profile['engine_total_ms'] = round(engine_ms, 2)
+    profile['first_query_ms'] = round(query_ms, 2)
+    profile['total_ms'] = round(IMPORT_MS + engine_ms + query_ms, 2)
+    return profile
+
+def main():
+    """Main function for command-line usage."""
+    parser = argparse.ArgumentParser(description='Legal document semantic search')
+    parser.add_argument('query', nargs='?', help='The search query (read from stdin if omitted)')
+    parser.add_argument('--top_k', type=int, default=5, help='Number of results to return')
+    parser.add_argument('--min_score', type=float, default=0.1, help='Minimum similarity score threshold')
+    parser.add_argument('--search_method', choices=SEARCH_METHODS, default='auto', help='Retrieval method')
+    parser.add_argument('--filters', help='Metadata filters as JSON, e.g. \'{"year_min": 1950, "tags": ["Civil Rights"]}\'')
+    parser.add_argument('--serve', action='store_true', help='Run as a resident search daemon')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='Daemon: asyncio front end that micro-batches concurrent queries')
+    parser.add_argument('--max_batch', type=int,
+                        help='Daemon --async: most queries encoded and scored together (default 32)')
+    parser.add_argument('--max_wait_ms', type=float,
+                        help='Daemon --async: longest a query waits for others to join its batch (default 5)')
+    parser.add_argument('--host', default=search_daemon.DEFAULT_HOST, help='Daemon host')
+    parser.add_argument('--port', type=int, default=search_daemon.DEFAULT_PORT, help='Daemon port')
+    parser.add_argument('--no-daemon', action='store_true', help='Always search in-process')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='Search in-process and report per-phase startup timings on stderr')
+    parser.add_argument('--jsonl', action='store_true', help='Batch mode: one request per stdin line, one response per stdout line')
+    parser.add_argument('--update', action='store_true',
+                        help='Apply the corpus update read from stdin (add/update/delete/compact)')
+    parser.add_argument('--timings', action='store_true',
+                        help='Include per-phase durations (ms) in the response')
+    parser.add_argument('--stats', action='store_true',
+                        help="Print the running daemon's search counters and latency histograms as JSON")
+    parser.add_argument('--encoder', choices=ENCODER_BACKENDS, default='torch',
+                        help='Sentence encoder: PyTorch, or ONNX Runtime on CPU (fp32 or int8)')
+    parser.add_argument('--index', choices=sorted(INDEX_BACKENDS), default='flat', help='Vector index backend')
+    parser.add_argument('--nlist', type=int, help='IVF: number of clusters (default sqrt(N))')
+    parser.add_argument('--nprobe', type=int, help='IVF: clusters scanned per query (recall vs latency)')
+    parser.add_argument('--quantize', choices=['float16', 'int8', 'pq'],
+                        help='Keep vectors compressed in memory and re-rank from a memory-mapped float32 file')
+    parser.add_argument('--rerank', type=int, help='Quantised: candidates re-scored exactly per query (default 256)')
+    parser.add_argument('--subspaces', type=int, help='PQ: sub-vectors per embedding (default 8)')
+    parser.add_argument('--shards', type=int, help='Sharded: row ranges the corpus is split into (default: workers)')
+    parser.add_argument('--workers', type=int, help='Sharded: worker processes (default: CPU count)')
+    args = parser.parse_args()
+
+    index_params = {
+        name: getattr(args, name)
+        for name in ('nlist', 'nprobe', 'quantize', 'rerank', 'subspaces', 'shards', 'workers')
+        if getattr(args, name)
+    }
+    try:
+        validate_index_params(args.index, index_params)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.serve:
+        # Load the model and embeddings once, then answer many queries
+        search_engine = LegalSearchEngine(index_backend=args.index, index_params=index_params,
+                                          encoder=args.encoder)
+        if args.use_async:
+            serve_batched(search_engine, args.host, args.port, args.max_batch, args.max_wait_ms)
+            return 0
+        search_daemon.serve({
+            '/search': lambda payload: handle_request(search_engine, payload),
+            '/documents': lambda payload: handle_update(search_engine, payload),
+        }, args.host, args.port, daemon_pages(search_engine))
         return 0
-        
+
+    if args.stats:
+        # Metrics live in the resident process; a one-shot search has none worth reporting
+        response = search_daemon.fetch_page('/stats', args.host, args.port)
+        if not isinstance(response, dict):
+            response = {'status': 'error', 'message': f'No search daemon at {args.host}:{args.port}'}
+        # lexiaid_service.py answers 'ok' where the search daemon answers 'success'
+        ok = response.get('status') in ('success', 'ok')
+        print(json.dumps(response, ensure_ascii=False), file=sys.stdout if ok else sys.stderr)
+        return 0 if ok else 1
+
+    if args.update:
+        # Push the change to the running daemon, or journal it for the next load
+        try:
+            input_data = json.loads(sys.stdin.read())
+            response = search_daemon.query_daemon(input_data, args.host, args.port, path='/documents')
+            if response is None:
+                response = queue_update(input_data)
+        except (json.JSONDecodeError, OSError) as e:
+            response = {'status': 'error', 'message': str(e), 'op': 'unknown'}
+        stream = sys.stdout if response.get('status') == 'success' else sys.stderr
+        print(json.dumps(response, ensure_ascii=False), file=stream)
+        return 0 if response.get('status') == 'success' else 1
+
+    if args.jsonl:
+        # Offline replays: one model load, queries encoded and scored in batches
+        search_engine = LegalSearchEngine(index_backend=args.index, index_params=index_params,
+                                          encoder=args.encoder)
+        run_jsonl(search_engine, sys.stdin, sys.stdout)
+        return 0
+
+    input_data = {'query': args.query, 'top_k': args.top_k, 'min_score': args.min_score,
+                  'search_method': args.search_method}
+    try:
+        if args.filters:
+            input_data['filters'] = json.loads(args.filters)
+
+        # Read from stdin for proc_open usage when no query argument is given
+        if args.query is None:
+            stdin_data = '' if sys.stdin.isatty() else sys.stdin.read().strip()
+            if not stdin_data:
+                raise ValueError("No input provided via stdin")
+            try:
+                input_data = json.loads(stdin_data)
+            except json.JSONDecodeError:
+                # Fallback: treat stdin as plain query
+                input_data = {'query': stdin_data, 'top_k': 5, 'min_score': 0.1}
+            if not isinstance(input_data, dict):
+                input_data = {'query': stdin_data, 'top_k': 5, 'min_score': 0.1}
+
+        if not input_data.get('query'):
+            raise ValueError("Query cannot be empty")
+        if args.timings:
+            input_data['timings'] = True
+
+        # Prefer the resident daemon; fall back to in-process search when it is down
+        response = None
+        if not (args.no_daemon or args.profile_startup):
+            response = search_daemon.query_daemon(input_data, args.host, args.port)
+        if response is None:
+            engine_start = time.perf_counter()
+            search_engine = LegalSearchEngine(index_backend=args.index, index_params=index_params,
+                                              encoder=args.encoder)
+            query_start = time.perf_counter()
+            response = handle_request(search_engine, input_data)
+            if args.profile_startup:
+                profile = startup_profile(search_engine, (query_start - engine_start) * 1000,
+                                          (time.perf_counter() - query_start) * 1000)
+                response['startup'] = profile
+                for name, ms in profile.items():
+                    print(f"{name[:-3]:>16}: {ms:10.2f} ms", file=sys.stderr)
+
     except Exception as e:
-        # Output error as JSON
-        error_response = {
+        response = {
             'status': 'error',
             'message': str(e),
-            'query': locals().get('query', 'unknown')
+            'query': input_data.get('query') or 'unknown'
         }
-        print(json.dumps(error_response, ensure_ascii=False), file=sys.stderr)
+
+    if response.get('status') != 'success':
+        # Output error as JSON
+        print(json.dumps(response, ensure_ascii=False), file=sys.stderr)
         return 1
 
+    # Output JSON to stdout
+    print(json.dumps(response, ensure_ascii=False, indent=None))
+    return 0
+
 if __name__ == '__main__':
     sys.exit(main())
@@ -4,30 +4,16 @@
 import sys
 import json
 
-def simple_keyword_search(query, documents):
+from keyword_index import KeywordIndex
+
+def simple_keyword_search(query, documents, index=None):
     """Simple keyword-based search fallback."""
-    query_lower = query.lower()
-    query_words = query_lower.split()
-    
-    scored_docs = []
-    for doc in documents:
-        search_text = f"{doc['title']} {doc.get('content', '')} {doc.get('summary', '')} {' '.join(doc.get('tags', []))}".lower()
-        
-        # Simple scoring based on word matches
-        score = 0
-        for word in query_words:
-            if word in search_text:
-                score += 1
-        
-        if score > 0:
-            normalized_score = min(0.95, score / len(query_words))
-            scored_docs.append((doc, normalized_score))
-    
-    # Sort by score and return top results
-    scored_docs.sort(key=lambda x: x[1], reverse=True)
-    
+    if index is None:
+        index = KeywordIndex.build(documents)
+
     results = []
-    for doc, score in scored_docs[:5]:  # Top 5 results
+    for doc_id, score in index.search(query, 5):  # Top 5 results
+        doc = documents[doc_id]
         results.append({
             'title': doc['title'],
             'summary': doc.get('summary', doc.get('content', '')[:200] + '...'),
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+LexiAid Search Engine Tests
+Run with: python -m pytest python/test_search_engine.py
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+from passages import PassageMap
+from semantic_search import LegalSearchEngine, handle_request
+from vector_index import IVFIndex
+
+
+def fallback_count(engine, reason):
+    counters = engine.metrics.snapshot()['counters'].get('search_fallbacks_total', {})
+    return counters.get(f'reason={reason}', 0)
+
+
+@pytest.fixture
+def keyword_engine(tmp_path):
+    corpus = tmp_path / 'legal_documents.json'
+    corpus.write_text(json.dumps({'documents': LegalSearchEngine.get_sample_documents()}), encoding='utf-8')
+    # An encoder that cannot load leaves the engine serving keyword search only
+    engine = LegalSearchEngine(encoder='unavailable', corpus_path=corpus, embedding_cache_dir=tmp_path / 'cache')
+    assert engine.model is None
+    return engine
+
+
+@pytest.mark.parametrize('requested', [None, 'auto', 'semantic', 'hybrid'])
+def test_handle_request_counts_model_unavailable_fallback(keyword_engine, requested):
+    request = {'query': 'right to counsel'}
+    if requested:
+        request['search_method'] = requested
+    response = handle_request(keyword_engine, request)
+    assert response['status'] == 'success'
+    assert response['search_method'] == 'keyword'
+    assert response['count'] > 0
+    assert fallback_count(keyword_engine, 'model_unavailable') == 1
+
+
+def test_handle_request_keyword_is_not_a_fallback(keyword_engine):
+    response = handle_request(keyword_engine, {'query': 'right to counsel', 'search_method': 'keyword'})
+    assert response['status'] == 'success'
+    assert fallback_count(keyword_engine, 'model_unavailable') == 0
+
+
+def test_ivf_search_widens_past_crowding_passages(keyword_engine):
+    # 20 documents of 30 passages each, every document's passages clustered
+    # around its own direction, so a query's nearest passages share a document
+    rng = np.random.default_rng(0)
+    documents, per_document, dim = 20, 30, 16
+    centres = rng.normal(size=(documents, dim))
+    vectors = np.repeat(centres, per_document, axis=0) + 0.05 * rng.normal(size=(documents * per_document, dim))
+    passages = PassageMap()
+    for doc_id in range(documents):
+        passages.add(doc_id, [(0, 1)] * per_document)
+    index = IVFIndex(nprobe=1).build(vectors.astype(np.float32))
+
+    queries = centres[:3].astype(np.float32)
+    for k in (1, 5, 12):
+        for doc_ids, scores, rows in keyword_engine._search_documents(queries, k, index=index, passages=passages):
+            assert len(set(doc_ids.tolist())) == k
+            assert np.all(np.diff(scores) <= 0)
+
+    # A filter admitting three documents returns those three, not an empty list
+    mask = np.isin(passages.doc_array(), [4, 9, 17])
+    for doc_ids, _, _ in keyword_engine._search_documents(queries, 5, mask, index=index, passages=passages):
+        assert sorted(doc_ids.tolist()) == [4, 9, 17]
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-q']))
@@ -0,0 +1,564 @@
+#!/usr/bin/env python3
+"""
+LexiAid Vector Index
+Nearest-neighbour backends for LegalSearchEngine.
+
+- FlatIndex: exact cosine search over pre-normalised vectors with argpartition
+- IVFIndex: inverted-file ANN index; vectors are clustered with spherical
+  k-means and a query only scores the `nprobe` closest clusters
+- ShardedIndex: exact search split into row-range shards of a memory-mapped
+  matrix, scored in parallel by a pool of worker processes
+
+Both backends share the same interface: build(), add(), search(), save() and
+load_index(), so the engine does not care which one it is using. Either can
+keep its vectors quantised (quantize='float16', 'int8' or 'pq', see
+quantization.py): candidates are scored on the codes and the best `rerank` are
+re-scored exactly from a memory-mapped float32 file saved next to the index.
+"""
+
+import inspect
+import logging
+import multiprocessing
+import os
+import tempfile
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from lazy_imports import lazy_import
+
+# Loaded on first use (see lazy_imports.py)
+np = lazy_import('numpy')
+
+from quantization import QuantizedVectors, make_quantizer, DEFAULT_RERANK, PQ_SUBSPACES
+
+# Rows per block when scoring large matrices, to bound temporary memory
+CHUNK_ROWS = 65536
+# Upper bound on query x document scores held at once during batch search
+CHUNK_SCORES = 1 << 24
+# A mask admitting fewer than this share of rows is searched by gathering
+# just those rows instead of scoring everything and discarding the rest
+SUBSET_FRACTION = 0.5
+
+
+def normalize(vectors):
+    """Return float32 copies of vectors scaled to unit length."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k_indices(scores, k):
+    """Indices of the k highest scores, best first, without a full sort."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < len(scores):
+        part = np.argpartition(scores, -k)[-k:]
+    else:
+        part = np.arange(len(scores))
+    return part[np.argsort(scores[part])[::-1]]
+
+
+def top_k_rows(scores, k):
+    """
+    Row-wise top-k of a score matrix, best first, padded with -inf / -1.
+    Returns (scores, ids) arrays of shape (len(scores), k).
+    """
+    n_rows, n_cols = scores.shape
+    k_eff = min(k, n_cols)
+    if k_eff < n_cols:
+        part = np.argpartition(scores, n_cols - k_eff, axis=1)[:, n_cols - k_eff:]
+    else:
+        part = np.broadcast_to(np.arange(n_cols), (n_rows, n_cols))
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1)
+    out_scores = np.full((n_rows, k), -np.inf, dtype=np.float32)
+    out_ids = np.full((n_rows, k), -1, dtype=np.int64)
+    out_scores[:, :k_eff] = np.take_along_axis(part_scores, order, axis=1)
+    out_ids[:, :k_eff] = np.take_along_axis(part, order, axis=1)
+    out_ids[~np.isfinite(out_scores)] = -1
+    return out_scores, out_ids
+
+
+def _quantized_store(kind, subspaces):
+    """Empty QuantizedVectors for a quantize setting."""
+    params = {'subspaces': subspaces} if kind == 'pq' else {}
+    return QuantizedVectors(make_quantizer(kind, **params))
+
+
+def full_vectors_path(path):
+    """File holding a quantised index's full-precision vectors."""
+    return Path(path).with_suffix('.f32')
+
+
+def _pad(scores, ids, k):
+    """Pad a result row to length k with -inf scores and -1 ids."""
+    out_scores = np.full(k, -np.inf, dtype=np.float32)
+    out_ids = np.full(k, -1, dtype=np.int64)
+    out_scores[:len(scores)] = scores
+    out_ids[:len(ids)] = ids
+    return out_scores, out_ids
+
+
+class FlatIndex:
+    """Exact search: one matrix product against every stored vector."""
+
+    kind = 'flat'
+
+    def __init__(self, quantize=None, rerank=DEFAULT_RERANK, subspaces=PQ_SUBSPACES):
+        self.quantize = quantize
+        self.rerank = rerank
+        self.subspaces = subspaces
+        # The embedding cache already holds float32 vectors, so only trained
+        # codes are worth persisting
+        self.persistent = quantize is not None
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.store = None
+        self.fingerprint = ''
+
+    def __len__(self):
+        return len(self.store) if self.store is not None else len(self.vectors)
+
+    def build(self, vectors):
+        """Index vectors, replacing any existing contents."""
+        vectors = normalize(vectors)
+        if self.quantize:
+            self.store = _quantized_store(self.quantize, self.subspaces).build(vectors)
+            self.vectors = None
+        else:
+            self.vectors = vectors
+        return self
+
+    def add(self, vectors):
+        """Append vectors; returns their ids."""
+        vectors = normalize(vectors)
+        start = len(self)
+        if self.store is not None:
+            self.store.add(vectors)
+        else:
+            self.vectors = np.vstack([self.vectors, vectors]) if start else vectors
+        return np.arange(start, start + len(vectors))
+
+    def search(self, queries, k, mask=None):
+        """
+        Find the k most similar vectors to each query.
+        Args:
+            queries (np.ndarray): Query vectors, one per row
+            k (int): Number of neighbours per query
+            mask (np.ndarray): Optional boolean array; False rows are never returned
+        Returns:
+            tuple: (scores, ids) arrays of shape (len(queries), k), padded with -inf / -1
+        """
+        queries = normalize(queries)
+        all_scores = np.empty((len(queries), k), dtype=np.float32)
+        all_ids = np.empty((len(queries), k), dtype=np.int64)
+
+        rows = None
+        if mask is not None and np.count_nonzero(mask) < SUBSET_FRACTION * len(mask):
+            # Selective filter: only the admitted rows are scored
+            rows = np.flatnonzero(mask)
+            mask = None
+            if not len(rows):
+                all_scores.fill(-np.inf)
+                all_ids.fill(-1)
+                return all_scores, all_ids
+            if self.store is None:
+                matrix = self.vectors[rows]
+        elif self.store is None:
+            matrix = self.vectors
+
+        # Score blocks of queries with one matrix product each
+        block = max(1, CHUNK_SCORES // max(1, len(self) if rows is None else len(rows)))
+        for start in range(0, len(queries), block):
+            batch = queries[start:start + block]
+            sims = batch @ matrix.T if self.store is None else self.store.approx(batch, rows)
+            if mask is not None:
+                sims[:, ~mask] = -np.inf
+            stop = start + len(sims)
+            if self.store is None:
+                scores, ids = top_k_rows(sims, k)
+                all_scores[start:stop] = scores
+                all_ids[start:stop] = ids if rows is None else np.where(ids >= 0, rows[ids], -1)
+                continue
+            # Shortlist on the codes, then re-score exactly
+            _, shortlist = top_k_rows(sims, max(k, self.rerank))
+            for row, query in enumerate(batch):
+                candidates = shortlist[row][shortlist[row] >= 0]
+                if rows is not None:
+                    candidates = rows[candidates]
+                all_scores[start + row], all_ids[start + row] = _pad(*self.store.rerank(query, candidates, k), k)
+        return all_scores, all_ids
+
+    def save(self, path):
+        if self.store is None:
+            np.savez(path, kind=self.kind, fingerprint=self.fingerprint, vectors=self.vectors)
+            return
+        np.savez(path, kind=self.kind, fingerprint=self.fingerprint, rerank=self.rerank, **self.store.state())
+        self.store.save_full(full_vectors_path(path))
+
+    @classmethod
+    def _from_arrays(cls, data, path):
+        if 'q_kind' not in data.files:
+            index = cls()
+            index.vectors = data['vectors']
+            return index
+        index = cls(quantize=str(data['q_kind']), rerank=int(data['rerank']))
+        index.store = QuantizedVectors.load(data, full_vectors_path(path))
+        index.vectors = None
+        return index
+
+
+class IVFIndex:
+    """
+    Inverted-file index. Search cost is roughly nprobe / nlist of a flat scan;
+    raise nprobe for recall, lower it for latency.
+    """
+
+    kind = 'ivf'
+    persistent = True
+
+    def __init__(self, nlist=None, nprobe=8, train_iters=10, seed=0,
+                 quantize=None, rerank=DEFAULT_RERANK, subspaces=PQ_SUBSPACES):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_iters = train_iters
+        self.seed = seed
+        self.quantize = quantize
+        self.rerank = rerank
+        self.subspaces = subspaces
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.store = None
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.lists = []
+        self.fingerprint = ''
+
+    def __len__(self):
+        return len(self.store) if self.store is not None else len(self.vectors)
+
+    def build(self, vectors):
+        """Train cluster centroids on vectors and index them."""
+        vectors = normalize(vectors)
+        n = len(vectors)
+        nlist = self.nlist or max(1, int(np.sqrt(n)))
+        nlist = max(1, min(nlist, n))
+        self.centroids = self._train(vectors, nlist)
+        assign = self._assign(vectors)
+        order = np.argsort(assign, kind='stable')
+        bounds = np.searchsorted(assign[order], np.arange(nlist + 1))
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(nlist)]
+        if self.quantize:
+            self.store = _quantized_store(self.quantize, self.subspaces).build(vectors)
+            self.vectors = None
+        else:
+            self.vectors = vectors
+        logging.info(f"Built IVF index: {n} vectors in {nlist} lists")
+        return self
+
+    def _train(self, vectors, nlist):
+        """Spherical k-means on a sample of vectors."""
+        rng = np.random.default_rng(self.seed)
+        n = len(vectors)
+        sample_size = min(n, nlist * 64)
+        sample = vectors[rng.choice(n, sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(self.train_iters):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=nlist)
+            empty = counts == 0
+            if empty.any():
+                # Re-seed empty clusters from random sample points
+                sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            centroids = normalize(sums)
+        return centroids
+
+    def _assign(self, vectors):
+        """Nearest centroid for each vector, computed in blocks."""
+        assign = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), CHUNK_ROWS):
+            block = vectors[start:start + CHUNK_ROWS]
+            assign[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        return assign
+
+    def add(self, vectors):
+        """Assign vectors to their nearest existing list; returns their ids."""
+        if not len(self.centroids):
+            self.build(vectors)
+            return np.arange(len(self))
+        vectors = normalize(vectors)
+        start = len(self)
+        if self.store is not None:
+            self.store.add(vectors)
+        else:
+            self.vectors = np.vstack([self.vectors, vectors])
+        ids = np.arange(start, start + len(vectors))
+        assign = self._assign(vectors)
+        for list_id in np.unique(assign):
+            self.lists[list_id] = np.concatenate([self.lists[list_id], ids[assign == list_id]])
+        return ids
+
+    def search(self, queries, k, mask=None, nprobe=None):
+        """
+        Same contract as FlatIndex.search; nprobe overrides the default per call.
+        A mask that admits no more rows than the probed lists hold on average is
+        scanned exactly instead. When the probed lists hold fewer than k
+        (admitted) rows, further lists are probed, nearest first, until they do,
+        so a query gets k hits whenever the index holds k admitted rows.
+        """
+        queries = normalize(queries)
+        nprobe = min(nprobe or self.nprobe, len(self.lists))
+        allowed = None if mask is None else np.flatnonzero(mask)
+        exact = allowed is not None and len(allowed) * len(self.lists) <= len(self) * nprobe
+        all_scores = np.empty((len(queries), k), dtype=np.float32)
+        all_ids = np.empty((len(queries), k), dtype=np.int64)
+        for row, query in enumerate(queries):
+            if exact:
+                candidates = allowed
+            else:
+                centroid_scores = self.centroids @ query
+                probe = top_k_indices(centroid_scores, nprobe)
+                candidates = np.concatenate([self.lists[p] for p in probe]) if len(probe) else np.zeros(0, dtype=np.int64)
+                if mask is not None:
+                    candidates = candidates[mask[candidates]]
+                if len(candidates) < k and len(probe) < len(self.lists):
+                    candidates = self._widen(centroid_scores, probe, candidates, k, mask)
+            if self.store is None:
+                sims = self.vectors[candidates] @ query
+                idx = top_k_indices(sims, k)
+                all_scores[row], all_ids[row] = _pad(sims[idx], candidates[idx], k)
+                continue
+            # Shortlist on the codes, then re-score exactly
+            sims = self.store.approx(query[None, :], candidates)[0]
+            shortlist = candidates[top_k_indices(sims, max(k, self.rerank))]
+            all_scores[row], all_ids[row] = _pad(*self.store.rerank(query, shortlist, k), k)
+        return all_scores, all_ids
+
+    def _widen(self, centroid_scores, probe, candidates, k, mask=None):
+        """Add the lists after probe, nearest first, until candidates hold k (admitted) rows."""
+        order = np.argsort(-centroid_scores, kind='stable')
+        parts = [candidates]
+        found = len(candidates)
+        for list_id in order[~np.isin(order, probe)]:
+            ids = self.lists[list_id]
+            if mask is not None:
+                ids = ids[mask[ids]]
+            parts.append(ids)
+            found += len(ids)
+            if found >= k:
+                break
+        return np.concatenate(parts)
+
+    def save(self, path):
+        sizes = np.array([len(ids) for ids in self.lists], dtype=np.int64)
+        packed = np.concatenate(self.lists) if self.lists else np.zeros(0, dtype=np.int64)
+        arrays = {'vectors': self.vectors} if self.store is None else dict(self.store.state(), rerank=self.rerank)
+        np.savez(path, kind=self.kind, fingerprint=self.fingerprint, centroids=self.centroids,
+                 list_sizes=sizes, list_ids=packed, nprobe=self.nprobe, **arrays)
+        if self.store is not None:
+            self.store.save_full(full_vectors_path(path))
+
+    @classmethod
+    def _from_arrays(cls, data, path):
+        index = cls(nlist=len(data['centroids']), nprobe=int(data['nprobe']))
+        if 'q_kind' in data.files:
+            index.quantize = str(data['q_kind'])
+            index.rerank = int(data['rerank'])
+            index.store = QuantizedVectors.load(data, full_vectors_path(path))
+            index.vectors = None
+        else:
+            index.vectors = data['vectors']
+        index.centroids = data['centroids']
+        bounds = np.concatenate([[0], np.cumsum(data['list_sizes'])])
+        index.lists = [data['list_ids'][bounds[i]:bounds[i + 1]] for i in range(len(index.centroids))]
+        return index
+
+
+# Worker pools shared by every ShardedIndex in this process, keyed by size
+_POOLS = {}
+# In a worker: (path, memory map) of the shard file it searched last
+_worker_file = (None, None)
+
+
+def _worker_ready():
+    return os.getpid()
+
+
+def _shard_pool(workers):
+    """The process pool with the given number of workers, started (all of them) on first use."""
+    pool = _POOLS.get(workers)
+    if pool is None:
+        # The engine may already run threads (the HTTP daemon's, the service's pools,
+        # hybrid search), and forking a threaded process can deadlock the child on a
+        # lock some other thread held. The forkserver forks workers from a clean,
+        # single-threaded server instead; where it is unavailable, spawn is used.
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+            # Also puts this process's sys.path in the server, so workers find this module
+            context.set_forkserver_preload([__name__])
+        else:
+            context = multiprocessing.get_context('spawn')
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        # Workers are otherwise created by the first search; start them all now
+        for future in [pool.submit(_worker_ready) for _ in range(workers)]:
+            future.result()
+        _POOLS[workers] = pool
+    return pool
+
+
+def _search_shard(path, rows, dim, start, stop, queries, k, mask):
+    """Worker task: exact top-k of queries against rows [start, stop) of the shard file."""
+    global _worker_file
+    if _worker_file[0] != path:
+        _worker_file = (path, np.memmap(path, dtype=np.float32, mode='r', shape=(rows, dim)))
+    shard = FlatIndex()
+    shard.vectors = _worker_file[1][start:stop]
+    scores, ids = shard.search(queries, k, mask)
+    return scores, np.where(ids >= 0, ids + start, -1)
+
+
+def _remove_file(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+class ShardedIndex:
+    """
+    Exact search across CPU cores. The normalised vectors are written once to
+    a memory-mapped file that every worker maps read-only, so the OS page
+    cache holds a single copy; each shard is a row range scored by one worker
+    task, and the coordinator merges the per-shard top-k lists.
+    """
+
+    kind = 'sharded'
+    # Rebuilt from the embedding cache on load, like FlatIndex
+    persistent = False
+
+    def __init__(self, shards=None, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.shards = shards or self.workers
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.store = None
+        # Rows added after build() are searched in-process
+        self.tail = FlatIndex()
+        self.ranges = []
+        self.path = None
+        self._cleanup = None
+        self.fingerprint = ''
+
+    def __len__(self):
+        return len(self.vectors) + len(self.tail)
+
+    def build(self, vectors):
+        """Write vectors to a new shard file and split it into row ranges."""
+        vectors = normalize(vectors)
+        if self._cleanup is not None:
+            self._cleanup()
+        self.tail = FlatIndex()
+        if not len(vectors):
+            self.vectors, self.ranges, self.path = vectors, [], None
+            return self
+
+        handle, path = tempfile.mkstemp(prefix='lexiaid-shards-', suffix='.f32')
+        with os.fdopen(handle, 'wb') as f:
+            f.write(vectors.tobytes())
+        self.path = path
+        self._cleanup = weakref.finalize(self, _remove_file, path)
+        self.vectors = np.memmap(path, dtype=np.float32, mode='r', shape=vectors.shape)
+        bounds = np.linspace(0, len(vectors), min(self.shards, len(vectors)) + 1).astype(np.int64)
+        self.ranges = [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+        # Start the workers now, so the first search does not wait for them
+        try:
+            _shard_pool(self.workers)
+        except BrokenProcessPool:
+            logging.error("Could not start the shard workers; search will retry or run in-process")
+        logging.info(f"Built sharded index: {len(vectors)} vectors in {len(self.ranges)} shards, "
+                     f"{self.workers} workers")
+        return self
+
+    def add(self, vectors):
+        """Append vectors (kept in-process until the next build); returns their ids."""
+        start = len(self)
+        self.tail.add(vectors)
+        return np.arange(start, start + len(vectors))
+
+    def search(self, queries, k, mask=None):
+        """Same contract as FlatIndex.search."""
+        queries = normalize(queries)
+        base = len(self.vectors)
+        parts = []
+        try:
+            pool = _shard_pool(self.workers)
+            futures = []
+            for start, stop in self.ranges:
+                shard_mask = None if mask is None else mask[start:stop]
+                if shard_mask is not None and not shard_mask.any():
+                    continue
+                futures.append(pool.submit(_search_shard, self.path, base, self.vectors.shape[1],
+                                           start, stop, queries, k, shard_mask))
+            parts = [future.result() for future in futures]
+        except BrokenProcessPool:
+            logging.error("Shard worker pool failed; searching in-process")
+            _POOLS.pop(self.workers, None)
+            local = FlatIndex()
+            local.vectors = self.vectors
+            parts = [local.search(queries, k, None if mask is None else mask[:base])]
+
+        if len(self.tail):
+            scores, ids = self.tail.search(queries, k, None if mask is None else mask[base:])
+            parts.append((scores, np.where(ids >= 0, ids + base, -1)))
+        if not parts:
+            return (np.full((len(queries), k), -np.inf, dtype=np.float32),
+                    np.full((len(queries), k), -1, dtype=np.int64))
+
+        # Merge: top k of the concatenated per-shard top-k lists
+        scores = np.hstack([part[0] for part in parts])
+        ids = np.hstack([part[1] for part in parts])
+        top_scores, positions = top_k_rows(scores, k)
+        top_ids = np.take_along_axis(ids, np.maximum(positions, 0), axis=1)
+        return top_scores, np.where(positions >= 0, top_ids, -1)
+
+
+INDEX_BACKENDS = {
+    'flat': FlatIndex,
+    'ivf': IVFIndex,
+    'sharded': ShardedIndex,
+}
+
+
+def validate_index_params(kind, params):
+    """
+    Raise ValueError unless every parameter in params applies to the backend kind.
+    ShardedIndex keeps float32 vectors only, so quantisation is flat/ivf only.
+    """
+    if kind not in INDEX_BACKENDS:
+        raise ValueError(f"Unknown index backend '{kind}', expected one of {sorted(INDEX_BACKENDS)}")
+    accepted = set(inspect.signature(INDEX_BACKENDS[kind]).parameters)
+    unknown = sorted(set(params) - accepted)
+    if unknown:
+        raise ValueError(f"The {kind} index does not take {', '.join(unknown)} "
+                         f"(it takes {', '.join(sorted(accepted))})")
+    if params.get('rerank') and not params.get('quantize'):
+        raise ValueError("rerank only applies to a quantised index (quantize)")
+    if params.get('subspaces') and params.get('quantize') != 'pq':
+        raise ValueError("subspaces only applies to quantize='pq'")
+
+
+def make_index(kind='flat', **params):
+    """Create an empty index of the given backend."""
+    validate_index_params(kind, params)
+    return INDEX_BACKENDS[kind](**params)
+
+
+def load_index(path):
+    """Load an index saved with save()."""
+    with np.load(path, allow_pickle=False) as data:
+        index = INDEX_BACKENDS[str(data['kind'])]._from_arrays(data, path)
+        index.fingerprint = str(data['fingerprint'])
+        return index
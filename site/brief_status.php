@@ -0,0 +1,29 @@
+<?php
+// brief_status.php
+// Reports a queued brief job (see upload_case.php): GET brief_status.php?job=<brief_job>
+// Returns the job's status, attempts and, once done, the brief.
+
+header('Content-Type: application/json');
+
+$python_dir = __DIR__ . '/../python/';
+$worker_script = escapeshellcmd($python_dir . 'brief_worker.py');
+$python_bin = escapeshellcmd(__DIR__ . '/../.venv/Scripts/python.exe');
+
+$job_id = isset($_GET['job']) ? intval($_GET['job']) : 0;
+if ($job_id <= 0) {
+    http_response_code(400);
+    echo json_encode(['status' => 'error', 'message' => 'A numeric job id is required.']);
+    exit;
+}
+
+exec("$python_bin $worker_script --status $job_id", $output, $ret);
+$result = json_decode(implode("\n", $output), true);
+if (!is_array($result)) {
+    http_response_code(500);
+    echo json_encode(['status' => 'error', 'message' => 'Brief queue unavailable.']);
+    exit;
+}
+if ($result['status'] !== 'ok') {
+    http_response_code(404);
+}
+echo json_encode($result, JSON_UNESCAPED_UNICODE);
@@ -0,0 +1,33 @@
+<?php
+/**
+ * Client for the resident LexiAid service (python/lexiaid_service.py)
+ * Search, tagging and brief requests go to it over local HTTP instead of spawning
+ * a Python process per request. Callers fall back to running the scripts when the
+ * service is not running.
+ */
+
+define('LEXIAID_SERVICE_URL', sprintf('http://%s:%s',
+    getenv('LEXIAID_SEARCH_HOST') ?: '127.0.0.1',
+    getenv('LEXIAID_SEARCH_PORT') ?: '8765'));
+
+/**
+ * POST a JSON payload to a service endpoint ('/search', '/tag', '/brief', '/documents').
+ * Returns the decoded response, including error responses such as a 503 when the
+ * endpoint's queue is full, or null when the service cannot be reached.
+ */
+function lexiaid_service_request($path, $payload, $timeout = 10) {
+    $context = stream_context_create(['http' => [
+        'method' => 'POST',
+        'header' => "Content-Type: application/json\r\n",
+        'content' => json_encode($payload, JSON_UNESCAPED_UNICODE),
+        'timeout' => $timeout,
+        // Read the JSON body of 4xx/5xx answers too
+        'ignore_errors' => true
+    ]]);
+    $body = @file_get_contents(LEXIAID_SERVICE_URL . $path, false, $context);
+    if ($body === false) {
+        return null;
+    }
+    $result = json_decode($body, true);
+    return is_array($result) ? $result : null;
+}
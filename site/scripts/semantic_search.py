@@ -10,44 +10,79 @@ import sys
 from pathlib import Path
 import numpy as np
 from sentence_transformers import SentenceTransformer
-from typing import List, Dict
+from typing import List, Dict, Iterable, Iterator, Optional
 import mysql.connector
 from mysql.connector import Error
 
+# Share the embedding cache implementation with the main python/ package
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / 'python'))
+from embedding_store import EmbeddingStore
+from corpus_store import iter_json_documents, iter_mysql_documents, chunked, light_record
+from vector_index import make_index
+
+# Documents read and embedded per ingest step
+INGEST_CHUNK = 512
+
 class LegalSearchEngine:
-    def __init__(self, model_name: str = 'all-MiniLM-L6-v2'):
-        """Initialize the search engine with the specified transformer model."""
+    def __init__(self, model_name: str = 'all-MiniLM-L6-v2', quantize: Optional[str] = None):
+        """
+        Initialize the search engine with the specified transformer model.
+        quantize ('float16', 'int8' or 'pq') keeps the embedding matrix compressed
+        in memory, with exact re-ranking of the best candidates.
+        """
+        self.model_name = model_name
+        self.quantize = quantize
         self.model = SentenceTransformer(model_name)
         self.documents = []
         self.embeddings = None
+        self.index = None
         self.load_documents()
 
     def load_documents(self) -> None:
         """
-        Load legal documents from MySQL database.
+        Stream legal documents from MySQL database in chunks.
         Falls back to local JSON if DB connection fails.
         """
+        store = EmbeddingStore(self.model_name, Path(__file__).parent / 'embedding_cache')
         try:
             # Try loading from MySQL first
-            self.documents = self._load_from_database()
+            self._ingest(self._load_from_database(), store)
         except Exception as e:
             print(f"Database loading failed: {e}", file=sys.stderr)
             # Fallback to local JSON file
             json_path = Path(__file__).parent / 'legal_documents.json'
             if json_path.exists():
-                with open(json_path, 'r', encoding='utf-8') as f:
-                    self.documents = json.load(f)
+                self._ingest(iter_json_documents(json_path), store)
             else:
                 print("No documents available", file=sys.stderr)
                 self.documents = []
+                self.embeddings = None
+                self.index = None
 
-        # Pre-compute embeddings for all documents
-        if self.documents:
-            texts = [doc['content'] for doc in self.documents]
-            self.embeddings = self.model.encode(texts, convert_to_tensor=True)
+    def _ingest(self, source: Iterable[Dict], store: EmbeddingStore) -> None:
+        """
+        Embed documents chunk by chunk as they arrive, encoding only uncached
+        texts. Only the fields needed for results are kept in memory; full
+        content is dropped once its chunk has been encoded.
+        """
+        documents = []
+        vector_chunks = []
+        for chunk in chunked(source, INGEST_CHUNK):
+            vector_chunks.append(store.encode(self.model, [doc['content'] for doc in chunk], save_manifest=False))
+            for doc in chunk:
+                record = light_record(doc)
+                content = doc['content']
+                record['summary'] = content[:200] + '...' if len(content) > 200 else content
+                documents.append(record)
+        store.save()
+
+        self.documents = documents
+        self.index = make_index('flat', quantize=self.quantize).build(np.vstack(vector_chunks)) if vector_chunks else None
+        # The index holds the normalised vectors (None when quantised)
+        self.embeddings = self.index.vectors if self.index is not None else None
 
-    def _load_from_database(self) -> List[Dict]:
-        """Load documents from MySQL database."""
+    def _load_from_database(self) -> Iterator[Dict]:
+        """Stream documents from MySQL database through a server-side cursor."""
         config = {
             'host': 'localhost',
             'user': 'root',
@@ -56,52 +91,38 @@ class LegalSearchEngine:
         }
 
         try:
-            conn = mysql.connector.connect(**config)
-            cursor = conn.cursor(dictionary=True)
-            
-            cursor.execute("""
+            yield from iter_mysql_documents(config, """
                 SELECT resource_id, title, content, type, jurisdiction, tags 
                 FROM legal_resources 
                 WHERE content IS NOT NULL
             """)
-            
-            documents = cursor.fetchall()
-            return documents
-
         except Error as e:
             print(f"Database error: {e}", file=sys.stderr)
             raise
-        finally:
-            if 'conn' in locals() and conn.is_connected():
-                cursor.close()
-                conn.close()
 
     def search(self, query: str, top_k: int = 5) -> List[Dict]:
         """
         Perform semantic search on the documents.
         Returns top_k most similar documents with their scores.
         """
-        if not self.documents or self.embeddings is None:
+        if not self.documents or self.index is None:
             return []
 
         # Encode the query
-        query_embedding = self.model.encode(query, convert_to_tensor=True)
-
-        # Calculate cosine similarity
-        similarities = np.dot(self.embeddings, query_embedding) / (
-            np.linalg.norm(self.embeddings, axis=1) * np.linalg.norm(query_embedding)
-        )
+        query_embedding = self.model.encode(query)
 
-        # Get top_k results
-        top_indices = np.argsort(similarities)[-top_k:][::-1]
+        # Cosine similarity against the pre-normalised index, best first
+        scores, indices = self.index.search(query_embedding, top_k)
         
         results = []
-        for idx in top_indices:
+        for score, idx in zip(scores[0], indices[0]):
+            if idx < 0:
+                break
             doc = self.documents[idx]
             result = {
                 'title': doc['title'],
-                'summary': doc['content'][:200] + '...' if len(doc['content']) > 200 else doc['content'],
-                'similarity_score': float(similarities[idx]),
+                'summary': doc['summary'],
+                'similarity_score': float(score),
                 'tags': doc.get('tags', []),
                 'resource_id': doc.get('resource_id'),
                 'jurisdiction': doc.get('jurisdiction'),
@@ -115,9 +136,10 @@ def main():
     parser = argparse.ArgumentParser(description='Legal document semantic search')
     parser.add_argument('query', type=str, help='The search query')
     parser.add_argument('--top_k', type=int, default=5, help='Number of results to return')
+    parser.add_argument('--quantize', choices=['float16', 'int8', 'pq'], help='Compressed embedding storage')
     args = parser.parse_args()
 
-    search_engine = LegalSearchEngine()
+    search_engine = LegalSearchEngine(quantize=args.quantize)
     results = search_engine.search(args.query, args.top_k)
     
     # Output JSON results
@@ -9,6 +9,7 @@ ob_start();
 
 // Include database configuration
 require_once __DIR__ . '/config/database.php';
+require_once __DIR__ . '/config/lexiaid_service.php';
 
 // Enable error reporting for development
 error_reporting(E_ALL);
@@ -87,11 +88,26 @@ function performDatabaseSearch($query, $topK = 5) {
 }
 
 // Python-based semantic search function
-function performPythonSearch($query, $topK = 5) {
+function performPythonSearch($query, $topK = 5, $filters = null) {
     try {
         $logFile = __DIR__ . '/logs/search.log';
-        
-        // Path to Python script
+
+        // The resident service answers without spawning Python or probing for an interpreter
+        $payload = ['query' => $query, 'top_k' => intval($topK), 'search_method' => 'hybrid'];
+        if (!empty($filters)) {
+            $payload['filters'] = $filters;
+        }
+        $serviceResults = lexiaid_service_request('/search', $payload);
+        if ($serviceResults !== null) {
+            if (isset($serviceResults['results']) && is_array($serviceResults['results'])) {
+                return $serviceResults['results'];
+            }
+            // Includes 503s when the search queue is full: spawning a cold process would only add load
+            error_log("Search service error: " . ($serviceResults['message'] ?? 'Unknown error'));
+            return [];
+        }
+
+        // No service running: path to the Python script
         $scriptPath = dirname(__DIR__) . '/python/semantic_search.py';
         $fallbackScriptPath = dirname(__DIR__) . '/python/simple_search.py';
         
@@ -128,6 +144,14 @@ function performPythonSearch($query, $topK = 5) {
         
         // Prepare command arguments safely
         $cmd = escapeshellarg($pythonPath) . " " . escapeshellarg($scriptPath) . " " . escapeshellarg($query) . " --top_k " . escapeshellarg(strval($topK));
+        if (basename($scriptPath) === 'semantic_search.py') {
+            // Keyword and semantic retrieval fused in one call
+            $cmd .= " --search_method hybrid";
+            if (!empty($filters)) {
+                // Year/jurisdiction/type/tag filters are applied inside the index, before ranking
+                $cmd .= " --filters " . escapeshellarg(json_encode($filters));
+            }
+        }
 
         // Log the command for debugging
         $logEntry = date('Y-m-d H:i:s') . " | Executing Python Command: " . $cmd . "\n";
@@ -256,6 +280,9 @@ try {
     
     // Optional: number of results to return
     $topK = isset($data['top_k']) ? (int)$data['top_k'] : 5;
+
+    // Optional: metadata filters (year, year_min, year_max, jurisdiction, type, tags)
+    $filters = isset($data['filters']) && is_array($data['filters']) ? $data['filters'] : null;
     
     // Log the search query for debugging
     $logFile = __DIR__ . '/logs/search.log';
@@ -272,7 +299,7 @@ try {
     // If database search returns no results, try Python script or fallback
     if (empty($results)) {
         // Try Python semantic search
-        $results = performPythonSearch($query, $topK);
+        $results = performPythonSearch($query, $topK, $filters);
         $searchMethod = 'python';
         
         // Final fallback to keyword search if Python also fails
@@ -1,17 +1,25 @@
 <?php
 // upload_case.php
-// Receives legal case content via POST, calls Python scripts for brief generation and tagging, and stores results in MySQL.
+// Receives legal case content via POST, tags it, stores it in MySQL and queues its brief for the
+// background brief worker (python/brief_worker.py --serve). Poll brief_status.php?job=<brief_job> for the brief.
+// Tagging, inline briefs and index updates go to the resident service (python/lexiaid_service.py) when it is running.
 
 header('Content-Type: application/json');
 
+require_once __DIR__ . '/config/lexiaid_service.php';
+
 // --- CONFIG ---
-$db_host = 'localhost';
-$db_user = 'root';
-$db_pass = '';
-$db_name = 'lexiaid';
+// Same variables and defaults as MYSQL_CONFIG in python/corpus_store.py, which the brief worker
+// uses to write finished briefs back to this row
+$db_host = getenv('DB_HOST') ?: 'localhost';
+$db_user = getenv('DB_USER') ?: 'root';
+$db_pass = getenv('DB_PASS') ?: '';
+$db_name = getenv('DB_NAME') ?: 'lexiaid';
 $python_dir = __DIR__ . '/../python/';
 $brief_script = escapeshellcmd($python_dir . 'brief_generator.py');
+$brief_worker_script = escapeshellcmd($python_dir . 'brief_worker.py');
 $tag_script = escapeshellcmd($python_dir . 'auto_tag.py');
+$search_script = escapeshellcmd($python_dir . 'semantic_search.py');
 $python_bin = escapeshellcmd(__DIR__ . '/../.venv/Scripts/python.exe');
 
 // --- INPUT ---
@@ -24,6 +32,12 @@ $content = $input['content'];
 $title = isset($input['title']) ? trim($input['title']) : '';
 
 // --- RUN PYTHON SCRIPTS ---
+// Asks the resident service first (endpoint '/tag' or '/brief'); runs the script only when it is not running.
+function run_nlp($endpoint, $script, $text) {
+    $result = lexiaid_service_request($endpoint, ['text' => $text], $endpoint === '/brief' ? 300 : 10);
+    return $result !== null ? $result : run_python($script, $text);
+}
+
 function run_python($script, $arg) {
     global $python_bin;
     $cmd = "$python_bin $script --text " . escapeshellarg($arg);
@@ -32,15 +46,58 @@ function run_python($script, $arg) {
     return json_decode($result, true);
 }
 
-$brief_result = run_python($brief_script, $content);
-$tag_result = run_python($tag_script, $content);
+// --- QUEUE BRIEF GENERATION ---
+// Hands the case to the brief worker's queue; returns the submit result (job_id, job_status and,
+// when the brief was already cached, the brief itself), or null if it could not be queued.
+function queue_brief($resource_id, $content) {
+    global $python_bin, $brief_worker_script;
+    $spec = [0 => ['pipe', 'r'], 1 => ['pipe', 'w'], 2 => ['pipe', 'w']];
+    $proc = proc_open("$python_bin $brief_worker_script --submit --resource_id " . intval($resource_id), $spec, $pipes);
+    if (!is_resource($proc)) {
+        return null;
+    }
+    fwrite($pipes[0], $content);
+    fclose($pipes[0]);
+    $output = stream_get_contents($pipes[1]);
+    fclose($pipes[1]);
+    fclose($pipes[2]);
+    proc_close($proc);
+    $result = json_decode($output, true);
+    return (isset($result['status']) && $result['status'] === 'ok') ? $result : null;
+}
+
+// --- UPDATE SEARCH INDEX ---
+// Sends the new case to the search engine's incremental update path, so it is
+// searchable without re-embedding the corpus. Best effort: the upload succeeds either way.
+function push_to_search_index($doc) {
+    global $python_bin, $search_script;
+    $update = ['op' => 'add', 'documents' => [$doc]];
+    $result = lexiaid_service_request('/documents', $update);
+    if ($result !== null) {
+        return isset($result['status']) && $result['status'] === 'success';
+    }
+    $spec = [0 => ['pipe', 'r'], 1 => ['pipe', 'w'], 2 => ['pipe', 'w']];
+    $proc = proc_open("$python_bin $search_script --update", $spec, $pipes);
+    if (!is_resource($proc)) {
+        return false;
+    }
+    fwrite($pipes[0], json_encode($update, JSON_UNESCAPED_UNICODE));
+    fclose($pipes[0]);
+    $output = stream_get_contents($pipes[1]);
+    fclose($pipes[1]);
+    fclose($pipes[2]);
+    proc_close($proc);
+    $result = json_decode($output, true);
+    return isset($result['status']) && $result['status'] === 'success';
+}
+
+$tag_result = run_nlp('/tag', $tag_script, $content);
 
-if ($brief_result['status'] !== 'ok' || $tag_result['status'] !== 'ok') {
-    echo json_encode(['status' => 'error', 'message' => 'NLP processing failed.', 'brief' => $brief_result, 'tags' => $tag_result]);
+if ($tag_result['status'] !== 'ok') {
+    echo json_encode(['status' => 'error', 'message' => 'NLP processing failed.', 'tags' => $tag_result]);
     exit;
 }
 
-$brief = $brief_result['brief'];
 $categories = $tag_result['categories'];
 $tags = $tag_result['tags'];
 
@@ -50,17 +107,62 @@ if ($conn->connect_error) {
     echo json_encode(['status' => 'error', 'message' => 'Database connection failed.']);
     exit;
 }
-$stmt = $conn->prepare("INSERT INTO legal_resources (title, content, summary, tags, category) VALUES (?, ?, ?, ?, ?)");
-$summary = json_encode($brief, JSON_UNESCAPED_UNICODE);
+// The summary is filled in by the brief worker once the brief is generated
+$stmt = $conn->prepare("INSERT INTO legal_resources (title, content, summary, tags, category) VALUES (?, ?, NULL, ?, ?)");
 $tags_str = implode(',', $tags);
 $category_str = implode(',', $categories);
-$stmt->bind_param('sssss', $title, $content, $summary, $tags_str, $category_str);
+$stmt->bind_param('ssss', $title, $content, $tags_str, $category_str);
 $ok = $stmt->execute();
+$resource_id = $ok ? $stmt->insert_id : null;
 $stmt->close();
+
+$brief = null;
+$brief_job = null;
+$brief_status = 'failed';
+if ($ok) {
+    $queued = queue_brief($resource_id, $content);
+    if ($queued !== null) {
+        $brief_job = $queued['job_id'];
+        $brief_status = $queued['job_status'];
+        // A re-uploaded case is answered from the result cache: store its brief now
+        $brief = isset($queued['brief']) ? $queued['brief'] : null;
+    } else {
+        // No queue available: generate the brief in this request as before (cached briefs skip the model load)
+        $brief_result = run_nlp('/brief', $brief_script, $content);
+        if (isset($brief_result['status']) && $brief_result['status'] === 'ok') {
+            $brief = $brief_result['brief'];
+            $brief_status = 'done';
+        }
+    }
+    if ($brief !== null) {
+        $summary = json_encode($brief, JSON_UNESCAPED_UNICODE);
+        $stmt = $conn->prepare("UPDATE legal_resources SET summary = ? WHERE resource_id = ?");
+        $stmt->bind_param('si', $summary, $resource_id);
+        $stmt->execute();
+        $stmt->close();
+    }
+}
 $conn->close();
 
 if ($ok) {
-    echo json_encode(['status' => 'ok', 'message' => 'Case uploaded and processed.', 'brief' => $brief, 'categories' => $categories, 'tags' => $tags]);
+    $indexed = push_to_search_index([
+        'resource_id' => $resource_id,
+        'title' => $title,
+        'content' => $content,
+        'tags' => $tags,
+        'categories' => $categories
+    ]);
+    echo json_encode([
+        'status' => 'ok',
+        'message' => $brief_status === 'queued' ? 'Case uploaded; brief queued.' : 'Case uploaded and processed.',
+        'resource_id' => $resource_id,
+        'brief' => $brief,
+        'brief_job' => $brief_job,
+        'brief_status' => $brief_status,
+        'categories' => $categories,
+        'tags' => $tags,
+        'search_indexed' => $indexed
+    ]);
 } else {
     echo json_encode(['status' => 'error', 'message' => 'Failed to save to database.']);
 }